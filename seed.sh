@@ -5,4 +5,10 @@ rm db.sqlite3
 python manage.py migrate
 python manage.py makemigrations whereithurtsapi
 python manage.py migrate whereithurtsapi
-python manage.py loaddata whereithurtsapi/fixtures/*.json
\ No newline at end of file
+python manage.py loaddata whereithurtsapi/fixtures/*.json
+python manage.py sync_hurt_summaries
+python manage.py rebuild_activity_log
+python manage.py rebuild_daily_rollups
+python manage.py rebuild_search_index
+python manage.py build_icon_variants
+python manage.py score_treatments
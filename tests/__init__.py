@@ -1,2 +1,19 @@
 from .healing_tests import HealingTests
-
+from .treatment_tests import TreatmentTests
+from .hurt_tests import HurtTests
+from .auth_tests import AuthTests
+from .patient_tests import PatientTests
+from .profile_tests import ProfileTests
+from .benchmark_tests import BenchmarkTests
+from .query_plan_tests import QueryPlanTests
+from .serializer_tests import SerializerTests
+from .etag_tests import ETagTests
+from .reference_tests import ReferenceTests
+from .icon_tests import IconTests
+from .batch_tests import BatchTests
+from .bulk_tests import BulkTests
+from .trend_tests import TrendTests
+from .effectiveness_tests import EffectivenessTests
+from .async_read_tests import AsyncReadTests
+from .sqlite_tests import SqliteTuningTests
+from .replica_tests import ReplicaTests
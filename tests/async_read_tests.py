@@ -0,0 +1,128 @@
+import asyncio
+import contextvars
+import json
+import threading
+import time
+from io import StringIO
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.conf import settings
+from django.db import connection
+from django.test import TransactionTestCase
+from rest_framework import status
+from whereithurtsapi.benchmark import async_read_routes, generate_data
+from whereithurtsapi.helpers import get_read_pool
+
+
+class AsyncReadTests(TransactionTestCase):
+    """ The async views read from the read pool's threads, which only see committed data """
+
+    def setUp(self):
+        self.data = generate_data(patients=2, hurts_per_patient=3, updates_per_hurt=3,
+                                  treatments_per_patient=3, healings_per_patient=4)
+        self.authorization = 'Token ' + self.data.token
+
+    def async_get(self, url, **headers):
+        return async_to_sync(self.async_client.get)(url, authorization=self.authorization, **headers)
+
+    def test_async_reads_match_the_viewsets(self):
+        for name, url, async_url in async_read_routes(self.data):
+            response = self.client.get(url, HTTP_AUTHORIZATION=self.authorization)
+            async_response = self.async_get(async_url)
+
+            self.assertEqual(async_response.status_code, status.HTTP_200_OK, name)
+            self.assertEqual(json.loads(async_response.content), json.loads(response.content), name)
+
+    def test_async_reads_answer_errors_like_the_viewsets(self):
+        hurt_url = f"/async/hurts/{self.data.hurt_id}"
+        unauthenticated = async_to_sync(self.async_client.get)(hurt_url)
+        self.assertEqual(unauthenticated.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(async_to_sync(self.async_client.get)(hurt_url, authorization='Token wrong').status_code,
+                         status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(async_to_sync(self.async_client.post)(hurt_url, authorization=self.authorization).status_code,
+                         status.HTTP_405_METHOD_NOT_ALLOWED)
+
+        for url in ("/async/hurts/9999", "/async/patients/9999", "/async/profiles/9999/snapshot"):
+            self.assertEqual(self.async_get(url).status_code, status.HTTP_404_NOT_FOUND, url)
+        for url in (f"/async/patients/{self.data.patient_id}?cursor=bad",
+                    f"/async/profiles/{self.data.patient_id}/snapshot?days=0"):
+            self.assertEqual(self.async_get(url).status_code, status.HTTP_400_BAD_REQUEST, url)
+
+        patient_url = f"/async/patients/{self.data.patient_id}"
+        etag = self.async_get(patient_url)['ETag']
+        self.assertEqual(self.async_get(patient_url, if_none_match=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def on_each_read_thread(self, func):
+        """ Run func once on every thread of the read pool """
+        workers = settings.ASYNC_READS['MAX_WORKERS']
+        # every task holds its thread until all of them have started, so no thread gets two
+        barrier = threading.Barrier(workers, timeout=5)
+
+        def run():
+            barrier.wait()
+            func()
+        for future in [get_read_pool().submit(run) for _ in range(workers)]:
+            future.result()
+
+    def test_independent_reads_overlap(self):
+        """ a hurt and its history are read on different pool threads at the same time """
+        reads = []
+
+        def slow_query(execute, sql, params, many, context):
+            start = time.perf_counter()
+            time.sleep(0.05)
+            result = execute(sql, params, many, context)
+            reads.append((threading.current_thread().name, start, time.perf_counter()))
+            return result
+
+        self.on_each_read_thread(lambda: connection.execute_wrappers.append(slow_query))
+        try:
+            self.assertEqual(self.async_get(f"/async/hurts/{self.data.hurt_id}").status_code, status.HTTP_200_OK)
+        finally:
+            self.on_each_read_thread(lambda: connection.execute_wrappers.remove(slow_query))
+
+        overlapping = {(first[0], second[0]) for first in reads for second in reads
+                       if first[0] != second[0] and first[1] < second[2] and second[1] < first[2]}
+        self.assertTrue(overlapping)
+
+    def test_concurrent_requests_overlap(self):
+        """ every middleware can run async, so requests to the async views don't wait for each
+        other on Django's single thread for sync code """
+        request_name = contextvars.ContextVar('request_name')
+        reads = []
+
+        def slow_query(execute, sql, params, many, context):
+            start = time.perf_counter()
+            time.sleep(0.05)
+            result = execute(sql, params, many, context)
+            reads.append((request_name.get(None), start, time.perf_counter()))
+            return result
+
+        async def get(name):
+            request_name.set(name)
+            return await self.async_client.get(f"/async/hurts/{self.data.hurt_id}", authorization=self.authorization)
+
+        async def get_both():
+            return await asyncio.gather(get("first"), get("second"))
+
+        self.on_each_read_thread(lambda: connection.execute_wrappers.append(slow_query))
+        try:
+            responses = async_to_sync(get_both)()
+        finally:
+            self.on_each_read_thread(lambda: connection.execute_wrappers.remove(slow_query))
+
+        self.assertEqual([response.status_code for response in responses], [status.HTTP_200_OK] * 2)
+        overlapping = [(first, second) for first in reads for second in reads
+                       if first[0] == "first" and second[0] == "second"
+                       and first[1] < second[2] and second[1] < first[2]]
+        self.assertTrue(overlapping)
+
+    def test_command_compares_and_deletes_synthetic_data(self):
+        out = StringIO()
+
+        call_command('benchmark_async', patients=2, hurts_per_patient=2, updates_per_hurt=2,
+                     treatments_per_patient=2, healings_per_patient=2, concurrency=2, rounds=1, stdout=out)
+
+        self.assertIn("/async/hurts/", out.getvalue())
+        self.assertEqual(User.objects.count(), 2)
@@ -0,0 +1,63 @@
+import json
+from rest_framework import status
+from rest_framework.test import APITestCase
+from whereithurtsapi.authentication import TokenCache, get_token_cache
+from whereithurtsapi.helpers import get_reference_registry
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth.models import User
+from rest_framework.authtoken.models import Token
+
+
+class AuthTests(APITestCase):
+    def setUp(self):
+        """ register a user, which caches their new token """
+        get_token_cache().clear()
+        data = {
+            "username": "authuser",
+            "password": "authuserpassword",
+            "firstname": "auth",
+            "lastname": "user",
+            "email": "auth@user.com",
+        }
+        response = self.client.post("/register", data, format='json')
+        self.token = json.loads(response.content)["token"]
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+
+    def test_registered_token_authenticates_without_queries(self):
+        # the bodypart list itself comes from the reference registry once it is loaded
+        get_reference_registry().data()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/bodyparts")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(queries), 0)
+
+    def test_login_warms_token_cache(self):
+        get_token_cache().clear()
+        self.client.post("/login", {"username": "authuser", "password": "authuserpassword"}, format='json')
+        self.assertIsNotNone(get_token_cache().get(self.token))
+
+    def test_deleted_token_is_no_longer_accepted(self):
+        Token.objects.get(key=self.token).delete()
+        response = self.client.get("/bodyparts")
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_is_no_longer_accepted(self):
+        user = User.objects.get(username="authuser")
+        user.is_active = False
+        user.save()
+        response = self.client.get("/bodyparts")
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(CACHES={'tokens': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                          'LOCATION': 'token-auth-tests'}})
+    def test_tokens_invalidated_by_one_worker_are_rejected_by_the_others(self):
+        token = Token.objects.select_related('user__patient').get(key=self.token)
+        first, second = TokenCache(300, 10, 'tokens'), TokenCache(300, 10, 'tokens')
+        first.set(token)
+        self.assertIsNotNone(second.get(self.token))
+
+        first.delete(self.token)
+
+        self.assertIsNone(second.get(self.token))
@@ -0,0 +1,102 @@
+import json
+from asgiref.sync import async_to_sync
+from rest_framework import status
+from rest_framework.test import APITestCase
+from whereithurtsapi.models import Bodypart, TreatmentType, Patient
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth.models import User
+from rest_framework.authtoken.models import Token
+
+
+class BatchTests(APITestCase):
+    def setUp(self):
+        """ create a patient with a token, a hurt and the lookup rows it needs """
+        user = User.objects.create_user(username="batchuser", password="batchpassword", first_name="batch")
+        self.token = Token.objects.create(user=user).key
+        self.patient = Patient.objects.create(user=user)
+        self.bodypart = Bodypart.objects.create(name="test part")
+        self.treatmenttype = TreatmentType.objects.create(name="test treat type")
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        self.client.post("/hurts", {
+            "name": "sore knee", "is_active": True, "bodypart_id": self.bodypart.id,
+            "treatment_ids": [], "pain_level": 6, "notes": "started hurting"
+        }, format='json')
+
+    def batch(self, *sub_requests):
+        response = self.client.post("/batch", {"requests": list(sub_requests)}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return json.loads(response.content)["responses"]
+
+    def test_batch_matches_separate_requests(self):
+        paths = [f"/patients/{self.patient.id}", f"/hurts?patient_id={self.patient.id}",
+                 f"/healings?patient_id={self.patient.id}", "/treatments?owner=1", "/bodyparts",
+                 "/treatmenttypes", f"/profiles/{self.patient.id}/snapshot"]
+
+        responses = self.batch(*({"path": path} for path in paths))
+
+        self.assertEqual([response["path"] for response in responses], paths)
+        for path, response in zip(paths, responses):
+            separate = self.client.get(path)
+            self.assertEqual(response["status"], separate.status_code, path)
+            self.assertEqual(response["body"], json.loads(separate.content), path)
+            if separate.has_header('ETag'):
+                self.assertEqual(response["headers"]["ETag"], separate['ETag'], path)
+
+    def test_batch_authenticates_once_and_shares_data_versions(self):
+        """ sub-requests don't look the token up again, and polls of the same patient read
+        its data version once """
+        self.client.get("/bodyparts")
+        with CaptureQueriesContext(connection) as queries:
+            self.batch({"path": f"/hurts?patient_id={self.patient.id}"},
+                       {"path": f"/healings?patient_id={self.patient.id}"},
+                       {"path": f"/patients/{self.patient.id}"})
+
+        self.assertFalse([query for query in queries if 'authtoken_token' in query['sql']])
+        self.assertEqual(len([query for query in queries if query['sql'].startswith(
+            'SELECT "whereithurtsapi_patient"."data_version" FROM')]), 1)
+
+    def test_sub_requests_can_be_conditional(self):
+        url = f"/hurts?patient_id={self.patient.id}"
+        etag = self.client.get(url)['ETag']
+
+        response, = self.batch({"path": url, "headers": {"If-None-Match": etag}})
+
+        self.assertEqual(response["status"], status.HTTP_304_NOT_MODIFIED)
+        self.assertIsNone(response["body"])
+        self.assertEqual(response["headers"]["ETag"], etag)
+
+    def test_failed_sub_requests_are_reported_in_their_own_entries(self):
+        responses = self.batch({"path": "/hurts/9999"}, {"path": "/hurts", "method": "POST"},
+                               {"path": "/login"}, {"path": "/batch"}, {"path": "/bodyparts"})
+
+        self.assertEqual([response["status"] for response in responses], [
+            status.HTTP_404_NOT_FOUND, status.HTTP_405_METHOD_NOT_ALLOWED, status.HTTP_404_NOT_FOUND,
+            status.HTTP_404_NOT_FOUND, status.HTTP_200_OK])
+
+    def test_batch_requires_authentication_and_a_list_of_requests(self):
+        response = self.client.post("/batch", {"requests": "/hurts"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.client.credentials()
+        response = self.client.post("/batch", {"requests": [{"path": "/hurts"}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_batch_served_under_asgi_builds_urls_like_separate_requests(self):
+        """ sub-requests of an ASGI request are ASGI requests too, so they know its scheme """
+        Bodypart.objects.create(name="imaged part", hurt_image="icons/bodyparts/hurts/knee.png")
+        authorization = 'Token ' + self.token
+        paths = ["/bodyparts", f"/hurts?patient_id={self.patient.id}"]
+
+        response = async_to_sync(self.async_client.post)(
+            "/batch", {"requests": [{"path": path} for path in paths]},
+            content_type='application/json', authorization=authorization)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        responses = json.loads(response.content)["responses"]
+        for path, response in zip(paths, responses):
+            separate = async_to_sync(self.async_client.get)(path, authorization=authorization)
+            self.assertEqual(response["status"], status.HTTP_200_OK, path)
+            self.assertEqual(response["body"], json.loads(separate.content), path)
+        self.assertTrue(any(bodypart["hurt_image"].startswith("http://testserver/")
+                            for bodypart in responses[0]["body"] if bodypart["hurt_image"]))
@@ -0,0 +1,27 @@
+from io import StringIO
+from django.core.management import call_command
+from django.contrib.auth.models import User
+from django.test import TestCase
+from whereithurtsapi.benchmark import generate_data, registered_routes, run_benchmark
+
+
+class BenchmarkTests(TestCase):
+    def test_every_route_runs_without_per_row_queries(self):
+        """ every registered route is requested, succeeds, and list routes cost the same
+        number of queries for a page of one as for a full page """
+        data = generate_data(patients=3, hurts_per_patient=6, updates_per_hurt=4,
+                             treatments_per_patient=6, healings_per_patient=10)
+
+        results, failures = run_benchmark(data, repeat=1, page_size=10)
+
+        self.assertEqual(failures, [])
+        self.assertEqual({result.name for result in results}, registered_routes())
+
+    def test_command_rolls_back_synthetic_data(self):
+        out = StringIO()
+
+        call_command('benchmark_api', patients=2, hurts_per_patient=2, updates_per_hurt=2,
+                     treatments_per_patient=2, healings_per_patient=2, repeat=1, page_size=3, stdout=out)
+
+        self.assertIn("/hurts?cursor=&page_size=3", out.getvalue())
+        self.assertFalse(User.objects.exists())
@@ -0,0 +1,159 @@
+import json
+from datetime import timedelta
+from rest_framework import status
+from rest_framework.test import APITestCase
+from whereithurtsapi.models import (Activity, Bodypart, DailyRollup, Healing, HealingTreatment, Hurt, HurtHealing,
+                                    Patient, Treatment, TreatmentType, Update)
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.contrib.auth.models import User
+from rest_framework.authtoken.models import Token
+
+
+class BulkTests(APITestCase):
+    def setUp(self):
+        """ create two patients with a hurt each, a private treatment of the second one and a public one """
+        self.tokens = {}
+        self.patients = {}
+        bodypart = Bodypart.objects.create(name="test part")
+        treatmenttype = TreatmentType.objects.create(name="test treat type")
+        for name in ("bulkuser", "otheruser"):
+            user = User.objects.create_user(username=name, password=f"{name}password", first_name=name)
+            self.tokens[name] = Token.objects.create(user=user).key
+            self.patients[name] = Patient.objects.create(user=user)
+        self.patient = self.patients["bulkuser"]
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.tokens["bulkuser"])
+
+        self.client.post("/hurts", {
+            "name": "sore knee", "is_active": True, "bodypart_id": bodypart.id,
+            "treatment_ids": [], "pain_level": 6, "notes": "started hurting"
+        }, format='json')
+        self.hurt = Hurt.objects.get(patient=self.patient)
+        # the hurt was added a day ago, so the check-ins logged since can be imported
+        day_ago = timezone.now() - timedelta(days=1)
+        Hurt.objects.filter(pk=self.hurt.pk).update(added_on=day_ago)
+        Update.objects.filter(hurt=self.hurt).update(added_on=day_ago)
+        self.other_hurt = Hurt.objects.create(patient=self.patients["otheruser"], bodypart=bodypart,
+                                              name="other", added_on=timezone.now())
+        self.public_treatment = Treatment.objects.create(
+            name="ice", notes="cold", public=True, added_by=self.patients["otheruser"], bodypart=bodypart,
+            treatmenttype=treatmenttype, added_on=timezone.now())
+        self.private_treatment = Treatment.objects.create(
+            name="secret", notes="hidden", public=False, added_by=self.patients["otheruser"], bodypart=bodypart,
+            treatmenttype=treatmenttype, added_on=timezone.now())
+
+    def check_in(self, pain_level, hours_ago, **fields):
+        added_on = (timezone.now() - timedelta(hours=hours_ago)).isoformat()
+        return {"hurt_id": self.hurt.id, "pain_level": pain_level, "notes": f"level {pain_level}",
+                "added_on": added_on, **fields}
+
+    def test_bulk_updates_are_created_with_summary_and_activity(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post("/updates/bulk", {"updates": [
+                self.check_in(5, 3), self.check_in(3, 2), self.check_in(2, 1)]}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        results = json.loads(response.content)["results"]
+        self.assertEqual([result["status"] for result in results], [201] * 3)
+        self.assertEqual([Update.objects.get(pk=result["id"]).pain_level for result in results], [5, 3, 2])
+        # one INSERT for the updates, however many there are
+        self.assertEqual(len([query for query in queries if query['sql'].startswith(
+            'INSERT INTO "whereithurtsapi_update"')]), 1)
+
+        self.hurt.refresh_from_db()
+        self.assertEqual(self.hurt.update_count, 4)
+        # the check-ins were logged after the hurt was added, and are ordered by when they were logged
+        self.assertEqual(self.hurt.first_pain_level, 6)
+        self.assertEqual(self.hurt.last_pain_level, 2)
+        self.assertEqual(Activity.objects.filter(activity_type='Update', patient=self.patient).count(), 3)
+
+    def test_replayed_updates_are_not_created_again(self):
+        body = {"updates": [self.check_in(5, 2, idempotency_key="first"), self.check_in(4, 1, idempotency_key="second")]}
+        created = json.loads(self.client.post("/updates/bulk", body, format='json').content)["results"]
+
+        response = self.client.post("/updates/bulk", body, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        replayed = json.loads(response.content)["results"]
+        self.assertEqual([result["id"] for result in replayed], [result["id"] for result in created])
+        self.assertEqual([result["status"] for result in replayed], [200, 200])
+        self.assertEqual(Update.objects.filter(hurt=self.hurt).count(), 3)
+
+    def test_one_invalid_update_creates_none(self):
+        response = self.client.post("/updates/bulk", {"updates": [
+            self.check_in(5, 2), self.check_in(4, 1, hurt_id=self.other_hurt.id), self.check_in("high", 1)]},
+            format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        results = json.loads(response.content)["results"]
+        self.assertEqual([result["status"] for result in results], [424, 400, 400])
+        self.assertEqual(Update.objects.filter(hurt=self.hurt).count(), 1)
+
+    def test_updates_before_the_first_one_are_rejected(self):
+        """ an earlier check-in would take the first update's place as what describes the hurt """
+        response = self.client.post("/updates/bulk", {"updates": [self.check_in(5, 2), self.check_in(4, 48)]},
+                                    format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        results = json.loads(response.content)["results"]
+        self.assertEqual([result["status"] for result in results], [424, status.HTTP_422_UNPROCESSABLE_ENTITY])
+        self.hurt.refresh_from_db()
+        self.assertEqual((self.hurt.update_count, self.hurt.first_pain_level), (1, 6))
+
+    def test_keys_reused_for_another_hurt_are_rejected(self):
+        """ keys are unique per hurt, so one sent for another hurt isn't a replay of the first """
+        second_hurt = Hurt.objects.create(patient=self.patient, bodypart=self.hurt.bodypart, name="sore elbow",
+                                          added_on=timezone.now() - timedelta(days=1))
+        self.client.post("/updates/bulk", {"updates": [self.check_in(5, 2, idempotency_key="shared")]}, format='json')
+
+        response = self.client.post("/updates/bulk", {"updates": [
+            self.check_in(4, 1, idempotency_key="shared", hurt_id=second_hurt.id)]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(json.loads(response.content)["results"][0]["status"], status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+        response = self.client.post("/updates/bulk", {"updates": [
+            self.check_in(4, 1, idempotency_key="twice"),
+            self.check_in(3, 1, idempotency_key="twice", hurt_id=second_hurt.id)]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual([result["status"] for result in json.loads(response.content)["results"]],
+                         [424, status.HTTP_422_UNPROCESSABLE_ENTITY])
+        self.assertFalse(Update.objects.filter(hurt=second_hurt).exists())
+
+    def test_bulk_healings_are_linked_and_rolled_up(self):
+        day_ago = (timezone.now() - timedelta(days=1)).isoformat()
+        response = self.client.post("/healings/bulk", {"healings": [
+            {"notes": "iced", "duration": 600, "intensity": 40, "treatment_ids": [self.public_treatment.id],
+             "hurt_ids": [self.hurt.id], "added_on": day_ago, "idempotency_key": "iced"},
+            {"notes": "rested", "duration": 300, "treatment_ids": [], "hurt_ids": [self.hurt.id]},
+        ]}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        first, second = json.loads(response.content)["results"]
+        self.assertEqual(first["idempotency_key"], "iced")
+        self.assertTrue(HealingTreatment.objects.filter(healing_id=first["id"], treatment=self.public_treatment).exists())
+        self.assertEqual(HurtHealing.objects.filter(hurt=self.hurt).count(), 2)
+        self.assertEqual(Healing.objects.get(pk=second["id"]).intensity, 0)
+        self.assertEqual(sum(DailyRollup.objects.filter(patient=self.patient).values_list('healing_seconds', flat=True)), 900)
+        self.assertEqual(Activity.objects.filter(activity_type='Healing', patient=self.patient).count(), 2)
+
+    def test_healings_can_only_use_public_or_own_treatments_and_own_hurts(self):
+        for treatment_ids, hurt_ids in (([self.private_treatment.id], []), ([], [self.other_hurt.id]), ([9999], [])):
+            response = self.client.post("/healings/bulk", {"healings": [
+                {"notes": "n", "duration": 60, "treatment_ids": treatment_ids, "hurt_ids": hurt_ids}]}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertEqual(json.loads(response.content)["results"][0]["status"], status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertFalse(Healing.objects.exists())
+
+    def test_bulk_writes_change_etags(self):
+        url = f"/hurts?patient_id={self.patient.id}"
+        etag = self.client.get(url)['ETag']
+
+        self.client.post("/updates/bulk", {"updates": [self.check_in(1, 1)]}, format='json')
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+
+    def test_malformed_bodies_are_rejected(self):
+        for body in ({}, {"updates": "not a list"}, {"updates": [1, 2]}):
+            response = self.client.post("/updates/bulk", body, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,93 @@
+import json
+from datetime import timedelta
+from io import StringIO
+from rest_framework import status
+from rest_framework.test import APITestCase
+from whereithurtsapi.models import (Bodypart, Healing, HealingTreatment, Hurt, HurtHealing, Patient, Treatment,
+                                    TreatmentScore, TreatmentType, Update)
+from whereithurtsapi.helpers import score_treatments
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.contrib.auth.models import User
+from rest_framework.authtoken.models import Token
+
+
+class EffectivenessTests(APITestCase):
+    def setUp(self):
+        """ create a patient with a token, three public treatments, and the lookup rows they need """
+        user = User.objects.create_user(username="scoreuser", password="scoreuserpassword", first_name="score")
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=user).key)
+        self.patient = Patient.objects.create(user=user)
+        self.bodypart = Bodypart.objects.create(name="test part")
+        treatmenttype = TreatmentType.objects.create(name="test treat type")
+        self.start = timezone.now() - timedelta(days=30)
+        self.treatments = {name: Treatment.objects.create(
+            name=name, added_by=self.patient, treatmenttype=treatmenttype, bodypart=self.bodypart,
+            added_on=self.start, notes="", public=True) for name in ("ice", "heat", "untried")}
+
+    def healing(self, treatment_name, pain_before, pain_after, duration=600, intensity=0, days_after=1):
+        """ a hurt at pain_before, healed with a treatment an hour later, at pain_after days_after that """
+        hurt = Hurt.objects.create(patient=self.patient, bodypart=self.bodypart, name="hurt", added_on=self.start)
+        healing = Healing.objects.create(patient=self.patient, notes="", duration=duration, intensity=intensity,
+                                         added_on=self.start + timedelta(hours=1))
+        Update.objects.create(hurt=hurt, notes="", pain_level=pain_before, added_on=self.start)
+        Update.objects.create(hurt=hurt, notes="", pain_level=pain_after,
+                              added_on=healing.added_on + timedelta(days=days_after))
+        HurtHealing.objects.create(hurt=hurt, healing=healing)
+        HealingTreatment.objects.create(healing=healing, treatment=self.treatments[treatment_name])
+
+    def test_scores_are_weighted_pain_drops(self):
+        # ten minutes at full intensity count twice as much as ten minutes at none
+        self.healing("ice", 8, 2, intensity=100)
+        self.healing("ice", 8, 5, intensity=0)
+        self.healing("heat", 5, 6)
+        # pain measured outside the window says nothing about the healing
+        self.healing("heat", 9, 1, days_after=10)
+
+        self.assertEqual(score_treatments(window_days=3), 2)
+
+        scores = {score.treatment.name: score for score in TreatmentScore.objects.select_related('treatment')}
+        self.assertEqual(scores["ice"].effectiveness, 5)
+        self.assertEqual(scores["ice"].samples, 2)
+        self.assertEqual(scores["heat"].effectiveness, -1)
+        self.assertEqual(scores["heat"].samples, 1)
+        self.assertNotIn("untried", scores)
+
+    def test_order_by_effectiveness_pages_through_unscored_treatments_last(self):
+        self.healing("ice", 8, 2)
+        self.healing("heat", 5, 4)
+        out = StringIO()
+        call_command('score_treatments', stdout=out)
+        self.assertIn("scored 2 treatments", out.getvalue())
+
+        for url in ("/treatments?order_by=effectiveness", "/treatments?owner=1&order_by=effectiveness"):
+            names = []
+            cursor = ""
+            while cursor is not None:
+                response = self.client.get(f"{url}&page_size=1&cursor={cursor}")
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                page = json.loads(response.content)
+                names += [(treatment["name"], treatment["effectiveness"]) for treatment in page["treatments"]]
+                cursor = page["next_cursor"]
+            self.assertEqual(names, [("ice", 6), ("heat", 1), ("untried", None)], url)
+
+        response = self.client.get("/treatments?order_by=effectiveness&direction=asc")
+        self.assertEqual([treatment["name"] for treatment in json.loads(response.content)["treatments"]],
+                         ["untried", "heat", "ice"])
+
+    def test_cached_effectiveness_ordering_reads_only_private_scores(self):
+        """ a repeat browse is served from the public treatment cache; only the requester's
+        private treatments are read, with their scores joined in """
+        self.healing("ice", 8, 2)
+        score_treatments()
+        self.client.get("/treatments?order_by=effectiveness")
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/treatments?order_by=effectiveness")
+
+        self.assertEqual(json.loads(response.content)["treatments"][0]["effectiveness"], 6)
+        score_queries = [query['sql'] for query in queries if 'whereithurtsapi_treatmentscore' in query['sql']]
+        self.assertEqual(len(score_queries), 1)
+        self.assertIn('NOT "whereithurtsapi_treatment"."public"', score_queries[0])
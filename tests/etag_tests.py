@@ -0,0 +1,119 @@
+import json
+from rest_framework import status
+from rest_framework.test import APITestCase
+from whereithurtsapi.models import Bodypart, TreatmentType, Patient
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth.models import User
+from rest_framework.authtoken.models import Token
+
+
+class ETagTests(APITestCase):
+    def setUp(self):
+        """ create two patients with tokens, and the lookup rows their hurts and treatments need """
+        self.tokens = {}
+        self.patients = {}
+        for name in ("etaguser", "otheruser"):
+            user = User.objects.create_user(username=name, password=f"{name}password", first_name=name)
+            self.tokens[name] = Token.objects.create(user=user).key
+            self.patients[name] = Patient.objects.create(user=user)
+        self.patient = self.patients["etaguser"]
+        self.bodypart = Bodypart.objects.create(name="test part")
+        self.treatmenttype = TreatmentType.objects.create(name="test treat type")
+        self.login("etaguser")
+
+    def login(self, name):
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.tokens[name])
+
+    def post_hurt(self):
+        response = self.client.post("/hurts", {
+            "name": "sore knee", "is_active": True, "bodypart_id": self.bodypart.id,
+            "treatment_ids": [], "pain_level": 6, "notes": "started hurting"
+        }, format='json')
+        return json.loads(response.content)["id"]
+
+    def post_treatment(self, hurt_ids=()):
+        response = self.client.post("/treatments", {
+            "name": "ice", "notes": "cold", "public": True, "treatmenttype_id": self.treatmenttype.id,
+            "bodypart_id": self.bodypart.id, "hurt_ids": list(hurt_ids), "treatment_links": []
+        }, format='json')
+        return json.loads(response.content)["id"]
+
+    def etag(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('Authorization', response['Vary'])
+        return response['ETag']
+
+    def test_matching_etag_is_answered_with_304_before_the_list_query(self):
+        """ a poll with the current ETag gets an empty 304 that never reads the hurts table """
+        self.post_hurt()
+        url = f"/hurts?patient_id={self.patient.id}"
+        etag = self.etag(url)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+        self.assertFalse([query for query in queries if 'whereithurtsapi_hurt' in query['sql']])
+
+    def test_every_polled_endpoint_answers_304(self):
+        self.post_hurt()
+        for url in (f"/hurts?patient_id={self.patient.id}", f"/healings?patient_id={self.patient.id}",
+                    f"/patients/{self.patient.id}", f"/profiles/{self.patient.id}/snapshot"):
+            etag = self.etag(url)
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED, url)
+
+    def test_etag_changes_with_own_writes_and_differs_between_requests(self):
+        hurt_id = self.post_hurt()
+        url = f"/hurts?patient_id={self.patient.id}"
+        etag = self.etag(url)
+
+        self.client.post("/updates", {"hurt_id": hurt_id, "pain_level": 4, "notes": "better"}, format='json')
+        after_update = self.etag(url)
+        self.assertNotEqual(after_update, etag)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+
+        # other query params and other requesters get their own tags for the same data
+        self.assertNotEqual(self.etag(url + "&is_active=true"), after_update)
+        self.login("otheruser")
+        self.assertNotEqual(self.etag("/hurts"), self.etag(f"/hurts?patient_id={self.patient.id}"))
+
+    def test_another_patients_treatment_on_a_hurt_changes_its_etag(self):
+        """ the hurts list embeds the treatments tagged on each hurt, whoever owns them """
+        hurt_id = self.post_hurt()
+        url = f"/hurts?patient_id={self.patient.id}"
+        etag = self.etag(url)
+
+        self.login("otheruser")
+        treatment_id = self.post_treatment()
+        self.client.post(f"/treatments/{treatment_id}/tag_hurt", {"hurt_id": hurt_id}, format='json')
+        self.login("etaguser")
+        tagged = self.etag(url)
+        self.assertNotEqual(tagged, etag)
+
+        # renaming the tagged treatment is a write to this patient's hurts too
+        self.login("otheruser")
+        self.client.put(f"/treatments/{treatment_id}", {
+            "name": "heat", "notes": "warm", "public": True, "treatmenttype_id": self.treatmenttype.id,
+            "bodypart_id": self.bodypart.id, "hurt_ids": [hurt_id], "treatment_links": []
+        }, format='json')
+        self.login("etaguser")
+        self.assertNotEqual(self.etag(url), tagged)
+
+    def test_user_edits_change_the_patient_etag(self):
+        url = f"/patients/{self.patient.id}"
+        etag = self.etag(url)
+
+        user = self.patient.user
+        user.first_name = "renamed"
+        user.save()
+
+        self.assertNotEqual(self.etag(url), etag)
+
+    def test_missing_patient_is_still_a_404(self):
+        response = self.client.get("/patients/9999", HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
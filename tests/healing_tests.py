@@ -4,6 +4,8 @@ from whereithurtsapi.models.Healing import Healing
 from rest_framework import status
 from rest_framework.test import APITestCase
 from whereithurtsapi.models import Treatment, Hurt, TreatmentType, Bodypart, Update, Patient, HealingTreatment, HurtHealing
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from django.contrib.auth.models import User
 from rest_framework.authtoken.models import Token
@@ -302,6 +304,49 @@ class HealingTests(APITestCase):
         self.assertEqual(len(json_response["hurts"]), 0)
         self.assertEqual(len(json_response["treatments"]), 0)
 
+    def test_update_healing_links_in_fixed_number_of_queries(self):
+        """ re-linking a healing to many treatments costs the same number of queries as linking one """
+        treatment_ids = [1]
+        for i in range(5):
+            treatment = Treatment()
+            treatment.name = f"extra treat {i}"
+            treatment.added_by_id = 1
+            treatment.treatmenttype_id = 1
+            treatment.bodypart_id = 1
+            treatment.added_on = timezone.now()
+            treatment.notes = "no notes"
+            treatment.save()
+            treatment_ids.append(treatment.id)
+
+        healing = Healing()
+        healing.patient_id = 1
+        healing.duration = 1000
+        healing.notes = "linked healing"
+        healing.added_on = timezone.now()
+        healing.save()
+
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.staff_token)
+        url = f"/healings/{healing.id}"
+
+        def put_treatments(ids):
+            data = {"duration": 1000, "notes": "linked healing", "treatment_ids": ids, "hurt_ids": [1]}
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.put(url, data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+            return len(queries)
+
+        # link one treatment first, then add five more in one request, then remove them again
+        put_treatments([1])
+        adding_queries = put_treatments(treatment_ids)
+        self.assertEqual(HealingTreatment.objects.filter(healing=healing).count(), 6)
+
+        removing_queries = put_treatments([1])
+        self.assertEqual(list(HealingTreatment.objects.filter(
+            healing=healing).values_list('treatment_id', flat=True)), [1])
+
+        self.assertEqual(adding_queries, removing_queries)
+        self.assertEqual(put_treatments([1]) + 1, adding_queries)
+
 
 # To do:
 # -- delete single Healing (check for 404)
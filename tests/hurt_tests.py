@@ -0,0 +1,185 @@
+import json
+from io import StringIO
+from rest_framework import status
+from rest_framework.test import APITestCase
+from whereithurtsapi.models import Hurt, Bodypart, Update, Patient, Healing, HurtHealing
+from whereithurtsapi.helpers.streaming import iterate_in_chunks
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.contrib.auth.models import User
+from rest_framework.authtoken.models import Token
+
+
+class HurtTests(APITestCase):
+    def setUp(self):
+        """ create a patient with a token and a bodypart to hurt """
+        user = User.objects.create_user(
+            username="hurtuser",
+            email="hurt@user.com",
+            password="hurtuserpassword",
+            first_name="hurt",
+            last_name="user"
+        )
+        self.token = Token.objects.create(user=user).key
+        self.patient = Patient.objects.create(user=user)
+        self.bodypart = Bodypart.objects.create(name="test part")
+
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+
+    def create_hurt(self):
+        """ POST a new hurt with a first pain level of 6 """
+        data = {
+            "name": "sore knee",
+            "is_active": True,
+            "bodypart_id": self.bodypart.id,
+            "treatment_ids": [],
+            "pain_level": 6,
+            "notes": "started hurting"
+        }
+        response = self.client.post("/hurts", data, format='json')
+        return json.loads(response.content)
+
+    def test_create_hurt_stores_first_update_summary(self):
+        json_response = self.create_hurt()
+
+        hurt = Hurt.objects.get(pk=json_response["id"])
+        self.assertEqual(hurt.update_count, 1)
+        self.assertEqual(json_response["first_update_id"], hurt.first_update_id)
+        self.assertEqual(json_response["notes"], "started hurting")
+        self.assertEqual(json_response["pain_level"], 6)
+        self.assertEqual(json_response["latest_pain_level"], 6)
+
+    def test_update_writes_keep_hurt_summary_in_sync(self):
+        """ adding, editing and deleting updates moves the latest values but not the first ones """
+        hurt_id = self.create_hurt()["id"]
+
+        response = self.client.post(
+            "/updates", {"hurt_id": hurt_id, "pain_level": 3, "notes": "better"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        update_id = json.loads(response.content)["id"]
+
+        hurt = Hurt.objects.get(pk=hurt_id)
+        self.assertEqual(hurt.update_count, 2)
+        self.assertEqual(hurt.latest_update_id, update_id)
+        self.assertEqual(hurt.pain_level, 6)
+        self.assertEqual(hurt.latest_pain_level, 3)
+
+        self.client.put(f"/updates/{update_id}",
+                        {"hurt_id": hurt_id, "pain_level": 2, "notes": "even better"}, format='json')
+        self.assertEqual(Hurt.objects.get(pk=hurt_id).latest_pain_level, 2)
+
+        self.client.delete(f"/updates/{update_id}")
+        hurt = Hurt.objects.get(pk=hurt_id)
+        self.assertEqual(hurt.update_count, 1)
+        self.assertEqual(hurt.latest_pain_level, 6)
+        self.assertEqual(hurt.last_update, hurt.first_update.added_on)
+
+    def test_hurt_summary_fields_serialize_without_queries(self):
+        self.create_hurt()
+        hurt = Hurt.objects.get()
+
+        with CaptureQueriesContext(connection) as queries:
+            data = {field: getattr(hurt, field) for field in (
+                'notes', 'pain_level', 'latest_pain_level', 'last_update', 'first_update_id')}
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(data["pain_level"], 6)
+
+    def test_sync_hurt_summaries_command_backfills_and_verifies(self):
+        """ an update written outside the API leaves the summary stale until the command runs """
+        hurt_id = self.create_hurt()["id"]
+        Update.objects.create(hurt_id=hurt_id, pain_level=1,
+                              notes="logged elsewhere", added_on=timezone.now())
+
+        with self.assertRaises(CommandError):
+            call_command('sync_hurt_summaries', verify=True, stdout=StringIO())
+
+        call_command('sync_hurt_summaries', stdout=StringIO())
+        call_command('sync_hurt_summaries', verify=True, stdout=StringIO())
+        self.assertEqual(Hurt.objects.get(pk=hurt_id).latest_pain_level, 1)
+
+    def test_list_hurts_flags_only_the_requesting_patients_hurts_as_owned(self):
+        self.create_hurt()
+
+        other_user = User.objects.create_user(username="otheruser", password="otheruserpassword")
+        other_patient = Patient.objects.create(user=other_user)
+        Hurt.objects.create(name="other hurt", patient=other_patient,
+                            bodypart=self.bodypart, added_on=timezone.now())
+
+        response = self.client.get("/hurts?order_by=added_on-asc")
+        json_response = json.loads(response.content)
+
+        self.assertEqual([hurt["owner"] for hurt in json_response], [True, False])
+
+    def test_hurt_history_pages_match_retrieved_history(self):
+        """ paging through /hurts/<id>/history and streaming it both give the same timeline
+        as the history embedded on the retrieved hurt
+        """
+        hurt_id = self.create_hurt()["id"]
+        for pain_level in (5, 4, 3):
+            self.client.post(
+                "/updates", {"hurt_id": hurt_id, "pain_level": pain_level, "notes": "checking in"}, format='json')
+        healing = Healing.objects.create(
+            patient=self.patient, notes="stretching", duration=600, added_on=timezone.now())
+        HurtHealing.objects.create(hurt_id=hurt_id, healing=healing)
+
+        history = json.loads(self.client.get(f"/hurts/{hurt_id}?order_history=oldest").content)["history"]
+        self.assertEqual([entry["history_type"] for entry in history],
+                         ["Created on", "Update", "Update", "Update", "Healing"])
+        self.assertEqual(history[0]["pain_level"], 6)
+        self.assertTrue(history[0]["is_first_update"])
+
+        paged = []
+        json_response = json.loads(self.client.get(
+            f"/hurts/{hurt_id}/history?order_history=oldest&cursor=&page_size=2").content)
+        paged += json_response["history"]
+        while json_response["next_cursor"] is not None:
+            json_response = json.loads(self.client.get(
+                f"/hurts/{hurt_id}/history?order_history=oldest&page_size=2&cursor={json_response['next_cursor']}").content)
+            paged += json_response["history"]
+        self.assertEqual(paged, history)
+
+        response = self.client.get(f"/hurts/{hurt_id}/history")
+        streamed = json.loads(b"".join(response.streaming_content))
+        self.assertEqual(streamed, list(reversed(history)))
+
+    def test_streamed_lists_match_the_built_lists(self):
+        """ ?stream=1 streams the same hurts and updates the regular lists return """
+        for _ in range(3):
+            hurt_id = self.create_hurt()["id"]
+            self.client.post("/updates", {"hurt_id": hurt_id, "pain_level": 2, "notes": "better"}, format='json')
+
+        for url in ("/hurts", "/updates"):
+            built = self.client.get(url)
+            streamed = self.client.get(f"{url}?stream=1")
+
+            self.assertTrue(streamed.streaming)
+            self.assertEqual(b''.join(streamed.streaming_content), built.content)
+
+    def test_streamed_hurt_list_query_count_does_not_grow_with_rows(self):
+        """ streamed hurts are prefetched a chunk at a time, so more hurts cost no more queries """
+        self.create_hurt()
+        self.client.get("/hurts?stream=1")
+
+        with CaptureQueriesContext(connection) as one_hurt:
+            b''.join(self.client.get("/hurts?stream=1").streaming_content)
+        for _ in range(4):
+            self.create_hurt()
+        with CaptureQueriesContext(connection) as five_hurts:
+            b''.join(self.client.get("/hurts?stream=1").streaming_content)
+
+        self.assertEqual(len(one_hurt), len(five_hurts))
+
+    def test_iterate_in_chunks_runs_prefetches_once_per_chunk(self):
+        for _ in range(5):
+            self.create_hurt()
+
+        with CaptureQueriesContext(connection) as queries:
+            hurts = list(iterate_in_chunks(Hurt.objects.prefetch_related('update_set'), chunk_size=2))
+            updates = [update for hurt in hurts for update in hurt.update_set.all()]
+
+        self.assertEqual(len(updates), 5)
+        # one query for the hurts, then one update_set prefetch for each of the three chunks
+        self.assertEqual(len(queries), 4)
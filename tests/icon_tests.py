@@ -0,0 +1,80 @@
+import json
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from PIL import Image
+from rest_framework import status
+from rest_framework.test import APITestCase
+from whereithurtsapi.models import Bodypart, TreatmentType, Patient
+from django.conf import settings
+from django.core.management import call_command
+from django.test import override_settings
+from django.contrib.auth.models import User
+from rest_framework.authtoken.models import Token
+
+
+class IconTests(APITestCase):
+    def setUp(self):
+        """ copy an icon into a media directory of its own, and point a bodypart at it """
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        self.icon = 'icons/bodyparts/hurts/knee.png'
+        os.makedirs(os.path.join(self.media_root, os.path.dirname(self.icon)))
+        shutil.copy(os.path.join(settings.BASE_DIR, 'media', self.icon), os.path.join(self.media_root, self.icon))
+
+        user = User.objects.create_user(username="iconuser", password="iconuserpassword")
+        Patient.objects.create(user=user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=user).key)
+        self.bodypart = Bodypart.objects.create(name="knee", hurt_image=self.icon)
+        TreatmentType.objects.create(name="stretch")
+
+    def build(self):
+        call_command('build_icon_variants', stdout=StringIO())
+        with open(os.path.join(self.media_root, 'icons/variants/manifest.json')) as manifest:
+            return json.load(manifest)
+
+    def test_variants_are_resized_and_named_by_content(self):
+        variants = self.build()[self.icon]['variants']
+
+        self.assertEqual(sorted(variants, key=int), ['32', '64', '128'])
+        for size, formats in variants.items():
+            self.assertEqual(sorted(formats), ['png', 'webp'])
+            for extension, name in formats.items():
+                with open(os.path.join(self.media_root, name), 'rb') as variant:
+                    image = Image.open(BytesIO(variant.read()))
+                    self.assertEqual(image.size, (int(size), int(size)))
+                    self.assertEqual(image.format.lower(), extension)
+                    self.assertTrue(name.startswith(f'icons/variants/knee.{size}.'))
+
+    def test_rebuilding_keeps_unchanged_icons_and_replaces_changed_ones(self):
+        first = self.build()[self.icon]
+        self.assertEqual(self.build()[self.icon], first)
+
+        Image.new('RGBA', (200, 200), (255, 0, 0, 255)).save(os.path.join(self.media_root, self.icon))
+        second = self.build()[self.icon]
+
+        self.assertNotEqual(second['variants']['64']['png'], first['variants']['64']['png'])
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, first['variants']['64']['png'])))
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, second['variants']['64']['png'])))
+
+    def test_lookup_lists_expose_variant_urls_served_with_immutable_caching(self):
+        etag = self.client.get("/bodyparts")['ETag']
+        self.build()
+
+        response = self.client.get("/bodyparts", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        bodypart = json.loads(response.content)[0]
+        self.assertIsNone(bodypart["treatment_image_variants"])
+        url = bodypart["hurt_image_variants"]["32"]["webp"]
+        self.assertTrue(url.startswith("http://testserver/media/icons/variants/knee.32."))
+        self.assertIsNone(json.loads(self.client.get("/treatmenttypes").content)[0]["image_variants"])
+
+        response = self.client.get(url.replace("http://testserver", ""))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('max-age=31536000', response['Cache-Control'])
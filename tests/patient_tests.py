@@ -0,0 +1,90 @@
+import json
+from io import StringIO
+from rest_framework import status
+from rest_framework.test import APITestCase
+from whereithurtsapi.models import Bodypart, TreatmentType, Patient, Activity
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth.models import User
+from rest_framework.authtoken.models import Token
+
+
+class PatientTests(APITestCase):
+    def setUp(self):
+        """ create a patient with a token, and the lookup rows their hurts and treatments need """
+        user = User.objects.create_user(
+            username="patientuser",
+            email="patient@user.com",
+            password="patientuserpassword",
+            first_name="patient",
+            last_name="user"
+        )
+        self.token = Token.objects.create(user=user).key
+        self.patient = Patient.objects.create(user=user)
+        self.bodypart = Bodypart.objects.create(name="test part")
+        self.treatmenttype = TreatmentType.objects.create(name="test treat type")
+
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+
+    def add_activity(self):
+        """ POST a hurt, an update for it, a treatment and a healing, in that order """
+        hurt = json.loads(self.client.post("/hurts", {
+            "name": "sore knee", "is_active": True, "bodypart_id": self.bodypart.id,
+            "treatment_ids": [], "pain_level": 6, "notes": "started hurting"
+        }, format='json').content)
+        self.client.post("/updates", {"hurt_id": hurt["id"], "pain_level": 4, "notes": "better"}, format='json')
+        treatment = json.loads(self.client.post("/treatments", {
+            "name": "ice", "notes": "cold", "public": False, "treatmenttype_id": self.treatmenttype.id,
+            "bodypart_id": self.bodypart.id, "hurt_ids": [hurt["id"]], "treatment_links": []
+        }, format='json').content)
+        self.client.post("/healings", {
+            "duration": 600, "notes": "iced it", "treatment_ids": [treatment["id"]], "hurt_ids": [hurt["id"]]
+        }, format='json')
+
+    def get_recent_activity(self, query=""):
+        response = self.client.get(f"/patients/{self.patient.id}{query}")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return json.loads(response.content)
+
+    def test_recent_activity_is_newest_first(self):
+        self.add_activity()
+
+        json_response = self.get_recent_activity()
+
+        self.assertEqual(json_response["full_name"], "patient user")
+        self.assertEqual([entry["activity_type"] for entry in json_response["recent_activity"]],
+                         ["Healing", "Treatment", "Update", "Hurt"])
+        self.assertEqual(json_response["recent_activity"][3]["pain_level"], 6)
+
+    def test_recent_activity_limit_and_cursor(self):
+        self.add_activity()
+        self.add_activity()
+
+        json_response = self.get_recent_activity("?limit=3&cursor=")
+        self.assertEqual(len(json_response["recent_activity"]), 3)
+
+        json_response = self.get_recent_activity(f"?limit=10&cursor={json_response['next_cursor']}")
+        self.assertEqual(len(json_response["recent_activity"]), 5)
+        self.assertIsNone(json_response["next_cursor"])
+
+    def test_recent_activity_query_count_does_not_grow_with_history(self):
+        self.add_activity()
+        with CaptureQueriesContext(connection) as short_history:
+            self.get_recent_activity()
+
+        for _ in range(3):
+            self.add_activity()
+        with CaptureQueriesContext(connection) as long_history:
+            self.get_recent_activity()
+
+        self.assertEqual(len(short_history), len(long_history))
+
+    def test_rebuild_activity_log_matches_logged_activity(self):
+        self.add_activity()
+        logged = self.get_recent_activity()["recent_activity"]
+
+        Activity.objects.all().delete()
+        call_command('rebuild_activity_log', stdout=StringIO())
+
+        self.assertEqual(self.get_recent_activity()["recent_activity"], logged)
@@ -0,0 +1,80 @@
+import json
+from datetime import timedelta
+from io import StringIO
+from rest_framework import status
+from rest_framework.test import APITestCase
+from whereithurtsapi.models import Bodypart, TreatmentType, Treatment, Hurt, Patient, Healing, DailyRollup
+from django.core.management import call_command
+from django.utils import timezone
+from django.contrib.auth.models import User
+from rest_framework.authtoken.models import Token
+
+
+class ProfileTests(APITestCase):
+    def setUp(self):
+        """ create a patient with a token, a treatment and a hurt to tag healings with """
+        user = User.objects.create_user(
+            username="profileuser",
+            email="profile@user.com",
+            password="profileuserpassword",
+            first_name="profile",
+            last_name="user"
+        )
+        self.token = Token.objects.create(user=user).key
+        self.patient = Patient.objects.create(user=user)
+        bodypart = Bodypart.objects.create(name="test part")
+        treatmenttype = TreatmentType.objects.create(name="test treat type")
+
+        self.treatment = Treatment.objects.create(
+            name="ice", notes="cold", added_by=self.patient, bodypart=bodypart,
+            treatmenttype=treatmenttype, added_on=timezone.now())
+        self.hurt = Hurt.objects.create(
+            name="sore knee", patient=self.patient, bodypart=bodypart, added_on=timezone.now())
+
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+
+    def post_healing(self, duration):
+        response = self.client.post("/healings", {
+            "duration": duration, "notes": "iced it",
+            "treatment_ids": [self.treatment.id], "hurt_ids": [self.hurt.id]
+        }, format='json')
+        return json.loads(response.content)["id"]
+
+    def get_snapshot(self, query=""):
+        response = self.client.get(f"/profiles/{self.patient.id}/snapshot{query}")
+        return response, json.loads(response.content)
+
+    def test_snapshot_reads_healing_writes_from_rollups(self):
+        first_healing_id = self.post_healing(600)
+        self.post_healing(300)
+
+        _, snapshot = self.get_snapshot()
+        self.assertEqual(snapshot["recent_healing_time"], "0:15:00")
+        self.assertEqual(snapshot["recent_healing_count"], 2)
+        self.assertEqual([treatment["id"] for treatment in snapshot["recent_treatments"]], [self.treatment.id])
+        self.assertEqual([hurt["id"] for hurt in snapshot["recent_hurts"]], [self.hurt.id])
+
+        self.client.put(f"/healings/{first_healing_id}", {
+            "duration": 60, "notes": "short", "treatment_ids": [], "hurt_ids": []
+        }, format='json')
+        self.client.delete(f"/healings/{first_healing_id}")
+
+        _, snapshot = self.get_snapshot()
+        self.assertEqual(snapshot["recent_healing_time"], "0:05:00")
+        self.assertEqual(snapshot["recent_healing_count"], 1)
+
+    def test_snapshot_days_window(self):
+        old_healing = Healing.objects.create(
+            patient=self.patient, notes="long ago", duration=100, added_on=timezone.now() - timedelta(days=20))
+        call_command('rebuild_daily_rollups', stdout=StringIO())
+        self.assertEqual(DailyRollup.objects.get().healing_seconds, 100)
+
+        _, snapshot = self.get_snapshot()
+        self.assertEqual(snapshot["recent_healing_time"], "0")
+
+        _, snapshot = self.get_snapshot("?days=30")
+        self.assertEqual(snapshot["recent_healing_time"], "0:01:40")
+        self.assertEqual([healing["id"] for healing in snapshot["recent_healings"]], [old_healing.id])
+
+        response, _ = self.get_snapshot("?days=0")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,59 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from whereithurtsapi.benchmark import generate_data
+from whereithurtsapi.helpers import get_reference_registry
+
+
+class QueryPlanTests(TestCase):
+    def setUp(self):
+        """ fill the database with a synthetic data set and authenticate as its staff patient """
+        self.data = generate_data(patients=3)
+        self.client.defaults['HTTP_AUTHORIZATION'] = 'Token ' + self.data.token
+        # the lookup tables are read whole, once per process, into the reference registry
+        get_reference_registry().data()
+
+    def query_plans(self, url):
+        """ GET a list endpoint, then run EXPLAIN QUERY PLAN on every SELECT it made and
+        return the detail line of each step of the plans """
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        steps = []
+        with connection.cursor() as cursor:
+            for query in queries.captured_queries:
+                if query['sql'].startswith('SELECT'):
+                    cursor.execute("EXPLAIN QUERY PLAN " + query['sql'])
+                    steps += [row[-1] for row in cursor.fetchall()]
+        return steps
+
+    def assertUsesIndexes(self, url, *index_names):
+        """ the endpoint reads every app table through an index, including each of index_names """
+        steps = self.query_plans(url)
+
+        full_scans = [step for step in steps if step.startswith('SCAN whereithurtsapi_')]
+        self.assertEqual(full_scans, [], url)
+        for index_name in index_names:
+            self.assertTrue(any(f"INDEX {index_name} " in step for step in steps), f"{url} doesn't use {index_name}")
+
+    def test_hurt_list_plans(self):
+        self.assertUsesIndexes(f"/hurts?patient_id={self.data.patient_id}&show_inactive=false",
+                               'hurt_patient_is_active', 'update_hurt_added_on')
+
+    def test_update_list_plans(self):
+        self.assertUsesIndexes(f"/updates?hurt_id={self.data.hurt_id}&order_by=added_on-asc",
+                               'update_hurt_added_on')
+
+    def test_healing_list_plans(self):
+        self.assertUsesIndexes(f"/healings?patient_id={self.data.patient_id}",
+                               'healing_patient_added_on', 'hurthealing_healing_hurt')
+
+    def test_treatment_list_plans(self):
+        self.assertUsesIndexes("/treatments?owner=1",
+                               'treatment_added_by_public', 'healingtreatment_treatment',
+                               'hurttreatment_treatment_hurt')
+        self.assertUsesIndexes(
+            f"/treatments?bodypart_id={self.data.bodypart_id}&treatmenttype_id={self.data.treatmenttype_id}",
+            'treatment_bodypart_type')
+        self.assertUsesIndexes("/treatments?q=treat", 'treatmentsearchterm_term')
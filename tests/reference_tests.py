@@ -0,0 +1,86 @@
+import json
+from rest_framework import status
+from rest_framework.test import APITestCase
+from whereithurtsapi.helpers import get_reference_registry
+from whereithurtsapi.models import Bodypart, TreatmentType, Patient
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth.models import User
+from rest_framework.authtoken.models import Token
+
+
+class ReferenceTests(APITestCase):
+    def setUp(self):
+        """ create a patient with a token, and a bodypart and treatment type """
+        user = User.objects.create_user(username="referenceuser", password="referenceuserpassword")
+        Token.objects.create(user=user)
+        self.patient = Patient.objects.create(user=user)
+        self.bodypart = Bodypart.objects.create(name="knee")
+        self.treatmenttype = TreatmentType.objects.create(name="stretch")
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + user.auth_token.key)
+
+    def test_lookup_lists_are_served_from_the_registry_with_cache_headers(self):
+        # the first request loads the registry and caches the token
+        self.client.get("/bodyparts")
+        for url, name in (("/bodyparts", "knee"), ("/treatmenttypes", "stretch")):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(len(queries), 0)
+            self.assertEqual([row["name"] for row in json.loads(response.content)], [name])
+            self.assertIn('public', response['Cache-Control'])
+            self.assertIn('max-age=86400', response['Cache-Control'])
+
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertIn('max-age=86400', response['Cache-Control'])
+
+    def test_admin_edits_reload_the_registry(self):
+        etag = self.client.get("/bodyparts")['ETag']
+        self.client.post("/hurts", {
+            "name": "sore knee", "is_active": True, "bodypart_id": self.bodypart.id,
+            "treatment_ids": [], "pain_level": 6, "notes": "started hurting"
+        }, format='json')
+
+        self.bodypart.name = "left knee"
+        self.bodypart.save()
+
+        response = self.client.get("/bodyparts", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(response.content)[0]["name"], "left knee")
+        hurts = json.loads(self.client.get("/hurts").content)
+        self.assertEqual(hurts[0]["bodypart"]["name"], "left knee")
+
+    def test_embedded_bodyparts_and_types_are_not_joined(self):
+        self.client.post("/treatments", {
+            "name": "ice", "notes": "cold", "public": True, "treatmenttype_id": self.treatmenttype.id,
+            "bodypart_id": self.bodypart.id, "hurt_ids": [], "treatment_links": []
+        }, format='json')
+        get_reference_registry().data()
+
+        with CaptureQueriesContext(connection) as queries:
+            treatments = json.loads(self.client.get(f"/treatments?patient_id={self.patient.id}").content)
+        self.assertEqual(treatments["treatments"][0]["bodypart"],
+                         {"id": self.bodypart.id, "name": "knee", "hurt_image": None, "treatment_image": None})
+        self.assertEqual(treatments["treatments"][0]["treatmenttype"]["name"], "stretch")
+        self.assertFalse([q for q in queries if 'whereithurtsapi_bodypart' in q['sql']
+                          or 'whereithurtsapi_treatmenttype' in q['sql']])
+
+    def test_missing_ids_reload_at_most_once_per_generation(self):
+        registry = get_reference_registry()
+        registry.data()
+        missing = self.bodypart.id + 1000
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertIsNone(registry.get(Bodypart, missing))
+        self.assertEqual(len(queries), 2)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertIsNone(registry.get(Bodypart, missing))
+            self.assertIsNone(registry.get(TreatmentType, missing))
+        self.assertEqual(len(queries), 0)
+
+        # an edit moves the generation on, so the next miss may load again
+        self.bodypart.save()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertIsNone(registry.get(Bodypart, missing))
+        self.assertEqual(len(queries), 2)
@@ -0,0 +1,141 @@
+import json
+import os
+import tempfile
+from unittest import mock
+from django.contrib.auth.models import User
+from django.db import connections
+from django.test import TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from whereithurtsapi.helpers import get_replica_pins, replicate_sqlite
+from whereithurtsapi.helpers.replicas import ReplicaPins, handling_request
+from whereithurtsapi.models import Bodypart, Hurt, Patient
+from whereithurtsapi.routers import ReadReplicaRouter
+
+
+class ReplicaTests(TransactionTestCase):
+    """ Reads routed to a second SQLite file, which only changes when replicate_sqlite copies the primary into it """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        connections.databases['replica'] = {'ENGINE': 'django.db.backends.sqlite3',
+                                            'NAME': os.path.join(directory.name, 'replica.sqlite3')}
+        self.addCleanup(self.remove_replica)
+        replicas = override_settings(READ_REPLICAS={'ALIASES': ['replica'], 'PIN_SECONDS': 60})
+        replicas.enable()
+        self.addCleanup(replicas.disable)
+        self.addCleanup(get_replica_pins().clear)
+
+        self.clients = {}
+        self.patients = {}
+        for name in ("writer", "reader"):
+            user = User.objects.create_user(username=name, password=f"{name}password", first_name=name)
+            self.patients[name] = Patient.objects.create(user=user)
+            self.clients[name] = APIClient()
+            self.clients[name].credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=user).key)
+        self.bodypart = Bodypart.objects.create(name="test part")
+        replicate_sqlite()
+
+    def remove_replica(self):
+        connections['replica'].close()
+        del connections['replica']
+        del connections.databases['replica']
+
+    def hurt_names(self, client_name):
+        response = self.clients[client_name].get(f"/hurts?patient_id={self.patients['writer'].id}")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [hurt["name"] for hurt in json.loads(response.content)]
+
+    def add_hurt(self):
+        """ add a hurt through the API as the writer """
+        response = self.clients["writer"].post("/hurts", {
+            "name": "sore knee", "is_active": True, "bodypart_id": self.bodypart.id,
+            "treatment_ids": [], "pain_level": 6, "notes": "started hurting"
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return json.loads(response.content)["id"]
+
+    def test_read_actions_are_served_by_the_replica(self):
+        hurt = Hurt.objects.create(patient=self.patients["writer"], bodypart=self.bodypart, name="unreplicated",
+                                   added_on=timezone.now())
+
+        self.assertEqual(self.hurt_names("reader"), [])
+        self.assertEqual(self.clients["reader"].get(f"/hurts/{hurt.id}").status_code, status.HTTP_404_NOT_FOUND)
+
+        replicate_sqlite()
+
+        self.assertEqual(self.hurt_names("reader"), ["unreplicated"])
+        self.assertEqual(self.clients["reader"].get(f"/hurts/{hurt.id}").status_code, status.HTTP_200_OK)
+
+    def test_writers_read_their_writes_from_the_primary(self):
+        hurt_id = self.add_hurt()
+
+        self.assertEqual(self.hurt_names("writer"), ["sore knee"])
+        self.assertEqual(self.clients["writer"].get(f"/hurts/{hurt_id}").status_code, status.HTTP_200_OK)
+        # everyone else reads the replica until it catches up
+        self.assertEqual(self.hurt_names("reader"), [])
+
+    def test_batched_reads_are_routed_like_separate_requests(self):
+        Hurt.objects.create(patient=self.patients["writer"], bodypart=self.bodypart, name="unreplicated",
+                            added_on=timezone.now())
+        self.add_hurt()
+        path = f"/hurts?patient_id={self.patients['writer'].id}"
+
+        def batched_names(client_name):
+            response = self.clients[client_name].post("/batch", {"requests": [{"path": path}]}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return [hurt["name"] for hurt in json.loads(response.content)["responses"][0]["body"]]
+
+        self.assertEqual(batched_names("reader"), [])
+        # the writer is pinned to the primary, where both hurts are
+        self.assertEqual(sorted(batched_names("writer")), ["sore knee", "unreplicated"])
+
+    @override_settings(READ_REPLICAS={'ALIASES': ['replica'], 'PIN_SECONDS': 0})
+    def test_writers_go_back_to_the_replica_once_their_pin_expires(self):
+        self.add_hurt()
+
+        self.assertEqual(self.hurt_names("writer"), [])
+
+    def test_other_actions_read_from_the_primary(self):
+        hurt = Hurt.objects.create(patient=self.patients["writer"], bodypart=self.bodypart, name="unreplicated",
+                                   added_on=timezone.now())
+
+        response = self.clients["reader"].get(f"/hurts/{hurt.id}/history?cursor=")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_registered_users_read_from_the_primary(self):
+        response = self.client.post("/register", {
+            "username": "newuser", "email": "new@example.com", "password": "newpassword",
+            "firstname": "new", "lastname": "user"}, content_type='application/json')
+        registered = json.loads(response.content)
+
+        response = self.client.get(f"/patients/{registered['patient_id']}",
+                                   HTTP_AUTHORIZATION='Token ' + registered["token"])
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(CACHES={'pins': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                        'LOCATION': 'replica-pin-tests'}})
+    def test_pins_from_other_workers_outlast_expired_local_ones(self):
+        first, second = ReplicaPins('pins'), ReplicaPins('pins')
+        with mock.patch('whereithurtsapi.helpers.replicas.time.time', return_value=1000.0):
+            first.pin(7, 10)
+        with mock.patch('whereithurtsapi.helpers.replicas.time.time', return_value=1020.0):
+            # the first pin expired and the user wrote again through the second worker
+            second.pin(7, 10)
+            self.assertTrue(second.is_pinned(7))
+            self.assertTrue(first.is_pinned(7))
+
+    @override_settings(READ_REPLICAS={'ALIASES': ['replica', 'other'], 'PIN_SECONDS': 60})
+    def test_each_request_reads_from_one_replica(self):
+        router = ReadReplicaRouter()
+        with mock.patch('whereithurtsapi.routers.random.choice', side_effect=['other', 'replica']) as choice:
+            for replica in ('other', 'replica'):
+                with handling_request() as reads:
+                    reads.allowed = True
+                    self.assertEqual({router.db_for_read(model) for model in (Hurt, Patient, Hurt)}, {replica})
+        self.assertEqual(choice.call_count, 2)
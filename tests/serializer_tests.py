@@ -0,0 +1,93 @@
+from django.test import RequestFactory, TestCase
+from rest_framework.renderers import JSONRenderer
+from whereithurtsapi.benchmark import benchmark_serializers, generate_data
+from whereithurtsapi.helpers import compiled, reference_data_changed, with_owner
+from whereithurtsapi.models import Bodypart, Healing, Hurt, Patient, Treatment, TreatmentType, Update
+from whereithurtsapi.views import Bodypart as bodypart_views, Healing as healing_views, Hurt as hurt_views
+from whereithurtsapi.views import Patient as patient_views, Profile as profile_views, Treatment as treatment_views
+from whereithurtsapi.views import TreatmentType as treatmenttype_views, Update as update_views
+
+
+class SerializerTests(TestCase):
+    def setUp(self):
+        """ a synthetic data set with icons, and a request to build absolute icon urls from """
+        self.data = generate_data(patients=3)
+        Bodypart.objects.update(hurt_image='icons/bodyparts/hurts/knee.png')
+        TreatmentType.objects.filter(id=self.data.treatmenttype_id).update(image='icons/treatmenttypes/ice.png')
+        reference_data_changed()
+
+        request = RequestFactory().get('/')
+        request.auth = type('Auth', (), {'user': Patient.objects.get(pk=self.data.patient_id).user})
+        self.context = {'request': request}
+
+    def assertRendersIdentically(self, serializer_class, instances):
+        """ the compiled serializer renders to the same bytes as the DRF serializer, for a list
+        and for each instance on its own """
+        instances = list(instances)
+        self.assertTrue(instances)
+        render = JSONRenderer().render
+        compiled_serializer = compiled(serializer_class)
+
+        self.assertEqual(
+            render(compiled_serializer.serialize(instances, self.context, many=True)),
+            render(serializer_class(instances, many=True, context=self.context).data))
+        for instance in instances:
+            self.assertEqual(render(compiled_serializer.serialize(instance, self.context)),
+                             render(serializer_class(instance, context=self.context).data))
+
+    def test_hurt_serializers(self):
+        request = self.context['request']
+        self.assertRendersIdentically(hurt_views.HurtSerializer, with_owner(hurt_views.hurt_queryset(), request))
+        # without the owner annotation the owner key is left out, as DRF leaves it out
+        self.assertRendersIdentically(hurt_views.HurtSerializer, Hurt.objects.all())
+
+    def test_update_serializer(self):
+        request = self.context['request']
+        self.assertRendersIdentically(update_views.UpdateSerializer, with_owner(Update.objects.select_related('hurt').annotate(
+            _previous_pain_level=update_views.previous_pain_level()), request, 'hurt__patient'))
+
+    def test_updates_nest_their_hurt_without_its_summary(self):
+        update = Update.objects.select_related('hurt').filter(hurt_id=self.data.hurt_id).first()
+        hurt = compiled(update_views.UpdateSerializer).serialize(update, self.context)['hurt']
+        self.assertEqual(list(hurt), ['id', 'patient', 'bodypart', 'name', 'added_on', 'is_active'])
+
+    def test_healing_serializers(self):
+        healings = Healing.objects.filter(patient_id=self.data.patient_id)
+        self.assertRendersIdentically(healing_views.SimpleHealingSerializer, healings)
+        for healing in healings:
+            healing.owner = True
+        self.assertRendersIdentically(healing_views.HealingSerializer, healings[:3])
+
+    def test_treatment_serializers(self):
+        request = self.context['request']
+        self.assertRendersIdentically(treatment_views.TreatmentSerializer,
+                                      with_owner(treatment_views.treatment_queryset(), request, 'added_by'))
+
+    def test_nested_patients_leave_out_their_data_version(self):
+        request = self.context['request']
+        hurt = hurt_views.hurt_queryset().get(pk=self.data.hurt_id)
+        patient = Patient.objects.get(pk=self.data.patient_id)
+        self.assertEqual(compiled(hurt_views.HurtSerializer).serialize(hurt, self.context)['patient'],
+                         {'id': patient.id, 'user': patient.user_id})
+
+        render = JSONRenderer().render
+        for serializer_class, instances in (
+                (hurt_views.HurtSerializer, [hurt]),
+                (healing_views.HealingSerializer, Healing.objects.filter(patient=patient)[:3]),
+                (treatment_views.TreatmentSerializer, with_owner(treatment_views.treatment_queryset(), request, 'added_by'))):
+            self.assertNotIn(b'data_version', render(compiled(serializer_class).serialize(instances, self.context, many=True)))
+
+    def test_lookup_and_profile_serializers(self):
+        self.assertRendersIdentically(bodypart_views.BodypartSerializer, Bodypart.objects.all())
+        self.assertRendersIdentically(treatmenttype_views.TreatmentTypeSerializer, TreatmentType.objects.all())
+        self.assertRendersIdentically(patient_views.PatientSerializer, Patient.objects.all())
+        self.assertRendersIdentically(profile_views.ProfileHealingSerializer, Healing.objects.all())
+        self.assertRendersIdentically(profile_views.ProfileTreatmentSerializer, Treatment.objects.all())
+        self.assertRendersIdentically(profile_views.ProfileHurtSerializer, Hurt.objects.all())
+
+    def test_serializer_benchmark_times_both_serializers(self):
+        timings = benchmark_serializers(repeat=1)
+
+        self.assertEqual([name for name, *_ in timings],
+                         ['HurtSerializer', 'UpdateSerializer', 'SimpleHealingSerializer', 'TreatmentSerializer'])
+        self.assertTrue(all(rows and drf > 0 and fast > 0 for _, rows, drf, fast in timings))
@@ -0,0 +1,57 @@
+import os
+import tempfile
+from io import StringIO
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS
+from django.db.utils import ConnectionHandler
+from django.test import SimpleTestCase, override_settings
+from whereithurtsapi.benchmark import sqlite_write_stress
+
+
+class SqliteTuningTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def pragmas(self, *names):
+        """ The values of pragmas on a new connection to a SQLite file """
+        database = ConnectionHandler({DEFAULT_DB_ALIAS: {
+            'ENGINE': 'django.db.backends.sqlite3', 'NAME': os.path.join(self.directory, 'tuned.sqlite3')}
+        })[DEFAULT_DB_ALIAS]
+        try:
+            with database.cursor() as cursor:
+                values = []
+                for name in names:
+                    cursor.execute(f'PRAGMA {name}')
+                    values.append(cursor.fetchone()[0])
+                return values
+        finally:
+            database.close()
+
+    def test_new_connections_get_the_configured_pragmas(self):
+        self.assertEqual(self.pragmas('journal_mode', 'synchronous', 'busy_timeout', 'cache_size', 'temp_store'),
+                         ['wal', 1, 5000, -20000, 2])
+
+    @override_settings(SQLITE_PRAGMAS={'journal_mode': None, 'busy_timeout': 250})
+    def test_pragmas_can_be_configured_or_left_alone(self):
+        self.assertEqual(self.pragmas('journal_mode', 'busy_timeout', 'synchronous'), ['delete', 250, 1])
+
+    @override_settings(SQLITE_PRAGMAS={'journal_mode': 'wal; DROP TABLE stress_update'})
+    def test_malformed_pragmas_are_refused(self):
+        with self.assertRaises(ValueError):
+            self.pragmas('journal_mode')
+
+    def test_concurrent_writers_are_not_locked_out(self):
+        result = sqlite_write_stress(os.path.join(self.directory, 'stress.sqlite3'), 'tuned', {}, 600,
+                                     writers=6, writes_per_writer=20, readers=2)
+
+        self.assertEqual(result.lock_errors, 0)
+        self.assertEqual(result.writes, 120)
+
+    def test_command_compares_untuned_and_tuned(self):
+        out = StringIO()
+
+        call_command('benchmark_sqlite', writers=2, writes=5, readers=1, stdout=out)
+
+        self.assertEqual([line.split()[0] for line in out.getvalue().splitlines()[1:]], ["untuned", "tuned"])
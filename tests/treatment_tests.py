@@ -0,0 +1,286 @@
+import json
+from rest_framework import status
+from rest_framework.test import APITestCase
+from whereithurtsapi.models import Treatment, Hurt, TreatmentType, Bodypart, Update, Patient, HurtTreatment, TreatmentLink, Healing, HurtHealing
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.contrib.auth.models import User
+from rest_framework.authtoken.models import Token
+from whereithurtsapi.helpers import ordering_values
+from whereithurtsapi.helpers.treatment_cache import PublicTreatmentCache
+
+
+class TreatmentTests(APITestCase):
+    def setUp(self):
+        """ create a patient with a token, and the lookup rows a Treatment needs """
+        user = User.objects.create_user(
+            username="treatmentuser",
+            email="treatment@user.com",
+            password="treatmentuserpassword",
+            first_name="treatment",
+            last_name="user"
+        )
+        self.token = Token.objects.create(user=user).key
+        self.patient = Patient.objects.create(user=user)
+
+        self.treatmenttype = TreatmentType.objects.create(name="test treat type")
+        self.bodypart = Bodypart.objects.create(name="test part")
+
+    def create_treatment(self, name="test treat"):
+        """ create a public treatment tagged with a hurt (with two updates and a healing) and a link """
+        treatment = Treatment.objects.create(
+            name=name,
+            added_by=self.patient,
+            treatmenttype=self.treatmenttype,
+            bodypart=self.bodypart,
+            added_on=timezone.now(),
+            notes="no notes",
+            public=True
+        )
+        TreatmentLink.objects.create(
+            treatment=treatment, linktext="a link", linkurl="http://example.com")
+
+        hurt = Hurt.objects.create(
+            name=f"{name} hurt",
+            patient=self.patient,
+            bodypart=self.bodypart,
+            added_on=timezone.now()
+        )
+        Update.objects.create(hurt=hurt, notes="first update",
+                              pain_level=4, added_on=timezone.now())
+        Update.objects.create(hurt=hurt, notes="second update",
+                              pain_level=2, added_on=timezone.now())
+        hurt.refresh_summary()
+        HurtTreatment.objects.create(hurt=hurt, treatment=treatment)
+
+        healing = Healing.objects.create(
+            patient=self.patient, notes="healing", duration=100, added_on=timezone.now())
+        HurtHealing.objects.create(hurt=hurt, healing=healing)
+        return treatment
+
+    def get_list(self, url):
+        """ GET a treatment list, returning the parsed body and the number of queries it took """
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return json.loads(response.content), len(queries)
+
+    def test_list_treatments_embeds_hurt_summaries(self):
+        """ embedded hurts carry their notes, latest pain level and healing count """
+        self.create_treatment()
+
+        json_response, _ = self.get_list("/treatments")
+
+        self.assertEqual(json_response["count"], 1)
+        treatment = json_response["treatments"][0]
+        self.assertEqual(treatment["owner"], True)
+        self.assertEqual(treatment["healing_count"], 0)
+        self.assertEqual(len(treatment["links"]), 1)
+        self.assertEqual(treatment["added_by"]["full_name"], "treatment user")
+
+        hurt = treatment["hurts"][0]
+        self.assertEqual(hurt["notes"], "first update")
+        self.assertEqual(hurt["latest_pain_level"], 2)
+        self.assertEqual(hurt["healing_count"], 1)
+        self.assertEqual(hurt["bodypart"]["name"], "test part")
+
+    def test_list_treatments_query_count_does_not_grow_with_page_size(self):
+        """ a full page of treatments costs the same number of queries as a page of one """
+        for i in range(6):
+            self.create_treatment(f"treatment {i}")
+
+        # authenticate once first so both measured requests find the token cached
+        self.get_list("/treatments?page=1&page_size=1")
+
+        _, small_page_queries = self.get_list("/treatments?page=1&page_size=1")
+        json_response, full_page_queries = self.get_list(
+            "/treatments?page=1&page_size=6")
+
+        self.assertEqual(len(json_response["treatments"]), 6)
+        self.assertEqual(small_page_queries, full_page_queries)
+
+    def test_list_treatments_by_cursor_walks_every_page_once(self):
+        """ following next_cursor from the first page visits every treatment exactly once, newest first """
+        created = [self.create_treatment(f"treatment {i}").id for i in range(5)]
+
+        seen = []
+        json_response, _ = self.get_list("/treatments?cursor=&page_size=2")
+        seen += [treatment["id"] for treatment in json_response["treatments"]]
+        while json_response["next_cursor"] is not None:
+            json_response, _ = self.get_list(
+                f"/treatments?page_size=2&cursor={json_response['next_cursor']}")
+            seen += [treatment["id"] for treatment in json_response["treatments"]]
+
+        self.assertEqual(json_response["count"], 5)
+        self.assertEqual(seen, list(reversed(created)))
+
+    def test_list_treatments_with_invalid_cursor(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        response = self.client.get("/treatments?cursor=notacursor")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def post_treatment(self, name, notes="no notes", public=True):
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        response = self.client.post("/treatments", {
+            "name": name, "notes": notes, "public": public,
+            "treatmenttype_id": self.treatmenttype.id, "bodypart_id": self.bodypart.id,
+            "hurt_ids": [], "treatment_links": []
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return json.loads(response.content)["id"]
+
+    def test_search_treatments_by_word_prefix_ranked_by_field(self):
+        """ every word of q has to prefix a word of the treatment, and name matches rank above notes matches """
+        in_notes = self.post_treatment("foam roller", notes="then ice it")
+        in_name = self.post_treatment("ice pack", notes="wrap it")
+        self.post_treatment("stretch", notes="slowly")
+
+        json_response, _ = self.get_list("/treatments?q=IC")
+        self.assertEqual([t["id"] for t in json_response["treatments"]], [in_name, in_notes])
+
+        json_response, _ = self.get_list("/treatments?q=ice%20wr")
+        self.assertEqual([t["id"] for t in json_response["treatments"]], [in_name])
+
+        # bodypart and treatment type names are searchable too
+        json_response, _ = self.get_list("/treatments?q=part")
+        self.assertEqual(json_response["count"], 3)
+
+    def test_search_treatments_respects_visibility_and_updates(self):
+        """ another patient's private treatments never match, and an edited treatment is re-indexed """
+        other_user = User.objects.create_user(username="other", password="otherpassword")
+        other = Patient.objects.create(user=other_user)
+        Token.objects.create(user=other_user)
+        private_id = self.post_treatment("ice bath", public=False)
+        Treatment.objects.filter(pk=private_id).update(added_by=other)
+
+        treatment_id = self.post_treatment("ice pack")
+        self.client.put(f"/treatments/{treatment_id}", {
+            "name": "heat pack", "notes": "warm", "public": True,
+            "treatmenttype_id": self.treatmenttype.id, "bodypart_id": self.bodypart.id,
+            "hurt_ids": [], "treatment_links": []
+        }, format='json')
+
+        json_response, _ = self.get_list("/treatments?q=ice")
+        self.assertEqual(json_response["treatments"], [])
+        json_response, _ = self.get_list("/treatments?q=heat")
+        self.assertEqual([t["id"] for t in json_response["treatments"]], [treatment_id])
+
+    def test_search_treatments_by_cursor(self):
+        """ cursor pages of search results follow the ranking """
+        created = [self.post_treatment(f"ice {i}") for i in range(3)]
+        ranked_first = self.post_treatment("ice", notes="ice")
+
+        json_response, _ = self.get_list("/treatments?q=ice&cursor=&page_size=2")
+        seen = [t["id"] for t in json_response["treatments"]]
+        json_response, _ = self.get_list(
+            f"/treatments?q=ice&page_size=2&cursor={json_response['next_cursor']}")
+        seen += [t["id"] for t in json_response["treatments"]]
+
+        self.assertEqual(seen, [ranked_first] + list(reversed(created)))
+
+    def test_browsing_merges_private_treatments_into_cached_public_ones(self):
+        """ the public part of a browse is cached across users, with each user's private
+        treatments merged in order and their own treatments flagged """
+        other_user = User.objects.create_user(username="other", password="otherpassword")
+        other = Patient.objects.create(user=other_user)
+        other_token = Token.objects.create(user=other_user).key
+
+        public_id = self.post_treatment("ice pack")
+        private_id = self.post_treatment("ice bath", public=False)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + other_token)
+        self.client.post("/treatments", {
+            "name": "ice cube", "notes": "no notes", "public": True, "treatmenttype_id": self.treatmenttype.id,
+            "bodypart_id": self.bodypart.id, "hurt_ids": [], "treatment_links": []
+        }, format='json')
+        others_public_id = Treatment.objects.get(name="ice cube").id
+
+        mine, _ = self.get_list("/treatments?order_by=name&page=1&page_size=10")
+        self.assertEqual([(t["id"], t["owner"]) for t in mine["treatments"]],
+                         [(private_id, True), (others_public_id, False), (public_id, True)])
+        self.assertEqual(mine["count"], 3)
+
+        # the other patient is served the same cached public treatments without querying them
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + other_token)
+        with CaptureQueriesContext(connection) as queries:
+            theirs = json.loads(self.client.get("/treatments?order_by=name&page=1&page_size=10").content)
+        self.assertEqual([(t["id"], t["owner"]) for t in theirs["treatments"]],
+                         [(others_public_id, True), (public_id, False)])
+        # their private treatments are counted, and the ones that can land on the page loaded
+        treatment_queries = [q['sql'] for q in queries if 'FROM "whereithurtsapi_treatment"' in q['sql']]
+        self.assertEqual(len(treatment_queries), 2)
+        for sql in treatment_queries:
+            self.assertIn(f'"added_by_id" = {other.id}', sql)
+
+    def test_browse_cursor_pages_load_only_the_private_treatments_they_can_show(self):
+        """ pages ordered across a relation come out in the database's order, without loading
+        the related rows, and only up to a page of private treatments is read for each """
+        other_part = Bodypart.objects.create(name="other part")
+        for index in range(8):
+            self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+            self.client.post("/treatments", {
+                "name": f"treatment {index}", "notes": "no notes", "public": index % 3 != 0,
+                "treatmenttype_id": self.treatmenttype.id, "bodypart_id": (self.bodypart, other_part)[index % 2].id,
+                "hurt_ids": [], "treatment_links": []
+            }, format='json')
+
+        seen = []
+        cursor = ""
+        while cursor is not None:
+            with CaptureQueriesContext(connection) as queries:
+                page, _ = self.get_list(f"/treatments?order_by=bodypart&direction=desc&page_size=2&cursor={cursor}")
+            seen += [treatment["id"] for treatment in page["treatments"]]
+            cursor = page["next_cursor"]
+            self.assertFalse([q for q in queries if 'FROM "whereithurtsapi_bodypart"' in q['sql']])
+            self.assertTrue([q for q in queries if 'NOT "whereithurtsapi_treatment"."public"' in q['sql']
+                             and q['sql'].endswith('LIMIT 3')])
+
+        self.assertEqual(seen, list(Treatment.objects.order_by('-bodypart', '-id').values_list('id', flat=True)))
+        self.assertEqual(page["count"], 8)
+
+    def test_ordering_values_read_relations_by_id(self):
+        treatment = Treatment.objects.get(pk=self.create_treatment().id)
+
+        with self.assertNumQueries(0):
+            values = ordering_values(treatment, ['-bodypart', 'treatmenttype', 'id'])
+
+        self.assertEqual(values, [self.bodypart.id, self.treatmenttype.id, treatment.id])
+
+    def test_cached_browse_is_invalidated_by_writes(self):
+        """ edits to a treatment, its links and the hurts tagged on it show up on the next browse """
+        treatment = self.create_treatment()
+        hurt = treatment.hurt_treatments.get().hurt
+
+        json_response, _ = self.get_list("/treatments")
+        self.assertEqual(json_response["treatments"][0]["hurts"][0]["latest_pain_level"], 2)
+
+        self.client.post("/updates", {"hurt_id": hurt.id, "pain_level": 7, "notes": "worse"}, format='json')
+        json_response, _ = self.get_list("/treatments")
+        self.assertEqual(json_response["treatments"][0]["hurts"][0]["latest_pain_level"], 7)
+
+        self.client.put(f"/treatments/{treatment.id}", {
+            "name": "renamed", "notes": "no notes", "public": True,
+            "treatmenttype_id": self.treatmenttype.id, "bodypart_id": self.bodypart.id,
+            "hurt_ids": [], "treatment_links": [{"linktext": "new", "linkurl": "http://example.org"}]
+        }, format='json')
+        json_response, _ = self.get_list("/treatments")
+        self.assertEqual(json_response["treatments"][0]["name"], "renamed")
+        self.assertEqual(json_response["treatments"][0]["hurts"], [])
+        self.assertEqual([link["linktext"] for link in json_response["treatments"][0]["links"]], ["new"])
+
+        self.client.post(f"/treatments/{treatment.id}/tag_hurt", {"hurt_id": hurt.id}, format='json')
+        self.client.delete(f"/treatments/{treatment.id}/tag_hurt", {"hurt_id": hurt.id}, format='json')
+        json_response, _ = self.get_list("/treatments")
+        self.assertEqual(json_response["treatments"][0]["hurts"], [])
+
+    def test_public_treatment_cache_evicts_least_recently_used(self):
+        cache = PublicTreatmentCache(max_entries=2)
+        cache.get_or_build('a', lambda: 'a1')
+        cache.get_or_build('b', lambda: 'b1')
+        self.assertEqual(cache.get_or_build('a', lambda: 'a2'), 'a1')
+        cache.get_or_build('c', lambda: 'c1')
+
+        self.assertEqual(cache.get_or_build('b', lambda: 'b2'), 'b2')
+        cache.bump()
+        self.assertEqual(cache.get_or_build('b', lambda: 'b3'), 'b3')
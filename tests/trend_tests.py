@@ -0,0 +1,95 @@
+import json
+from datetime import datetime, timedelta
+from rest_framework import status
+from rest_framework.test import APITestCase
+from whereithurtsapi.models import Bodypart, Hurt, Patient, Update
+from whereithurtsapi.helpers import pain_trend
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.contrib.auth.models import User
+from rest_framework.authtoken.models import Token
+
+
+class TrendTests(APITestCase):
+    def setUp(self):
+        """ create two patients, and a hurt with a check-in every day for two weeks, getting better """
+        self.tokens = {}
+        self.patients = {}
+        for name in ("trenduser", "otheruser"):
+            user = User.objects.create_user(username=name, password=f"{name}password", first_name=name)
+            self.tokens[name] = Token.objects.create(user=user).key
+            self.patients[name] = Patient.objects.create(user=user)
+        self.patient = self.patients["trenduser"]
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.tokens["trenduser"])
+
+        bodypart = Bodypart.objects.create(name="test part")
+        # a Monday at noon, so days and weeks don't depend on when the test runs
+        self.start = timezone.make_aware(datetime(2021, 1, 4, 12))
+        self.hurt = Hurt.objects.create(patient=self.patient, bodypart=bodypart, name="sore knee", added_on=self.start)
+        Update.objects.bulk_create([
+            Update(hurt=self.hurt, added_on=self.start + timedelta(days=day), pain_level=10 - day // 2, notes="")
+            for day in range(14)])
+        self.hurt.refresh_summary()
+
+    def test_trend_columns(self):
+        start = self.start
+        points = [(start, 8), (start + timedelta(hours=6), 6), (start + timedelta(days=1), 4),
+                  (start + timedelta(days=5), 4)]
+
+        trend = pain_trend(points, window=2, interval='day')
+
+        self.assertEqual(trend['updates']['pain_level'], [8, 6, 4, 4])
+        self.assertEqual(trend['updates']['delta'], [None, -2, -2, 0])
+        # the last check-in is more than 2 days after the others, so it is alone in its window
+        self.assertEqual(trend['updates']['rolling_average'], [8, 7, 6, 4])
+        self.assertEqual(trend['updates']['rolling_slope'], [None, -8, -3.69, None])
+        self.assertEqual(trend['series'], {'start': ['2021-01-04', '2021-01-05', '2021-01-09'],
+                                           'average': [7, 4, 4], 'min': [6, 4, 4], 'max': [8, 4, 4],
+                                           'count': [2, 1, 1]})
+        self.assertEqual(trend['summary']['count'], 4)
+        self.assertEqual(trend['summary']['average'], 5.5)
+        self.assertEqual(trend['summary']['slope'], -0.54)
+
+    def test_empty_trend(self):
+        trend = pain_trend([])
+        self.assertEqual(trend['updates']['pain_level'], [])
+        self.assertEqual(trend['summary'], {'count': 0, 'average': None, 'slope': None})
+
+    def test_hurt_trend_is_one_query_for_the_check_ins(self):
+        self.client.get("/bodyparts")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f"/hurts/{self.hurt.id}/trend?interval=week")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        trend = json.loads(response.content)
+        self.assertEqual(len(trend['updates']['pain_level']), 14)
+        self.assertEqual(trend['series']['start'], ['2021-01-04', '2021-01-11'])
+        self.assertEqual(trend['series']['count'], [7, 7])
+        self.assertEqual(trend['summary']['slope'], -0.49)
+        self.assertEqual(len([query for query in queries if 'whereithurtsapi_update' in query['sql']]), 1)
+
+        etag = response['ETag']
+        self.assertEqual(self.client.get(f"/hurts/{self.hurt.id}/trend?interval=week",
+                                         HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_patient_trend_has_every_hurt(self):
+        response = self.client.get(f"/profiles/{self.patient.id}/trend?window=3")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        trend = json.loads(response.content)
+        self.assertEqual(trend['window'], 3)
+        self.assertEqual([hurt['name'] for hurt in trend['hurts']], ["sore knee"])
+        self.assertEqual(trend['hurts'][0]['summary']['count'], 14)
+
+    def test_trends_are_private_and_options_are_checked(self):
+        self.assertEqual(self.client.get(f"/hurts/{self.hurt.id}/trend?window=0").status_code,
+                         status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(f"/hurts/{self.hurt.id}/trend?interval=month").status_code,
+                         status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get("/hurts/9999/trend").status_code, status.HTTP_404_NOT_FOUND)
+
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.tokens["otheruser"])
+        self.assertEqual(self.client.get(f"/hurts/{self.hurt.id}/trend").status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self.client.get(f"/profiles/{self.patient.id}/trend").status_code,
+                         status.HTTP_401_UNAUTHORIZED)
@@ -49,7 +49,8 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'whereithurtsapi.authentication.PatientTokenAuthentication',
+        'whereithurtsapi.authentication.BatchRequestAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -58,6 +59,39 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 10
 }
 
+# Cache of authenticated tokens used by whereithurtsapi.authentication.PatientTokenAuthentication.
+# SHARED_CACHE names an entry in CACHES (e.g. a locmem or file-based cache) to keep
+# cached tokens in instead of each worker process, so invalidations apply to all of them at once
+TOKEN_AUTH_CACHE = {
+    'TTL': 300,
+    'MAX_ENTRIES': 1024,
+    'SHARED_CACHE': None,
+}
+
+# Cache of serialized public treatment lists used by TreatmentViewSet.list.
+# SHARED_CACHE names an entry in CACHES that keeps the cache's generation, so a
+# write in one worker process invalidates the lists cached by every other
+PUBLIC_TREATMENT_CACHE = {
+    'MAX_ENTRIES': 128,
+    'SHARED_CACHE': None,
+}
+
+# Registry of the Bodypart and TreatmentType tables, loaded once per process.
+# SHARED_CACHE names an entry in CACHES that tells workers about admin edits made
+# through another worker, which is checked for every CHECK_INTERVAL seconds. An id
+# missing from the loaded rows reloads them at most every MISS_RELOAD_INTERVAL seconds
+REFERENCE_DATA = {
+    'SHARED_CACHE': None,
+    'CHECK_INTERVAL': 5,
+    'MISS_RELOAD_INTERVAL': 60,
+}
+
+# Thread pool the async views under /async run their database reads in, shared by
+# every request in the process. Each worker thread holds its own database connection
+ASYNC_READS = {
+    'MAX_WORKERS': 4,
+}
+
 CORS_ORIGIN_WHITELIST = (
     'http://localhost:3000',
     'http://127.0.0.1:3000',
@@ -76,6 +110,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'whereithurtsapi.middleware.ReadReplicaMiddleware',
 ]
 
 ROOT_URLCONF = 'whereithurts.urls'
@@ -106,9 +141,41 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # keep each worker thread's connection open for this many seconds instead of
+        # reconnecting (and re-running SQLITE_PRAGMAS) on every request
+        'CONN_MAX_AGE': 600,
     }
 }
 
+DATABASE_ROUTERS = ['whereithurtsapi.routers.ReadReplicaRouter']
+
+# Read replicas of the default database. GET requests to the viewset actions in ACTIONS
+# read from one of the ALIASES (entries in DATABASES), except for a user who wrote in
+# the last PIN_SECONDS, whose reads stay on the primary so they see their own writes.
+# SHARED_CACHE names an entry in CACHES that shares those pins between worker processes.
+# To try it with SQLite files, add e.g. DATABASES['replica'] with NAME
+# BASE_DIR / 'replica.sqlite3', set ALIASES to ['replica'], and run
+# `python manage.py replicate_sqlite --every 5` to stand in for replication
+READ_REPLICAS = {
+    'ALIASES': [],
+    'ACTIONS': ['list', 'retrieve', 'snapshot'],
+    'PIN_SECONDS': 10,
+    'SHARED_CACHE': None,
+}
+
+# Pragmas run on every new SQLite connection, in this order. WAL lets reads go on while
+# a write commits, and busy_timeout makes a write wait that many milliseconds for
+# another's lock instead of failing with "database is locked". Set one to None to
+# leave it at SQLite's default
+SQLITE_PRAGMAS = {
+    'busy_timeout': 5000,
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'cache_size': -20000,
+    'mmap_size': 268435456,
+    'temp_store': 'memory',
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
@@ -13,7 +13,7 @@ Including anothe
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from whereithurtsapi.views import login_user, register_user, PatientViewSet, TreatmentViewSet, HurtViewSet, HealingViewSet, TreatmentTypeViewSet, BodypartViewSet, UpdateViewSet, ProfileViewSet
+from whereithurtsapi.views import login_user, register_user, PatientViewSet, TreatmentViewSet, HurtViewSet, HealingViewSet, TreatmentTypeViewSet, BodypartViewSet, UpdateViewSet, ProfileViewSet, BatchViewSet, icon_variant, hurt_detail, patient_detail, profile_snapshot
 from django.contrib import admin
 from django.conf.urls import include
 from django.conf.urls.static import static
@@ -30,11 +30,18 @@ router.register(r'treatmenttypes', TreatmentTypeViewSet, 'treatmenttype')
 router.register(r'bodyparts', BodypartViewSet, 'bodypart')
 router.register(r'updates', UpdateViewSet, 'update')
 router.register(r'profiles', ProfileViewSet, 'profile')
+router.register(r'batch', BatchViewSet, 'batch')
 
 urlpatterns = [
     path('', include(router.urls)),
     path('login', login_user),
     path('register', register_user),
     path('admin/', admin.site.urls),
+    # async versions of the heaviest reads, which run their queries concurrently under ASGI
+    path('async/hurts/<int:pk>', hurt_detail),
+    path('async/patients/<int:pk>', patient_detail),
+    path('async/profiles/<int:pk>/snapshot', profile_snapshot),
+    # hashed icon variants are served with far-future caching, before the rest of MEDIA_URL
+    path(f'{settings.MEDIA_URL.strip("/")}/icons/variants/<path:path>', icon_variant),
 ]
 urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class WhereithurtsapiConfig(AppConfig):
     name = 'whereithurtsapi'
+
+    def ready(self):
+        # connect the cache invalidation receivers
+        from whereithurtsapi import signals  # pylint: disable=unused-import,import-outside-toplevel
@@ -0,0 +1,142 @@
+""" Authentication module for the whereithurts API """
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication, TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+# defaults for settings.TOKEN_AUTH_CACHE
+TOKEN_AUTH_CACHE_DEFAULTS = {
+    # seconds an authenticated token is trusted without going back to the database
+    'TTL': 300,
+    # most tokens kept in each process's LRU
+    'MAX_ENTRIES': 1024,
+    # optional alias from settings.CACHES shared between processes, e.g. 'default'
+    'SHARED_CACHE': None,
+}
+
+
+class TokenCache:
+    """ Maps token keys to their Token (with the token's User and that user's
+    Patient already loaded) so authenticating a request doesn't query the database
+
+    Entries live for `ttl` seconds in an in-process LRU, or, when a shared cache alias
+    is configured, in that Django cache instead. The shared cache is then the only copy,
+    so a token deleted or invalidated through one worker stops authenticating in every
+    worker at once rather than when their own copies expire.
+    """
+
+    def __init__(self, ttl, max_entries, shared_cache=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.shared_cache = caches[shared_cache] if shared_cache else None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _shared_key(self, key):
+        return f"token-auth:{key}"
+
+    def get(self, key):
+        if self.shared_cache is not None:
+            return self.shared_cache.get(self._shared_key(key))
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                token, expires_at = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    return token
+                del self._entries[key]
+        return None
+
+    def set(self, token):
+        if self.shared_cache is not None:
+            self.shared_cache.set(self._shared_key(token.key), token, self.ttl)
+        else:
+            self._store_locally(token.key, token)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.shared_cache is not None:
+            self.shared_cache.delete(self._shared_key(key))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _store_locally(self, key, token):
+        with self._lock:
+            self._entries[key] = (token, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+_token_cache = None
+
+
+def get_token_cache():
+    """ The process-wide TokenCache, built from settings.TOKEN_AUTH_CACHE on first use """
+    global _token_cache
+    if _token_cache is None:
+        options = {**TOKEN_AUTH_CACHE_DEFAULTS, **getattr(settings, 'TOKEN_AUTH_CACHE', {})}
+        _token_cache = TokenCache(options['TTL'], options['MAX_ENTRIES'], options['SHARED_CACHE'])
+    return _token_cache
+
+
+def warm_token_cache(token):
+    """ Cache a token that was just issued or looked up at login so the client's
+    first authenticated request doesn't query for it. The token's user should
+    already have its patient attached.
+    """
+    get_token_cache().set(token)
+
+
+def invalidate_user_tokens(user_id):
+    """ Drop any cached token belonging to a user, e.g. after the user or their patient changed """
+    for key in Token.objects.filter(user_id=user_id).values_list('key', flat=True):
+        get_token_cache().delete(key)
+
+
+class PatientTokenAuthentication(TokenAuthentication):
+    """ Token authentication that loads the token's User and that user's Patient
+    in the same query, so request.auth.user.patient is resolved once per request
+    without another lookup
+
+    Authenticated tokens are kept in the TokenCache, so repeat requests with the
+    same token skip the database entirely until the entry expires or is invalidated
+    """
+
+    def authenticate_credentials(self, key):
+        token_cache = get_token_cache()
+        token = token_cache.get(key)
+
+        if token is None:
+            model = self.get_model()
+            try:
+                token = model.objects.select_related('user__patient').get(key=key)
+            except model.DoesNotExist:
+                raise exceptions.AuthenticationFailed('Invalid token.')
+            token_cache.set(token)
+
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+
+        return (token.user, token)
+
+
+class BatchRequestAuthentication(BaseAuthentication):
+    """ Authenticates the sub-requests of a /batch request as the batch's requester, who was
+    authenticated when the batch was, so the token isn't looked up again per sub-request
+
+    Sub-requests carry no Authorization header, so the token authentication ahead of this
+    one passes them on; their user and token are the batch_requester they are built with.
+    """
+
+    def authenticate(self, request):
+        return getattr(request, 'batch_requester', None)
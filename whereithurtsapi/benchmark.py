@@ -0,0 +1,675 @@
+""" Query-count and latency benchmark for every API route
+
+generate_data() fills the database with synthetic patients, hurts, updates, treatments
+and healings; run_benchmark() then requests every route registered in whereithurts/urls.py
+through the DRF test client and records, for each one, how many queries it ran, its p50
+and p95 latency and the size of its response. List routes are requested with a page of
+one row and a page of PAGE_SIZE rows, and any route that runs more queries for the bigger
+page is reported as a failure, since that means a serializer is querying once per row.
+
+run_async_benchmark() compares the reads that have async versions with those versions,
+under concurrent requests through the ASGI handler.
+
+sqlite_write_stress() measures how many check-in writes concurrent workers get through
+a SQLite file with and without the SQLITE_PRAGMAS tuning.
+"""
+import asyncio
+import os
+import random
+import statistics
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import timedelta
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connection
+from django.db.backends.signals import connection_created
+from django.db.utils import ConnectionHandler
+from django.test import AsyncClient
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from whereithurtsapi.models import (Bodypart, Healing, HealingTreatment, Hurt, HurtHealing, HurtTreatment,
+                                    Patient, Treatment, TreatmentLink, TreatmentType, Update)
+from whereithurtsapi.helpers import (compiled, index_treatment, record_activity, reference_data_changed, refresh_daily_rollup,
+                                    rollup_day)
+
+# size of the bigger page requested from list routes when checking for per-row queries
+PAGE_SIZE = 20
+# requests made at once by each round of run_async_benchmark
+CONCURRENCY = 8
+# hurts the stress test's check-ins are spread over
+STRESS_HURTS = 20
+# password of the benchmark user, who is the only generated user that can log in
+BENCHMARK_PASSWORD = "benchmarkpassword"
+
+
+@dataclass
+class SyntheticData:
+    """ The rows generate_data() made that the benchmark routes are requested with """
+    token: str
+    username: str
+    patient_id: int
+    hurt_id: int
+    update_id: int
+    healing_id: int
+    treatment_id: int
+    bodypart_id: int
+    treatmenttype_id: int
+    untagged_hurt_id: int
+
+
+@dataclass
+class RouteResult:
+    """ Measurements for one request made repeat times """
+    name: str
+    method: str
+    url: str
+    status_code: int
+    queries: int
+    timings: list = field(default_factory=list)
+    size: int = 0
+
+    @property
+    def p50(self):
+        return statistics.median(self.timings) * 1000
+
+    @property
+    def p95(self):
+        timings = sorted(self.timings)
+        return timings[round(0.95 * (len(timings) - 1))] * 1000
+
+
+@dataclass
+class ConcurrentResult:
+    """ Measurements for rounds of `concurrency` requests to one url made at once """
+    name: str
+    url: str
+    concurrency: int
+    status_codes: set
+    timings: list = field(default_factory=list)
+    wall: float = 0
+
+    @property
+    def p50(self):
+        return statistics.median(self.timings) * 1000
+
+    @property
+    def p95(self):
+        timings = sorted(self.timings)
+        return timings[round(0.95 * (len(timings) - 1))] * 1000
+
+
+@dataclass
+class StressResult:
+    """ Measurements for one configuration of the write stress test """
+    name: str
+    writes: int = 0
+    lock_errors: int = 0
+    reads: int = 0
+    elapsed: float = 0
+    timings: list = field(default_factory=list)
+
+    @property
+    def throughput(self):
+        return self.writes / self.elapsed
+
+    @property
+    def p95(self):
+        timings = sorted(self.timings)
+        return timings[round(0.95 * (len(timings) - 1))] * 1000 if timings else 0
+
+
+def generate_data(patients=5, hurts_per_patient=4, updates_per_hurt=6, treatments_per_patient=4,
+                  healings_per_patient=8, seed=0):
+    """ Bulk create a synthetic data set and return the ids the benchmark requests
+
+    The first patient is a staff user with a usable password; the rest can't log in,
+    which keeps generation from spending most of its time hashing passwords. Every
+    derived table (hurt summaries, the activity log, daily rollups, the search index) is filled in as
+    the views would have.
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+
+    # bulk_create doesn't set primary keys on SQLite, so the lookup rows are read back,
+    # and it sends no signals, so the reference registry is told about them
+    if not Bodypart.objects.exists():
+        Bodypart.objects.bulk_create([Bodypart(name=f"bodypart {i}") for i in range(4)])
+        reference_data_changed()
+    if not TreatmentType.objects.exists():
+        TreatmentType.objects.bulk_create([TreatmentType(name=f"treatment type {i}") for i in range(4)])
+        reference_data_changed()
+    bodyparts = list(Bodypart.objects.order_by('id'))
+    treatmenttypes = list(TreatmentType.objects.order_by('id'))
+
+    suffix = f"{seed}-{time.time_ns()}"
+    benchmark_user = User.objects.create_user(
+        username=f"benchmark-{suffix}", password=BENCHMARK_PASSWORD,
+        first_name="benchmark", last_name="user", is_staff=True)
+    unusable_password = make_password(None)
+    for i in range(1, patients):
+        User.objects.create(username=f"benchmark-{suffix}-{i}", password=unusable_password,
+                            first_name="synthetic", last_name=f"patient {i}")
+    users = list(User.objects.filter(username__startswith=f"benchmark-{suffix}").order_by('id'))
+    patient_rows = [Patient.objects.create(user=user) for user in users]
+    token = Token.objects.create(user=benchmark_user)
+
+    def minutes_ago():
+        return now - timedelta(minutes=rng.randint(1, 60 * 24 * 30))
+
+    treatments = []
+    for patient in patient_rows:
+        for i in range(treatments_per_patient):
+            treatments.append(Treatment.objects.create(
+                name=f"treatment {patient.id}-{i}", added_by=patient, bodypart=rng.choice(bodyparts),
+                treatmenttype=rng.choice(treatmenttypes), added_on=minutes_ago(),
+                notes="synthetic treatment notes", public=rng.random() < 0.7))
+    TreatmentLink.objects.bulk_create([
+        TreatmentLink(treatment=treatment, linktext="a link", linkurl="http://example.com")
+        for treatment in treatments])
+
+    hurts = []
+    for patient in patient_rows:
+        for i in range(hurts_per_patient):
+            hurts.append(Hurt.objects.create(
+                name=f"hurt {patient.id}-{i}", patient=patient, bodypart=rng.choice(bodyparts),
+                added_on=minutes_ago(), is_active=rng.random() < 0.8))
+
+    Update.objects.bulk_create([
+        Update(hurt=hurt, added_on=hurt.added_on + timedelta(hours=i), pain_level=rng.randint(1, 10),
+               notes=f"update {i}")
+        for hurt in hurts for i in range(updates_per_hurt)])
+
+    tagged = {(hurt.id, treatment.id) for hurt in hurts for treatment in rng.sample(treatments, min(2, len(treatments)))}
+    # every treatment is tagged on a hurt too, so a page of one loads the same relations as a full page
+    if hurts:
+        tagged |= {(hurts[i % len(hurts)].id, treatment.id) for i, treatment in enumerate(treatments)}
+    HurtTreatment.objects.bulk_create([
+        HurtTreatment(hurt_id=hurt_id, treatment_id=treatment_id) for hurt_id, treatment_id in sorted(tagged)])
+
+    healings = []
+    for patient in patient_rows:
+        patient_hurts = [hurt for hurt in hurts if hurt.patient_id == patient.id]
+        for i in range(healings_per_patient):
+            healings.append(Healing.objects.create(
+                patient=patient, notes=f"healing {i}", duration=rng.randint(60, 3600),
+                intensity=rng.randint(0, 100), added_on=minutes_ago()))
+            if patient_hurts:
+                HurtHealing.objects.create(hurt=rng.choice(patient_hurts), healing=healings[-1])
+    HealingTreatment.objects.bulk_create([
+        HealingTreatment(healing=healing, treatment=treatment)
+        for healing in healings for treatment in rng.sample(treatments, min(2, len(treatments)))])
+
+    for hurt in hurts:
+        hurt.refresh_summary()
+        record_activity(hurt)
+    for update in Update.objects.filter(hurt__in=hurts).exclude(id__in=[hurt.first_update_id for hurt in hurts]):
+        record_activity(update)
+    for instance in treatments + healings:
+        record_activity(instance)
+    for treatment in treatments:
+        index_treatment(treatment)
+    for patient_id, day in {(healing.patient_id, rollup_day(healing.added_on)) for healing in healings}:
+        refresh_daily_rollup(patient_id, day)
+
+    benchmark_patient = patient_rows[0]
+    benchmark_hurts = [hurt for hurt in hurts if hurt.patient_id == benchmark_patient.id]
+    hurt = benchmark_hurts[0]
+    untagged_hurt = Hurt.objects.create(name="untagged hurt", patient=benchmark_patient,
+                                        bodypart=bodyparts[0], added_on=now)
+    return SyntheticData(
+        token=token.key,
+        username=benchmark_user.username,
+        patient_id=benchmark_patient.id,
+        hurt_id=hurt.id,
+        update_id=hurt.latest_update_id,
+        healing_id=next(healing.id for healing in healings if healing.patient_id == benchmark_patient.id),
+        treatment_id=next(treatment.id for treatment in treatments if treatment.added_by_id == benchmark_patient.id),
+        bodypart_id=bodyparts[0].id,
+        treatmenttype_id=treatmenttypes[0].id,
+        untagged_hurt_id=untagged_hurt.id,
+    )
+
+
+def delete_data(data):
+    """ Delete the users and patients generate_data() made, and every row of theirs, for
+    benchmarks that had to commit the data; bodyparts and treatment types are kept """
+    users = User.objects.filter(username__startswith=data.username)
+    patients = Patient.objects.filter(user__in=users)
+    # treatments and users aren't deleted along with the patients they belong to
+    Treatment.objects.filter(added_by__in=patients).delete()
+    patients.delete()
+    users.delete()
+
+
+@dataclass
+class Route:
+    """ A request to make against one route; body builds the request body, and before
+    puts the database in the state the request expects, outside of what is measured """
+    name: str
+    method: str
+    url: str
+    body: object = None
+    before: object = None
+
+
+def routes(data):
+    """ A Route for every route in whereithurts/urls.py, requested with the ids in data
+
+    Paged list routes take a {page_size} placeholder and are requested at two page sizes
+    """
+    registrations = iter(range(10 ** 6))
+
+    def register_body():
+        return {'username': f"{data.username}-registered-{next(registrations)}", 'email': "registered@example.com",
+                'password': BENCHMARK_PASSWORD, 'firstname': "registered", 'lastname': "user"}
+
+    def tag_body():
+        return {'hurt_id': data.untagged_hurt_id}
+
+    def untag():
+        HurtTreatment.objects.filter(hurt_id=data.untagged_hurt_id, treatment_id=data.treatment_id).delete()
+
+    def tag():
+        HurtTreatment.objects.get_or_create(hurt_id=data.untagged_hurt_id, treatment_id=data.treatment_id)
+
+    return [
+        Route('api-root', 'get', "/"),
+        Route('login', 'post', "/login", lambda: {'username': data.username, 'password': BENCHMARK_PASSWORD}),
+        Route('register', 'post', "/register", register_body),
+        Route('bodypart-list', 'get', "/bodyparts"),
+        Route('treatmenttype-list', 'get', "/treatmenttypes"),
+        Route('treatment-list', 'get', "/treatments?cursor=&page_size={page_size}"),
+        Route('treatment-list', 'get', "/treatments?q=treat&cursor=&page_size={page_size}"),
+        Route('treatment-list', 'get', "/treatments?order_by=effectiveness&cursor=&page_size={page_size}"),
+        Route('treatment-detail', 'get', f"/treatments/{data.treatment_id}"),
+        Route('treatment-tag-hurt', 'post', f"/treatments/{data.treatment_id}/tag_hurt", tag_body, untag),
+        Route('treatment-tag-hurt', 'delete', f"/treatments/{data.treatment_id}/tag_hurt", tag_body, tag),
+        Route('healing-list', 'get', f"/healings?patient_id={data.patient_id}&cursor=&page_size={{page_size}}"),
+        Route('healing-detail', 'get', f"/healings/{data.healing_id}"),
+        Route('hurt-list', 'get', "/hurts?cursor=&page_size={page_size}"),
+        Route('hurt-list', 'get', "/hurts?stream=1"),
+        Route('hurt-detail', 'get', f"/hurts/{data.hurt_id}"),
+        Route('hurt-trend', 'get', f"/hurts/{data.hurt_id}/trend?interval=week"),
+        Route('profile-trend', 'get', f"/profiles/{data.patient_id}/trend"),
+        Route('hurt-history', 'get', f"/hurts/{data.hurt_id}/history?cursor=&page_size={{page_size}}"),
+        Route('update-list', 'get', "/updates?cursor=&page_size={page_size}"),
+        Route('update-list', 'get', "/updates?stream=1"),
+        Route('update-detail', 'get', f"/updates/{data.update_id}"),
+        Route('patient-detail', 'get', f"/patients/{data.patient_id}?cursor=&limit={{page_size}}"),
+        Route('profile-snapshot', 'get', f"/profiles/{data.patient_id}/snapshot"),
+        Route('batch-list', 'post', "/batch", lambda: {'requests': [
+            {'path': f"/patients/{data.patient_id}"}, {'path': f"/hurts?patient_id={data.patient_id}"},
+            {'path': f"/healings?patient_id={data.patient_id}"}, {'path': "/treatments?owner=1"},
+            {'path': "/bodyparts"}, {'path': "/treatmenttypes"}, {'path': f"/profiles/{data.patient_id}/snapshot"}]}),
+        Route('hurt-list', 'post', "/hurts", lambda: {
+            'name': "benchmark hurt", 'is_active': True, 'bodypart_id': data.bodypart_id,
+            'treatment_ids': [data.treatment_id], 'pain_level': 5, 'notes': "benchmark notes"}),
+        Route('update-list', 'post', "/updates", lambda: {
+            'hurt_id': data.hurt_id, 'notes': "benchmark update", 'pain_level': 3}),
+        Route('healing-list', 'post', "/healings", lambda: {
+            'notes': "benchmark healing", 'duration': 600, 'intensity': 50,
+            'treatment_ids': [data.treatment_id], 'hurt_ids': [data.hurt_id]}),
+        Route('update-bulk', 'post', "/updates/bulk", lambda: {'updates': [
+            {'hurt_id': data.hurt_id, 'notes': f"benchmark check-in {index}", 'pain_level': index}
+            for index in range(10)]}),
+        Route('healing-bulk', 'post', "/healings/bulk", lambda: {'healings': [
+            {'notes': f"benchmark healing {index}", 'duration': 600, 'intensity': 50,
+             'treatment_ids': [data.treatment_id], 'hurt_ids': [data.hurt_id]} for index in range(10)]}),
+        Route('treatment-list', 'post', "/treatments", lambda: {
+            'name': "benchmark treatment", 'bodypart_id': data.bodypart_id,
+            'treatmenttype_id': data.treatmenttype_id, 'notes': "benchmark notes", 'public': True,
+            'hurt_ids': [data.hurt_id], 'treatment_links': []}),
+    ]
+
+
+def registered_routes():
+    """ The names of the API routes in whereithurts/urls.py the benchmark has to cover """
+    from whereithurts.urls import router, urlpatterns
+    names = {pattern.name for pattern in router.urls}
+    names |= {str(pattern.pattern) for pattern in urlpatterns if str(pattern.pattern) in ('login', 'register')}
+    return names
+
+
+def measure(client, route, url, repeat):
+    """ Make a route's request `repeat` times, returning its status, query count, timings and size """
+    def request():
+        if route.before is not None:
+            route.before()
+        kwargs = {'data': route.body(), 'format': 'json'} if route.body is not None else {}
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = getattr(client, route.method)(url, **kwargs)
+            content = b''.join(response.streaming_content) if response.streaming else response.content
+            elapsed = time.perf_counter() - start
+        return response, content, len(queries), elapsed
+
+    # one request first so the token is cached like it would be on a client's later requests
+    request()
+    timings = []
+    for _ in range(repeat):
+        response, content, queries, elapsed = request()
+        timings.append(elapsed)
+    return response.status_code, queries, timings, len(content)
+
+
+def run_benchmark(data, repeat=5, page_size=PAGE_SIZE):
+    """ Request every route and return (results, failures)
+
+    failures lists the list routes whose query count grew with the page size, routes that
+    errored, and registered routes the benchmark didn't request
+    """
+    # SERVER_NAME keeps the test client's host inside ALLOWED_HOSTS outside of the test runner
+    client = APIClient(SERVER_NAME='localhost')
+    client.credentials(HTTP_AUTHORIZATION='Token ' + data.token)
+
+    benchmarked = routes(data)
+    results = []
+    failures = []
+    for route in benchmarked:
+        sizes = (1, page_size) if '{page_size}' in route.url else (None,)
+        measured = []
+        for size in sizes:
+            url = route.url.format(page_size=size) if size is not None else route.url
+            status_code, queries, timings, content_size = measure(client, route, url, repeat)
+            result = RouteResult(route.name, route.method.upper(), url, status_code, queries, timings, content_size)
+            results.append(result)
+            measured.append(result)
+            if status_code >= 400:
+                failures.append(f"{result.method} {url} returned {status_code}")
+
+        if len(measured) == 2 and measured[1].queries > measured[0].queries:
+            failures.append(f"{route.method.upper()} {route.name} ran {measured[0].queries} queries for a page "
+                            f"of 1 but {measured[1].queries} for a page of {page_size}")
+
+    missing = registered_routes() - {route.name for route in benchmarked}
+    failures += [f"route {name} is not benchmarked" for name in sorted(missing)]
+    return results, failures
+
+
+def async_read_routes(data):
+    """ The reads with async versions, as (name, url, async url), requested with the ids in data """
+    return [
+        ('hurt-detail', f"/hurts/{data.hurt_id}", f"/async/hurts/{data.hurt_id}"),
+        ('patient-detail', f"/patients/{data.patient_id}?limit={PAGE_SIZE}",
+         f"/async/patients/{data.patient_id}?limit={PAGE_SIZE}"),
+        ('profile-snapshot', f"/profiles/{data.patient_id}/snapshot?days=30",
+         f"/async/profiles/{data.patient_id}/snapshot?days=30"),
+    ]
+
+
+def run_async_benchmark(data, concurrency=CONCURRENCY, rounds=5, query_latency=0):
+    """ Request each read and its async version in rounds of `concurrency` requests at once,
+    and return (results, failures)
+
+    Both go through the ASGI handler. The viewsets are sync, so Django runs them one at a
+    time on its thread for sync code, the way a WSGI worker serves one request at a time;
+    the async versions wait on their reads in the read pool instead, so other requests are
+    served meanwhile. Each request's latency includes the time it waited for its turn, and
+    wall is the time every round took in total.
+
+    SQLite answers from the same process, so queries hardly wait on anything and serializing
+    (which holds the GIL) dominates; query_latency adds that many seconds to every query,
+    as a database across a network would, to show what overlapping the waits saves.
+
+    Views read from their own threads here, so data must be committed.
+    """
+    delay = _QueryLatency(query_latency)
+    if query_latency:
+        connection_created.connect(delay.install)
+    try:
+        # the async test client always sends Host: testserver
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            return asyncio.run(_run_async_benchmark(data, concurrency, rounds))
+    finally:
+        connection_created.disconnect(delay.install)
+        delay.uninstall()
+
+
+class _QueryLatency:
+    """ An execute wrapper that makes every query wait `seconds` first, installed on each
+    connection as it is made """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.connections = []
+
+    def install(self, sender, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+            self.connections.append(connection)
+
+    def uninstall(self):
+        # pool threads keep their connection objects, and their execute wrappers with them
+        for connection in self.connections:
+            connection.execute_wrappers.remove(self)
+
+    def __call__(self, execute, sql, params, many, context):
+        time.sleep(self.seconds)
+        return execute(sql, params, many, context)
+
+
+async def _run_async_benchmark(data, concurrency, rounds):
+    client = AsyncClient()
+    authorization = 'Token ' + data.token
+
+    async def request(url):
+        start = time.perf_counter()
+        response = await client.get(url, authorization=authorization)
+        return response.status_code, time.perf_counter() - start
+
+    results = []
+    failures = []
+    for name, *urls in async_read_routes(data):
+        for url in urls:
+            # one request first so the token is cached and the read pool started
+            await request(url)
+            result = ConcurrentResult(name, url, concurrency, set())
+            start = time.perf_counter()
+            for _ in range(rounds):
+                for status_code, elapsed in await asyncio.gather(*(request(url) for _ in range(concurrency))):
+                    result.status_codes.add(status_code)
+                    result.timings.append(elapsed)
+            result.wall = time.perf_counter() - start
+            results.append(result)
+            failures += [f"GET {url} returned {status_code}" for status_code in sorted(result.status_codes)
+                         if status_code >= 400]
+    return results, failures
+
+
+def sqlite_write_stress(path, name, pragmas, conn_max_age, writers=8, writes_per_writer=50, readers=2):
+    """ Have `writers` threads each make check-in writes to a new SQLite file at path while
+    `readers` threads keep reading the rows back, and return a StressResult
+
+    A write is what POST /updates does to the database: one transaction that inserts an
+    update, refreshes its hurt's summary and bumps the patient's data version. Each thread
+    connects the way a worker does, through a Django connection with the given
+    CONN_MAX_AGE that gets `pragmas` (as settings.SQLITE_PRAGMAS) when it connects, and
+    gives up a connection that is too old after every write. Writes that fail with
+    "database is locked" are counted rather than retried.
+    """
+    # connections of its own, separate from the project's databases
+    handler = ConnectionHandler({DEFAULT_DB_ALIAS: {
+        'ENGINE': 'django.db.backends.sqlite3', 'NAME': path, 'CONN_MAX_AGE': conn_max_age}})
+    result = StressResult(name)
+    lock = threading.Lock()
+    writing = threading.Event()
+
+    def write(worker):
+        database = handler[DEFAULT_DB_ALIAS]
+        rng = random.Random(worker)
+        try:
+            for i in range(writes_per_writer):
+                hurt_id = rng.randrange(STRESS_HURTS)
+                pain_level = rng.randint(1, 10)
+                start = time.perf_counter()
+                try:
+                    with database.cursor() as cursor:
+                        cursor.execute('BEGIN')
+                        try:
+                            cursor.execute('INSERT INTO stress_update (hurt_id, pain_level, added_on) VALUES (%s, %s, %s)',
+                                           [hurt_id, pain_level, timezone.now().isoformat()])
+                            cursor.execute('UPDATE stress_hurt SET update_count = update_count + 1, last_pain_level = %s '
+                                           'WHERE id = %s', [pain_level, hurt_id])
+                            cursor.execute('UPDATE stress_patient SET data_version = data_version + 1 WHERE id = 1')
+                            cursor.execute('COMMIT')
+                        except OperationalError:
+                            cursor.execute('ROLLBACK')
+                            raise
+                except OperationalError as ex:
+                    if 'locked' not in str(ex):
+                        raise
+                    with lock:
+                        result.lock_errors += 1
+                else:
+                    with lock:
+                        result.writes += 1
+                        result.timings.append(time.perf_counter() - start)
+                database.close_if_unusable_or_obsolete()
+        finally:
+            database.close()
+
+    def read():
+        database = handler[DEFAULT_DB_ALIAS]
+        try:
+            while writing.is_set():
+                try:
+                    with database.cursor() as cursor:
+                        cursor.execute('SELECT hurt_id, COUNT(*), AVG(pain_level) FROM stress_update GROUP BY hurt_id')
+                        cursor.fetchall()
+                except OperationalError as ex:
+                    if 'locked' not in str(ex):
+                        raise
+                else:
+                    with lock:
+                        result.reads += 1
+                database.close_if_unusable_or_obsolete()
+        finally:
+            database.close()
+
+    with override_settings(SQLITE_PRAGMAS=pragmas):
+        database = handler[DEFAULT_DB_ALIAS]
+        with database.cursor() as cursor:
+            cursor.execute('CREATE TABLE stress_patient (id INTEGER PRIMARY KEY, data_version INTEGER NOT NULL)')
+            cursor.execute('CREATE TABLE stress_hurt (id INTEGER PRIMARY KEY, update_count INTEGER NOT NULL, '
+                           'last_pain_level INTEGER)')
+            cursor.execute('CREATE TABLE stress_update (id INTEGER PRIMARY KEY, hurt_id INTEGER NOT NULL, '
+                           'pain_level INTEGER NOT NULL, added_on TEXT NOT NULL)')
+            cursor.execute('INSERT INTO stress_patient VALUES (1, 0)')
+            for hurt_id in range(STRESS_HURTS):
+                cursor.execute('INSERT INTO stress_hurt VALUES (%s, 0, NULL)', [hurt_id])
+        database.close()
+
+        writing.set()
+        reader_threads = [threading.Thread(target=read) for _ in range(readers)]
+        writer_threads = [threading.Thread(target=write, args=(worker,)) for worker in range(writers)]
+        for thread in reader_threads:
+            thread.start()
+        start = time.perf_counter()
+        for thread in writer_threads:
+            thread.start()
+        for thread in writer_threads:
+            thread.join()
+        result.elapsed = time.perf_counter() - start
+        writing.clear()
+        for thread in reader_threads:
+            thread.join()
+    return result
+
+
+def run_sqlite_stress(directory, writers=8, writes_per_writer=50, readers=2):
+    """ sqlite_write_stress() on files in directory, first as the database was configured before
+    SQLITE_PRAGMAS (no pragmas, a connection per write), then with this project's settings """
+    from django.conf import settings
+    from whereithurtsapi.helpers.sqlite import SQLITE_PRAGMAS_DEFAULTS
+
+    untuned = {name: None for name in SQLITE_PRAGMAS_DEFAULTS}
+    tuned = getattr(settings, 'SQLITE_PRAGMAS', {})
+    conn_max_age = settings.DATABASES['default'].get('CONN_MAX_AGE', 0)
+    return [
+        sqlite_write_stress(os.path.join(directory, 'untuned.sqlite3'), 'untuned', untuned, 0,
+                            writers, writes_per_writer, readers),
+        sqlite_write_stress(os.path.join(directory, 'tuned.sqlite3'), 'tuned', tuned, conn_max_age,
+                            writers, writes_per_writer, readers),
+    ]
+
+
+def benchmark_serializers(repeat=20):
+    """ Time each hot read serializer against its compiled counterpart on rows already in memory
+
+    Returns (serializer name, rows, DRF ms per pass, compiled ms per pass) for each
+    """
+    from whereithurtsapi.views import Healing as healing_views, Hurt as hurt_views
+    from whereithurtsapi.views import Treatment as treatment_views, Update as update_views
+
+    context = {'request': None}
+    cases = [
+        (hurt_views.HurtSerializer, list(hurt_views.hurt_queryset())),
+        (update_views.UpdateSerializer, list(Update.objects.select_related('hurt').annotate(
+            _previous_pain_level=update_views.previous_pain_level()))),
+        (healing_views.SimpleHealingSerializer, list(Healing.objects.prefetch_related(
+            'healing_treatments__treatment', 'hurt_healings__hurt'))),
+        (treatment_views.TreatmentSerializer, list(treatment_views.treatment_queryset())),
+    ]
+
+    timings = []
+    for serializer_class, rows in cases:
+        compiled_serializer = compiled(serializer_class)
+        drf = _best_of(repeat, lambda: serializer_class(rows, many=True, context=context).data)
+        fast = _best_of(repeat, lambda: compiled_serializer.serialize(rows, context, many=True))
+        timings.append((serializer_class.__name__, len(rows), drf * 1000, fast * 1000))
+    return timings
+
+
+def _best_of(repeat, function):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def serializer_report(timings):
+    """ Format benchmark_serializers() timings as a table """
+    lines = [f"{'serializer':<26}{'rows':>7}{'drf ms':>10}{'compiled ms':>13}{'speedup':>9}"]
+    for name, rows, drf, fast in timings:
+        lines.append(f"{name:<26}{rows:>7}{drf:>10.2f}{fast:>13.2f}{drf / fast:>8.1f}x")
+    return "\n".join(lines)
+
+
+def report(results):
+    """ Format results as a table """
+    lines = [f"{'method':<7}{'url':<60}{'status':>7}{'queries':>9}{'p50 ms':>9}{'p95 ms':>9}{'bytes':>9}"]
+    for result in results:
+        url = result.url if len(result.url) <= 58 else result.url[:55] + '...'
+        lines.append(f"{result.method:<7}{url:<60}{result.status_code:>7}{result.queries:>9}"
+                     f"{result.p50:>9.2f}{result.p95:>9.2f}{result.size:>9}")
+    return "\n".join(lines)
+
+
+def async_report(results):
+    """ Format run_async_benchmark() results as a table, with each async url's speedup over
+    the url before it """
+    lines = [f"{'url':<60}{'requests':>9}{'p50 ms':>9}{'p95 ms':>9}{'wall ms':>10}{'speedup':>9}"]
+    previous = None
+    for result in results:
+        url = result.url if len(result.url) <= 58 else result.url[:55] + '...'
+        speedup = f"{previous.wall / result.wall:>8.1f}x" if result.url.startswith('/async/') and previous else ''
+        lines.append(f"{url:<60}{len(result.timings):>9}{result.p50:>9.2f}{result.p95:>9.2f}"
+                     f"{result.wall * 1000:>10.2f}{speedup}")
+        previous = result
+    return "\n".join(lines)
+
+
+def stress_report(results):
+    """ Format sqlite_write_stress() results as a table """
+    lines = [f"{'config':<10}{'writes':>8}{'locked':>8}{'reads':>8}{'writes/s':>10}{'p95 ms':>9}"]
+    for result in results:
+        lines.append(f"{result.name:<10}{result.writes:>8}{result.lock_errors:>8}{result.reads:>8}"
+                     f"{result.throughput:>10.1f}{result.p95:>9.2f}")
+    return "\n".join(lines)
@@ -1 +1,20 @@
-from .paginate import paginate
\ No newline at end of file
+from .paginate import (SortedEntries, annotated_ordering_values, cursor_ordering, ordering_annotations, ordering_values,
+                       paginate, paginate_by_cursor, paginate_merged_request, paginate_request, paginate_union_by_cursor)
+from .ownership import requesting_patient, with_owner
+from .relationships import resolve_ids, sync_links
+from .activity import activity_for, record_activity
+from .rollups import refresh_daily_rollup, refresh_healing_rollup, rollup_day
+from .search import index_treatment, query_terms, reindex_treatments, search_treatments
+from .streaming import stream_json_array, streaming_list_response, wants_stream
+from .compiled import compiled
+from .request_cache import request_cache, share_request_cache
+from .versions import data_version_etag, not_modified, related_patients, touch_patients, with_etag
+from .treatment_cache import get_public_treatment_cache, treatments_changed
+from .reference import REFERENCE_MAX_AGE, ReferenceField, get_reference_registry, reference_data_changed
+from .icons import IconVariantsField, build_icon_variants, icon_manifest, read_icon_manifest, write_icon_manifest
+from .bulk import BulkItemError, bulk_items, bulk_results, idempotency_keys, insert_keyed, item_added_on, item_ids, item_notes, item_value, plan_bulk_create
+from .trends import pain_trend, trend_options
+from .effectiveness import score_treatments
+from .async_reads import get_read_pool, read
+from .sqlite import sqlite_pragmas, tune_sqlite_connection
+from .replicas import get_replica_pins, pin_to_primary, reads_from_primary, reads_from_replica, replica_action, replicate_sqlite
@@ -0,0 +1,22 @@
+from whereithurtsapi.models import Activity
+
+
+def activity_for(instance):
+    """ Build the (unsaved) Activity log entry for a newly added Hurt, Update, Healing or Treatment """
+    activity_type = type(instance).__name__
+    if activity_type == 'Update':
+        patient_id = instance.hurt.patient_id
+    elif activity_type == 'Treatment':
+        patient_id = instance.added_by_id
+    else:
+        patient_id = instance.patient_id
+
+    return Activity(patient_id=patient_id, activity_type=activity_type,
+                    added_on=instance.added_on, **{activity_type.lower(): instance})
+
+
+def record_activity(instance):
+    """ Append a newly added Hurt, Update, Healing or Treatment to its patient's activity log """
+    activity = activity_for(instance)
+    activity.save()
+    return activity
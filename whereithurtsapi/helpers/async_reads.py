@@ -0,0 +1,51 @@
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import close_old_connections
+
+# defaults for settings.ASYNC_READS
+ASYNC_READS_DEFAULTS = {
+    # most database reads the async views run at once, across every request in the process
+    'MAX_WORKERS': 4,
+}
+
+_read_pool = None
+_read_pool_lock = threading.Lock()
+
+
+def get_read_pool():
+    """ The process-wide thread pool async views run their reads in, built from
+    settings.ASYNC_READS on first use """
+    global _read_pool
+    if _read_pool is None:
+        with _read_pool_lock:
+            if _read_pool is None:
+                options = {**ASYNC_READS_DEFAULTS, **getattr(settings, 'ASYNC_READS', {})}
+                _read_pool = ThreadPoolExecutor(max_workers=options['MAX_WORKERS'], thread_name_prefix='async-read')
+    return _read_pool
+
+
+def _run_read(func, args, kwargs):
+    try:
+        return func(*args, **kwargs)
+    finally:
+        # pool threads outlive requests, so they don't get request_finished to clean up after them
+        close_old_connections()
+
+
+async def read(func, *args, **kwargs):
+    """ Run a blocking read, e.g. a query and the serializing of its rows, in the read pool
+
+    This is sync_to_async with a bounded pool: every call may run on a different thread
+    with its own database connection, so independent reads awaited together with
+    asyncio.gather run concurrently, and at most ASYNC_READS['MAX_WORKERS'] of them
+    at a time. func should return plain data, since lazy querysets and relations
+    can't be evaluated back on the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        get_read_pool(), functools.partial(context.run, _run_read, func, args, kwargs))
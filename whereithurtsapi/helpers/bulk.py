@@ -0,0 +1,159 @@
+import uuid
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework import status
+
+# most items one bulk request may carry
+MAX_BULK_ITEMS = 500
+# longest idempotency key a client may send, matching the models' idempotency_key columns
+IDEMPOTENCY_KEY_LENGTH = 64
+
+
+class BulkItemError(Exception):
+    """ One item of a bulk request can't be created; the message and status are its result """
+
+    def __init__(self, message, status_code=status.HTTP_400_BAD_REQUEST):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+def bulk_items(data, name):
+    """ The list of item objects under name in a bulk request's body, e.g. data["updates"];
+    raises ValueError if it is missing, malformed or too long """
+    items = data.get(name, None) if isinstance(data, dict) else None
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        raise ValueError(f'{name} must be a list of objects')
+    if len(items) > MAX_BULK_ITEMS:
+        raise ValueError(f'at most {MAX_BULK_ITEMS} {name} can be created at once')
+    return items
+
+
+def idempotency_keys(items):
+    """ The well-formed idempotency keys sent with items, to look up the ones already imported """
+    return {item['idempotency_key'] for item in items
+            if isinstance(item.get('idempotency_key', None), str) and 0 < len(item['idempotency_key']) <= IDEMPOTENCY_KEY_LENGTH}
+
+
+def item_value(item, name, kind, default=None):
+    """ An item's value for name, checked to be a kind (int or str); default if it is left out,
+    or a BulkItemError if it is required (default None) """
+    value = item.get(name, default)
+    if value is None:
+        raise BulkItemError(f'{name} is required')
+    # bools are ints to isinstance, but not pain levels or durations
+    if not isinstance(value, kind) or (kind is int and isinstance(value, bool)):
+        raise BulkItemError(f'{name} must be {"a whole number" if kind is int else "a string"}')
+    return value
+
+
+def item_notes(item, max_length):
+    notes = item_value(item, 'notes', str)
+    if len(notes) > max_length:
+        raise BulkItemError(f'notes can be at most {max_length} characters')
+    return notes
+
+
+def item_ids(item, name):
+    """ A list of ids in an item, e.g. its treatment_ids """
+    ids = item_value(item, name, list, [])
+    if not all(isinstance(pk, int) and not isinstance(pk, bool) for pk in ids):
+        raise BulkItemError(f'{name} must be a list of ids')
+    return list(dict.fromkeys(ids))
+
+
+def item_added_on(item):
+    """ When an item was logged, e.g. "2021-01-05T08:00:00Z" for a check-in made offline; now if
+    it is left out, and in the current timezone if it has no offset """
+    value = item.get('added_on', None)
+    if value is None:
+        return timezone.now()
+    added_on = parse_datetime(value) if isinstance(value, str) else None
+    if added_on is None:
+        raise BulkItemError('added_on must be an ISO 8601 date and time')
+    if timezone.is_naive(added_on):
+        added_on = timezone.make_aware(added_on)
+    if added_on > timezone.now():
+        raise BulkItemError('added_on can not be in the future')
+    return added_on
+
+
+def plan_bulk_create(items, imported, build, scope=None):
+    """ Validate every item of a bulk request and build the rows it creates
+
+    imported maps the idempotency keys of rows created by earlier requests to their ids;
+    those items are replays, answered with the existing id instead of creating a row again.
+    build(item) returns an item's unsaved row or raises BulkItemError.
+
+    When keys are unique within something narrower than the request, e.g. an update's
+    hurt, scope(item) returns what an item's key is unique within and imported maps
+    (key, scope) pairs instead. A key already used within another scope, earlier or in
+    the same request, fails its item rather than being taken for a replay.
+
+    Returns (rows, results): the rows to create by idempotency key (generated for items
+    sent without one) and a result per item. If any item failed, rows is empty and the
+    other new items' results say they weren't created.
+    """
+    rows = {}
+    results = []
+    # the scope each key was used within, by earlier requests or this one
+    used = {} if scope is None else {key: key_scope for key, key_scope in imported}
+    for item in items:
+        key = item.get('idempotency_key', None)
+        try:
+            if key is not None and (not isinstance(key, str) or not 0 < len(key) <= IDEMPOTENCY_KEY_LENGTH):
+                raise BulkItemError(f'idempotency_key must be a string of 1 to {IDEMPOTENCY_KEY_LENGTH} characters')
+            item_scope = None if scope is None else scope(item)
+            imported_key = key if scope is None else (key, item_scope)
+            if imported_key in imported:
+                results.append({'status': status.HTTP_200_OK, 'id': imported[imported_key], 'idempotency_key': key})
+            elif scope is not None and key in used and used[key] != item_scope:
+                raise BulkItemError('idempotency_key was already used for another item', status.HTTP_422_UNPROCESSABLE_ENTITY)
+            elif key in rows:
+                # the same item sent twice in one request is created once
+                results.append({'status': status.HTTP_200_OK, 'idempotency_key': key})
+            else:
+                key = key or uuid.uuid4().hex
+                rows[key] = build(item)
+                used[key] = item_scope
+                results.append({'status': status.HTTP_201_CREATED, 'idempotency_key': key})
+        except BulkItemError as ex:
+            results.append({'status': ex.status_code, 'message': ex.message})
+
+    if any(result['status'] >= status.HTTP_400_BAD_REQUEST for result in results):
+        for result in results:
+            if result.get('idempotency_key', None) in rows:
+                result.clear()
+                result.update(status=status.HTTP_424_FAILED_DEPENDENCY, message='not created because another item failed')
+        return {}, results
+    return rows, results
+
+
+def insert_keyed(model, rows, unique_with):
+    """ bulk_create the rows planned by plan_bulk_create, then give each its primary key
+
+    Backends that can't return the keys of bulk inserted rows (e.g. SQLite) have them read
+    back in one query, by idempotency key and the field the model's keys are unique with,
+    e.g. 'patient'. Call inside transaction.atomic().
+    """
+    for key, row in rows.items():
+        row.idempotency_key = key
+    model.objects.bulk_create(rows.values())
+
+    if any(row.pk is None for row in rows.values()):
+        attname = model._meta.get_field(unique_with).attname
+        scopes = {getattr(row, attname) for row in rows.values()}
+        ids = {(key, key_scope): pk for key, key_scope, pk in model.objects
+               .filter(idempotency_key__in=rows, **{f'{attname}__in': scopes})
+               .values_list('idempotency_key', attname, 'id')}
+        for key, row in rows.items():
+            row.pk = ids[key, getattr(row, attname)]
+
+
+def bulk_results(rows, results):
+    """ Fill in the ids of the created rows, once they have them, in their items' results """
+    for result in results:
+        key = result.get('idempotency_key', None)
+        if key in rows:
+            result['id'] = rows[key].pk
+    return results
@@ -0,0 +1,197 @@
+from datetime import datetime
+from functools import partial
+from django.conf import settings
+from django.utils import timezone
+from django.core.exceptions import ImproperlyConfigured, ObjectDoesNotExist
+from django.db import models
+from rest_framework import ISO_8601
+from rest_framework.fields import DateTimeField, FileField, ReadOnlyField, SkipField, empty, get_attribute
+from rest_framework.relations import HyperlinkedRelatedField, ManyRelatedField, PrimaryKeyRelatedField
+from rest_framework.serializers import BaseSerializer, ListSerializer, SerializerMethodField
+from rest_framework.settings import api_settings
+
+# how a compiled field turns the value it read into its representation
+IDENTITY, SIMPLE, WITH_CONTEXT = range(3)
+# context key the current timezone is passed down to nested serializers under
+TIMEZONE = '_compiled_timezone'
+
+_compiled = {}
+
+
+def compiled(serializer_class):
+    """ The CompiledSerializer for a serializer class, compiled the first time it is asked for """
+    if serializer_class not in _compiled:
+        _compiled[serializer_class] = CompiledSerializer(serializer_class())
+    return _compiled[serializer_class]
+
+
+class CompiledSerializer:
+    """ A read-only stand-in for a DRF serializer that produces the same output
+
+    DRF resolves each field's source, checks for SkipField and PKOnlyObject and builds
+    an OrderedDict for every object it serializes. Here a serializer's fields, and
+    those of the serializers nested in it, are looked at once, and each is compiled
+    to an accessor and a converter, so serializing an object is one pass over a list
+    of precompiled steps.
+
+    Fields that need the serializer instance or anything but the request from the
+    context (method fields, hyperlinked fields) can't be compiled.
+    """
+
+    def __init__(self, serializer):
+        self.serializer_class = type(serializer)
+        self.fields = [_compile_field(field) for field in serializer._readable_fields]
+
+    def to_representation(self, instance, context=None):
+        return self._represent(instance, _with_timezone(context))
+
+    def _represent(self, instance, context):
+        ret = {}
+        for name, get, kind, convert, missing in self.fields:
+            try:
+                value = get(instance)
+            except (KeyError, AttributeError):
+                value = missing()
+                if value is SkipField:
+                    continue
+
+            if value is None or kind == IDENTITY:
+                ret[name] = value
+            elif kind == SIMPLE:
+                ret[name] = convert(value)
+            else:
+                ret[name] = convert(value, context)
+        return ret
+
+    def serialize(self, data, context=None, many=False):
+        """ Serialize one instance, or with many=True an iterable (or related manager) of them """
+        if many:
+            return self._many(data, _with_timezone(context))
+        return self.to_representation(data, context)
+
+    def bind(self, context):
+        """ A one-argument function serializing instances with this context, e.g. for streaming """
+        return partial(self.to_representation, context=context)
+
+    def _many(self, data, context):
+        iterable = data.all() if isinstance(data, models.Manager) else data
+        return [self._represent(item, context) for item in iterable]
+
+
+def _compile_field(field):
+    """ (name, accessor, kind, converter, on_missing) for one bound serializer field """
+    if isinstance(field, (SerializerMethodField, HyperlinkedRelatedField)) or (
+            isinstance(field, ManyRelatedField) and isinstance(field.child_relation, HyperlinkedRelatedField)):
+        raise ImproperlyConfigured(
+            f"{type(field).__name__} `{field.field_name}` on {type(field.parent).__name__} can't be compiled")
+
+    get = _accessor(field)
+
+    if isinstance(field, ListSerializer):
+        kind, convert = WITH_CONTEXT, CompiledSerializer(field.child)._many
+    elif isinstance(field, BaseSerializer):
+        kind, convert = WITH_CONTEXT, CompiledSerializer(field)._represent
+    elif isinstance(field, PrimaryKeyRelatedField) and field.pk_field is None:
+        # the accessor already reads the primary key, which is its own representation
+        kind, convert = IDENTITY, None
+    elif callable(getattr(field, 'represent', None)):
+        # fields like ReferenceField that represent a value with the context passed in
+        kind, convert = WITH_CONTEXT, field.represent
+    elif isinstance(field, FileField):
+        kind, convert = WITH_CONTEXT, partial(
+            _file_representation, getattr(field, 'use_url', api_settings.UPLOADED_FILES_USE_URL))
+    elif type(field) is DateTimeField and not hasattr(field, 'timezone') and \
+            getattr(field, 'format', api_settings.DATETIME_FORMAT) == ISO_8601:
+        kind, convert = WITH_CONTEXT, partial(_datetime_representation, field)
+    elif type(field) is ReadOnlyField:
+        kind, convert = IDENTITY, None
+    else:
+        kind, convert = SIMPLE, field.to_representation
+
+    return field.field_name, get, kind, convert, partial(_missing, field)
+
+
+def _accessor(field):
+    """ A function reading a field's value off an instance, like field.get_attribute() """
+    source_attrs = field.source_attrs
+    if source_attrs == []:
+        return lambda instance: instance
+
+    if isinstance(field, PrimaryKeyRelatedField) and field.use_pk_only_optimization() and field.pk_field is None:
+        # like RelatedField.get_attribute, read the foreign key column instead of loading the related row
+        owner_attrs, name = source_attrs[:-1], source_attrs[-1]
+
+        def get_pk(instance):
+            try:
+                value = get_attribute(instance, owner_attrs).serializable_value(name)
+            except AttributeError:
+                return _pk(get_attribute(instance, source_attrs))
+            if callable(value):
+                value = value()
+            return getattr(value, 'pk', value)
+        return get_pk
+
+    if len(source_attrs) == 1:
+        name = source_attrs[0]
+
+        def get_one(instance):
+            try:
+                value = getattr(instance, name)
+            except ObjectDoesNotExist:
+                return None
+            if callable(value) and not isinstance(value, models.Manager):
+                return get_attribute(instance, source_attrs)
+            return value
+        return get_one
+
+    return lambda instance: get_attribute(instance, source_attrs)
+
+
+def _pk(value):
+    return value.pk if value is not None else None
+
+
+def _missing(field):
+    """ What Field.get_attribute() falls back to when the source isn't there; SkipField leaves the key out """
+    if field.default is not empty:
+        return field.get_default()
+    if field.allow_null:
+        return None
+    if not field.required:
+        return SkipField
+    raise AttributeError(f"`{field.field_name}` is missing from the instance serialized by {type(field.parent).__name__}")
+
+
+def _with_timezone(context):
+    """ The context with the current timezone added, so datetimes are converted to it without
+    looking it up for every value """
+    if context is not None and TIMEZONE in context:
+        return context
+    return {**(context or {}), TIMEZONE: timezone.get_current_timezone() if settings.USE_TZ else None}
+
+
+def _datetime_representation(field, value, context):
+    """ DateTimeField.to_representation for ISO 8601 output, using the timezone in the context """
+    current_timezone = context[TIMEZONE]
+    if current_timezone is not None and isinstance(value, datetime) and timezone.is_aware(value):
+        value = value.astimezone(current_timezone).isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+    return field.to_representation(value)
+
+
+def _file_representation(use_url, value, context):
+    """ FileField.to_representation, reading the request from the context passed in """
+    if not value:
+        return None
+    if use_url:
+        try:
+            url = value.url
+        except AttributeError:
+            return None
+        request = context.get('request', None)
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+    return value.name
@@ -0,0 +1,67 @@
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import DateTimeField, ExpressionWrapper, OuterRef, Subquery
+from django.utils import timezone
+from whereithurtsapi.models import HurtHealing, TreatmentScore, Update
+from .treatment_cache import treatments_changed
+
+# days after a healing the pain level of its hurts is compared over
+EFFECTIVENESS_WINDOW_DAYS = 3
+# decimal places scores are stored with
+EFFECTIVENESS_PRECISION = 3
+
+
+def healing_weight(duration, intensity):
+    """ How much one healing counts towards its treatments' scores: its minutes, and up
+    to twice that at full intensity (intensity goes from 0 to 100) """
+    return duration / 60 * (1 + max(0, min(intensity, 100)) / 100)
+
+
+def healing_outcomes(window_days=EFFECTIVENESS_WINDOW_DAYS):
+    """ A values() queryset with a row for every treatment used by a healing of a hurt:
+    treatment_id, duration, intensity, and the hurt's pain level before the healing (its last
+    update up to then) and after it (its last update in the window_days after it)
+
+    Each pain level is read by a subquery on the update_hurt_added_on index, so the rows
+    cost one query however many updates the hurts have.
+    """
+    updates = Update.objects.filter(hurt_id=OuterRef('hurt_id')).order_by('-added_on', '-id').values('pain_level')
+    window_end = ExpressionWrapper(OuterRef('healing__added_on') + timedelta(days=window_days),
+                                   output_field=DateTimeField())
+    return HurtHealing.objects.filter(healing__healing_treatments__isnull=False).annotate(
+        pain_before=Subquery(updates.filter(added_on__lte=OuterRef('healing__added_on'))[:1]),
+        pain_after=Subquery(updates.filter(added_on__gt=OuterRef('healing__added_on'),
+                                           added_on__lte=window_end)[:1]),
+    ).values_list('healing__healing_treatments__treatment_id', 'healing__duration', 'healing__intensity',
+                  'pain_before', 'pain_after')
+
+
+def score_treatments(window_days=EFFECTIVENESS_WINDOW_DAYS):
+    """ Recompute every TreatmentScore from the healings that used each treatment
+
+    A treatment's effectiveness is the weighted average of how much the pain level of each
+    hurt it was used for dropped from before a healing to the last update in the window
+    after it; healings of hurts without an update on both sides don't count. Returns the
+    number of treatments scored.
+    """
+    totals = {}
+    for treatment_id, duration, intensity, pain_before, pain_after in healing_outcomes(window_days).iterator():
+        if pain_before is None or pain_after is None:
+            continue
+        weight = healing_weight(duration, intensity)
+        total = totals.setdefault(treatment_id, [0, 0, 0])
+        total[0] += weight * (pain_before - pain_after)
+        total[1] += weight
+        total[2] += 1
+
+    scored_on = timezone.now()
+    scores = [TreatmentScore(treatment_id=treatment_id, samples=samples, scored_on=scored_on,
+                             effectiveness=round(weighted / weights if weights else 0, EFFECTIVENESS_PRECISION))
+              for treatment_id, (weighted, weights, samples) in totals.items()]
+
+    with transaction.atomic():
+        TreatmentScore.objects.all().delete()
+        TreatmentScore.objects.bulk_create(scores)
+        # the cached public lists are ordered and serialized with the old scores
+        treatments_changed()
+    return len(scores)
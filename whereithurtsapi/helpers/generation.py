@@ -0,0 +1,38 @@
+import threading
+import time
+from django.core.cache import caches
+
+
+class Generation:
+    """ A counter that moves on whenever the data something was built from changes, so
+    anything stamped with an older value is known to be stale
+
+    When a shared cache alias is given the counter is kept in that Django cache, so a
+    bump in one worker process is seen by every other; otherwise it is per process.
+    """
+
+    def __init__(self, name, shared_cache=None):
+        self.shared_key = f"generation:{name}"
+        self.shared_cache = caches[shared_cache] if shared_cache else None
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def current(self):
+        if self.shared_cache is None:
+            return self._value
+        value = self.shared_cache.get(self.shared_key)
+        if value is None:
+            # start from the clock rather than 0, so values handed out before the shared
+            # cache lost the counter can't become current again
+            self.shared_cache.add(self.shared_key, int(time.time() * 1000000), None)
+            value = self.shared_cache.get(self.shared_key)
+        return value
+
+    def bump(self):
+        with self._lock:
+            self._value += 1
+        if self.shared_cache is not None:
+            try:
+                self.shared_cache.incr(self.shared_key)
+            except ValueError:
+                self.shared_cache.add(self.shared_key, int(time.time() * 1000000), None)
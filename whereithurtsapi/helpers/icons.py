@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+from io import BytesIO
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from rest_framework.fields import Field
+
+# widths (and heights) in pixels of the square variants built for every icon
+ICON_SIZES = (32, 64, 128)
+# formats of each variant, with the options they are encoded with
+ICON_FORMATS = {
+    'png': {'format': 'PNG', 'optimize': True},
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 6},
+}
+# where variants and their manifest are stored, relative to MEDIA_ROOT
+VARIANT_DIRECTORY = 'icons/variants'
+MANIFEST_NAME = f'{VARIANT_DIRECTORY}/manifest.json'
+# characters of a content hash put in a file name
+HASH_LENGTH = 12
+# seconds a variant may be cached; its URL changes whenever its content does
+ICON_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def content_hash(content):
+    return hashlib.sha256(content).hexdigest()[:HASH_LENGTH]
+
+
+def build_icon_variants(name, manifest_entry=None):
+    """ Resize the icon stored as name to every ICON_SIZES square in every ICON_FORMATS,
+    saving each under a name carrying the hash of its content, e.g.
+    icons/variants/knee.64.3f2a9c0d1b7e.webp
+
+    Returns the icon's manifest entry: the hash of the source and the name of each
+    variant by size and format. When the given previous entry was built from the same
+    source and its files all exist, it is returned as is.
+    """
+    from PIL import Image
+
+    with default_storage.open(name, 'rb') as source_file:
+        source = source_file.read()
+    source_hash = content_hash(source)
+    if manifest_entry is not None and manifest_entry['source'] == source_hash and all(
+            default_storage.exists(variant) for variants in manifest_entry['variants'].values()
+            for variant in variants.values()):
+        return manifest_entry
+
+    image = Image.open(BytesIO(source))
+    image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+    stem = os.path.splitext(os.path.basename(name))[0]
+
+    variants = {}
+    for size in ICON_SIZES:
+        resized = image.copy()
+        # keep the aspect ratio and never scale up; icons are square, so the result usually is too
+        resized.thumbnail((size, size), Image.LANCZOS)
+        variants[str(size)] = {}
+        for extension, options in ICON_FORMATS.items():
+            encoded = BytesIO()
+            resized.save(encoded, **options)
+            content = encoded.getvalue()
+            variant = f'{VARIANT_DIRECTORY}/{stem}.{size}.{content_hash(content)}.{extension}'
+            if not default_storage.exists(variant):
+                default_storage.save(variant, ContentFile(content))
+            variants[str(size)][extension] = variant
+
+    return {'source': source_hash, 'variants': variants}
+
+
+def read_icon_manifest():
+    """ The manifest of icon variants by source name, or an empty one if none was built """
+    if not default_storage.exists(MANIFEST_NAME):
+        return {}
+    with default_storage.open(MANIFEST_NAME, 'rb') as manifest_file:
+        return json.loads(manifest_file.read().decode())
+
+
+def write_icon_manifest(manifest):
+    if default_storage.exists(MANIFEST_NAME):
+        default_storage.delete(MANIFEST_NAME)
+    default_storage.save(MANIFEST_NAME, ContentFile(json.dumps(manifest, indent=2, sort_keys=True).encode()))
+
+
+class IconManifest:
+    """ The manifest read by the serializers, read again when the file changes """
+
+    def __init__(self):
+        self._manifest = None
+        self._modified = None
+        self._version = None
+
+    def version(self):
+        """ A hash of the manifest's content, for ETags of responses carrying variant URLs """
+        self.get()
+        return self._version
+
+    def get(self):
+        try:
+            modified = default_storage.get_modified_time(MANIFEST_NAME) if default_storage.exists(MANIFEST_NAME) else None
+        except NotImplementedError:
+            # storages that can't tell when a file changed keep the manifest they read first
+            modified = self._modified
+        if self._manifest is None or modified != self._modified:
+            self._manifest = read_icon_manifest()
+            self._modified = modified
+            self._version = content_hash(json.dumps(self._manifest, sort_keys=True).encode())
+        return self._manifest
+
+
+icon_manifest = IconManifest()
+
+
+class IconVariantsField(Field):
+    """ The URLs of an image field's icon variants by size and format, e.g.
+    {"32": {"png": "http://.../knee.32.3f2a9c0d1b7e.png", "webp": ...}, "64": ...}
+
+    None when the image is empty or has no variants built yet (see build_icon_variants).
+    Variant names change with their content, so the URLs can be cached forever.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        return self.represent(value, self.context)
+
+    def represent(self, value, context):
+        entry = icon_manifest.get().get(value.name) if value else None
+        if entry is None:
+            return None
+
+        request = context.get('request', None)
+        variants = {}
+        for size, names in entry['variants'].items():
+            variants[size] = {}
+            for extension, name in names.items():
+                url = default_storage.url(name)
+                variants[size][extension] = request.build_absolute_uri(url) if request is not None else url
+        return variants
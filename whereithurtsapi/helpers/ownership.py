@@ -0,0 +1,29 @@
+from django.db.models import BooleanField, ExpressionWrapper, Q, Value
+from whereithurtsapi.models import Patient
+
+
+def requesting_patient(request):
+    """ The Patient making this request, or None if the authenticated user has no Patient
+
+    The authentication backend loads the patient along with the token, so this
+    does not query the database
+    """
+    try:
+        return request.auth.user.patient
+    except (AttributeError, Patient.DoesNotExist):
+        return None
+
+
+def with_owner(queryset, request, patient_field='patient'):
+    """ Annotate each row of a queryset with the dynamic 'owner' flag clients use to
+    decide whether to show edit/delete controls, computed in SQL against the requesting
+    patient instead of comparing one row at a time
+
+    patient_field is the lookup from the queryset's model to the Patient that owns it,
+    e.g. 'added_by' for Treatments or 'hurt__patient' for Updates
+    """
+    patient = requesting_patient(request)
+    if patient is None:
+        return queryset.annotate(owner=Value(False, output_field=BooleanField()))
+    return queryset.annotate(owner=ExpressionWrapper(
+        Q(**{f'{patient_field}_id': patient.id}), output_field=BooleanField()))
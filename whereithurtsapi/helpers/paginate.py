@@ -1,4 +1,234 @@
+import base64
+import binascii
+import heapq
+import json
+from bisect import bisect_right
+from datetime import date, datetime
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import F, Model, Q
+from django.utils.dateparse import parse_date, parse_datetime
+
+# ordering used for cursor pages when the queryset being paged has none
+DEFAULT_CURSOR_ORDERING = ('-added_on', '-id')
+# largest page a cursor request can ask for
+MAX_PAGE_SIZE = 100
+# an estimated count stops counting rows once it reaches this many
+ESTIMATED_COUNT_CAP = 1000
+
+
 def paginate(collection, page, page_size):
+    return collection[_page_slice(page, page_size)]
+
+
+def count(queryset, estimate=False):
+    """ Count the rows of a (filtered) queryset with a COUNT(*) instead of loading them
+
+    When estimate is True, the count stops at ESTIMATED_COUNT_CAP rows so it
+    costs the same on huge result sets; the second value returned tells whether
+    the count was capped
+    """
+    if not estimate:
+        return queryset.count(), False
+
+    capped = queryset.order_by()[:ESTIMATED_COUNT_CAP].count()
+    return capped, capped >= ESTIMATED_COUNT_CAP
+
+
+def paginate_request(queryset, request):
+    """ Page a list view's queryset according to the request's query params
+
+    e.g. ?cursor=&page_size=20 for the first keyset page, then ?cursor=<next_cursor>;
+    ?page=3&page_size=20 for the older offset pages; ?count=estimate for a capped count.
+
+    Returns the rows to serialize and a dict with the count (and next_cursor
+    for cursor pages) to merge into the response
+    """
+    params = request.query_params
+    page_size = params.get('page_size', 10)
+
+    estimate = params.get('count', None) == 'estimate'
+    total, is_estimate = count(queryset, estimate)
+    page_info = {'count': total}
+    if estimate:
+        page_info['count_is_estimate'] = is_estimate
+
+    cursor = params.get('cursor', None)
+    page = params.get('page', None)
+    if cursor is not None:
+        rows, page_info['next_cursor'] = paginate_by_cursor(queryset, cursor, page_size)
+    elif page is not None:
+        rows = paginate(queryset, page, page_size)
+    else:
+        rows = queryset
+
+    return rows, page_info
+
+
+def paginate_by_cursor(queryset, cursor, page_size):
+    """ Return one keyset page of a queryset, and the cursor for the page after it
+
+    Rows are ordered by the queryset's own order_by (or DEFAULT_CURSOR_ORDERING),
+    with id appended as a tiebreaker. Instead of skipping rows with an OFFSET,
+    the next page starts after the ordering values of the last row on this one,
+    so a deep page costs the same as the first. The cursor is an opaque token
+    carrying those values; it is None on the last page.
+
+    Raises ValueError if the cursor is malformed or was issued for a different ordering.
+    """
+    page_size = _page_size(page_size)
+
+    ordering = cursor_ordering(queryset)
+    queryset = queryset.order_by(*ordering)
+    if cursor:
+        queryset = queryset.filter(_after(ordering, _decode_cursor(cursor, ordering), _nullable(queryset, ordering)))
+
+    # fetch one extra row to find out whether there is a next page
+    rows = list(queryset[:page_size + 1])
+    if len(rows) <= page_size:
+        return rows, None
+
+    rows = rows[:page_size]
+    return rows, _encode_cursor(ordering, ordering_values(rows[-1], ordering))
+
+
+def cursor_ordering(queryset, default=DEFAULT_CURSOR_ORDERING):
+    """ The ordering a queryset's cursor pages follow: its own order_by (or the default),
+    with id appended as a tiebreaker
+    """
+    ordering = [str(field) for field in queryset.query.order_by] or list(default)
+    if not {'id', '-id', 'pk', '-pk'} & set(ordering):
+        ordering.append('-id' if ordering[-1].startswith('-') else 'id')
+    return ordering
+
+
+def ordering_values(row, ordering):
+    """ The values a row (a model instance or a values() dict) is ordered by """
+    return [_ordering_value(row, field) for field in ordering]
+
+
+def sort_key(ordering, values):
+    """ A key that sorts rows by their ordering values the way the database does:
+    descending fields reversed, and NULLs before any value
+    """
+    return tuple(_Descending((value is not None, value)) if field.startswith('-') else (value is not None, value)
+                 for field, value in zip(ordering, values))
+
+
+def ordering_annotations(ordering):
+    """ Annotations of the values a queryset is ordered by, for annotated_ordering_values to
+    read without loading the related rows an ordering across a relation goes through """
+    return {f'_ordering_{index}': F(field.lstrip('-')) for index, field in enumerate(ordering)}
+
+
+def annotated_ordering_values(row, ordering):
+    """ The values a row annotated with ordering_annotations(ordering) is ordered by """
+    return [getattr(row, f'_ordering_{index}') for index in range(len(ordering))]
+
+
+class SortedEntries:
+    """ (ordering values, row) pairs sorted by sort_key(ordering, values), kept with their
+    sort keys so a cursor's place among them is found by bisecting """
+    __slots__ = ('ordering', 'entries', 'keys')
+
+    def __init__(self, ordering, entries):
+        self.ordering = list(ordering)
+        self.entries = entries
+        self.keys = [sort_key(ordering, values) for values, _ in entries]
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def paginate_merged_request(cached, queryset, load, request, count_queryset=None):
+    """ paginate_request for the rows of a SortedEntries merged with the rows of a queryset,
+    e.g. public rows serialized once for everyone merged with the requester's private ones
+
+    The queryset must be ordered by cached.ordering, and load(queryset) returns the
+    (ordering values, row) pairs of its rows; count_queryset, if given, has the same rows
+    and is counted instead, e.g. without the joins only loading them needs. Only the
+    queryset rows that can land on the requested page are loaded and merged, and a cursor
+    is placed among the cached rows by bisecting, so a cursor page costs the same however
+    deep it is. Cursors are interchangeable with the ones paginate_by_cursor issues for
+    the same ordering.
+
+    Returns the rows of the page and the dict to merge into the response.
+    Raises ValueError if the cursor is malformed or was issued for a different ordering.
+    """
+    ordering = cached.ordering
+    params = request.query_params
+    page_size = params.get('page_size', 10)
+
+    estimate = params.get('count', None) == 'estimate'
+    total = len(cached) + count(queryset if count_queryset is None else count_queryset, estimate)[0]
+    if estimate:
+        capped = min(total, ESTIMATED_COUNT_CAP)
+        page_info = {'count': capped, 'count_is_estimate': capped >= ESTIMATED_COUNT_CAP}
+    else:
+        page_info = {'count': total}
+
+    cursor = params.get('cursor', None)
+    page = params.get('page', None)
+    if cursor is not None:
+        page_size = _page_size(page_size)
+        start = 0
+        if cursor:
+            values = _decode_cursor(cursor, ordering)
+            start = bisect_right(cached.keys, sort_key(ordering, values))
+            queryset = queryset.filter(_after(ordering, values, _nullable(queryset, ordering)))
+        # one extra row from each list to find out whether there is a next page
+        entries = _merge(ordering, cached.entries[start:start + page_size + 1],
+                         load(queryset[:page_size + 1]))[:page_size + 1]
+        page_info['next_cursor'] = None
+        if len(entries) > page_size:
+            entries = entries[:page_size]
+            page_info['next_cursor'] = _encode_cursor(ordering, entries[-1][0])
+    elif page is not None:
+        # where an offset page starts depends on every row of both lists before it
+        page_slice = _page_slice(page, page_size)
+        end = max(page_slice.stop, 0)
+        entries = _merge(ordering, cached.entries[:end], load(queryset[:end]))[page_slice]
+    else:
+        entries = _merge(ordering, cached.entries, load(queryset))
+
+    return [row for _, row in entries], page_info
+
+
+def paginate_union_by_cursor(querysets, fields, ordering, cursor=None, page_size=None):
+    """ Merge several querysets into one ordered stream with a single UNION ALL query,
+    and return one keyset page of it as dicts along with the cursor for the next page
+
+    Every queryset must annotate the same `fields`, in the same order; `ordering` is made
+    of those field names and should end in a combination that is unique across the
+    querysets. The cursor filter is applied to each queryset before they are combined,
+    since a UNION can't be filtered afterwards.
+
+    Without a page_size the whole merged stream is returned as a lazy iterator and the
+    cursor is None.
+
+    Raises ValueError if the cursor is malformed or was issued for a different ordering.
+    """
+    ordering = list(ordering)
+    if cursor:
+        after = _after(ordering, _decode_cursor(cursor, ordering))
+        querysets = [queryset.filter(after) for queryset in querysets]
+
+    first, *rest = [queryset.values(*fields) for queryset in querysets]
+    merged = first.union(*rest, all=True).order_by(*ordering)
+
+    if page_size is None:
+        return merged.iterator(), None
+
+    page_size = _page_size(page_size)
+    rows = list(merged[:page_size + 1])
+    if len(rows) <= page_size:
+        return rows, None
+
+    rows = rows[:page_size]
+    return rows, _encode_cursor(ordering, ordering_values(rows[-1], ordering))
+
+
+def _page_slice(page, page_size):
+    """ The slice of a collection that is the page'th page of page_size rows """
     try:
         page = int(page)
     except ValueError:
@@ -12,4 +242,138 @@ def paginate(collection, page, page_size):
     page = page - 1
     start_index = (page * page_size)
     end_index = ((page + 1) * page_size)
-    return collection[start_index:end_index]
\ No newline at end of file
+    return slice(start_index, end_index)
+
+
+def _merge(ordering, *entry_lists):
+    """ Merge lists of (ordering values, row) pairs, each sorted by sort_key, into one sorted list """
+    return list(heapq.merge(*entry_lists, key=lambda entry: sort_key(ordering, entry[0])))
+
+
+def _page_size(page_size):
+    try:
+        return min(max(int(page_size), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        return 10
+
+
+class _Descending:
+    """ Wraps a sort key part so it sorts in reverse """
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+
+def _after(ordering, values, nullable=()):
+    """ Build the filter for rows that sort after the given ordering values:
+    (a > x) OR (a = x AND b > y) OR ... with > flipped to < on descending fields
+
+    NULLs sort before any value, as in sort_key, so they come after every value of a
+    descending field and before every value of an ascending one; nullable names the
+    fields that can hold them
+    """
+    condition = Q()
+    equal_so_far = Q()
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        descending = field.startswith('-')
+        if value is None:
+            if not descending:
+                condition |= equal_so_far & Q(**{f'{name}__isnull': False})
+            equal_so_far &= Q(**{f'{name}__isnull': True})
+            continue
+
+        after = Q(**{f'{name}__{"lt" if descending else "gt"}': value})
+        if descending and name in nullable:
+            after |= Q(**{f'{name}__isnull': True})
+        condition |= equal_so_far & after
+        equal_so_far &= Q(**{name: value})
+    return condition
+
+
+def _nullable(queryset, ordering):
+    """ The names in an ordering that can be NULL: annotations, and fields that are
+    nullable or reached through a nullable relation """
+    nullable = set()
+    for field in ordering:
+        name = field.lstrip('-')
+        if name in queryset.query.annotations:
+            nullable.add(name)
+            continue
+        model = queryset.model
+        for part in name.split('__'):
+            try:
+                model_field = model._meta.get_field(part)
+            except FieldDoesNotExist:
+                nullable.add(name)
+                break
+            if model_field.null or (model_field.is_relation and not model_field.concrete):
+                nullable.add(name)
+                break
+            model = model_field.related_model
+    return nullable
+
+
+def _ordering_value(row, field):
+    """ Read the value a row (a model instance or a values() dict) was ordered by,
+    following '__' lookups across relations
+    """
+    if isinstance(row, dict):
+        return row[field.lstrip('-')]
+
+    value = row
+    *path, last = field.lstrip('-').split('__')
+    for attribute in path:
+        value = getattr(value, attribute)
+    if isinstance(value, Model):
+        # a relation the row is ordered by is read by its id, without loading the related row
+        try:
+            last = value._meta.get_field(last).attname
+        except FieldDoesNotExist:
+            pass
+    value = getattr(value, last)
+    if isinstance(value, Model):
+        value = value.pk
+    return value
+
+
+def _encode_cursor(ordering, values):
+    encoded_values = []
+    for value in values:
+        if isinstance(value, datetime):
+            encoded_values.append(['datetime', value.isoformat()])
+        elif isinstance(value, date):
+            encoded_values.append(['date', value.isoformat()])
+        else:
+            encoded_values.append(['value', value])
+
+    token = json.dumps({'ordering': ordering, 'values': encoded_values})
+    return base64.urlsafe_b64encode(token.encode()).decode()
+
+
+def _decode_cursor(cursor, ordering):
+    try:
+        token = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        if token['ordering'] != ordering:
+            raise ValueError('cursor was issued for a different ordering')
+
+        values = []
+        for kind, value in token['values']:
+            if kind == 'datetime':
+                value = parse_datetime(value)
+            elif kind == 'date':
+                value = parse_date(value)
+            values.append(value)
+    except (TypeError, KeyError, UnicodeDecodeError, json.JSONDecodeError, binascii.Error) as ex:
+        raise ValueError('invalid cursor') from ex
+
+    if len(values) != len(ordering):
+        raise ValueError('invalid cursor')
+    return values
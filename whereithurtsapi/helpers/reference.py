@@ -0,0 +1,176 @@
+import hashlib
+import time
+from types import MappingProxyType
+from django.conf import settings
+from django.db import transaction
+from rest_framework.fields import Field
+from rest_framework.serializers import ModelSerializer
+from whereithurtsapi.models import Bodypart, TreatmentType
+from .compiled import compiled
+from .generation import Generation
+from .replicas import reads_from_primary
+
+# defaults for settings.REFERENCE_DATA
+REFERENCE_DATA_DEFAULTS = {
+    # optional alias from settings.CACHES the registry's generation is shared through
+    'SHARED_CACHE': None,
+    # seconds between checks of a shared generation for edits made by other workers
+    'CHECK_INTERVAL': 5,
+    # seconds before an id missing from a snapshot may load the tables again, within one generation
+    'MISS_RELOAD_INTERVAL': 60,
+}
+# seconds clients and proxies may reuse a bodypart or treatment type list before revalidating it
+REFERENCE_MAX_AGE = 24 * 60 * 60
+
+
+class BodypartReferenceSerializer(ModelSerializer):
+    """ A Bodypart nested the way a depth >= 1 serializer nests it """
+    class Meta:
+        model = Bodypart
+        fields = '__all__'
+
+
+class TreatmentTypeReferenceSerializer(ModelSerializer):
+    """ A TreatmentType nested the way a depth >= 1 serializer nests it """
+    class Meta:
+        model = TreatmentType
+        fields = '__all__'
+
+
+REFERENCE_SERIALIZERS = {
+    Bodypart: BodypartReferenceSerializer,
+    TreatmentType: TreatmentTypeReferenceSerializer,
+}
+
+
+class ReferenceData:
+    """ A read-only snapshot of the Bodypart and TreatmentType tables, by id
+
+    The digest identifies the snapshot's content, so it is the same in every process
+    that loaded the same rows.
+    """
+
+    def __init__(self, generation, bodyparts, treatmenttypes):
+        self.generation = generation
+        self.rows = MappingProxyType({
+            Bodypart: MappingProxyType({bodypart.id: bodypart for bodypart in bodyparts}),
+            TreatmentType: MappingProxyType({treatmenttype.id: treatmenttype for treatmenttype in treatmenttypes}),
+        })
+
+        content = [(model.__name__, [str(getattr(row, field.attname)) for field in model._meta.fields])
+                   for model, rows in self.rows.items() for row in rows.values()]
+        self.digest = hashlib.sha1(repr(content).encode()).hexdigest()[:16]
+
+    def get(self, model, pk):
+        return self.rows[model].get(pk)
+
+    def all(self, model):
+        return list(self.rows[model].values())
+
+
+class ReferenceRegistry:
+    """ Loads the Bodypart and TreatmentType tables once per process and hands out the snapshot
+
+    Admin edits bump the registry's generation (see reference_data_changed), and the
+    next request for the data loads a new snapshot. With a shared cache alias the
+    generation is read from it at most every check_interval seconds, so edits made
+    through another worker are picked up within that time.
+
+    An id missing from the snapshot loads the tables again at most once per generation
+    and miss_reload_interval seconds, so ids that stay missing (e.g. a hurt's deleted
+    bodypart) are answered from the snapshot instead of reloading on every lookup.
+    """
+
+    def __init__(self, shared_cache=None, check_interval=0, miss_reload_interval=60):
+        self.generation = Generation('reference-data', shared_cache)
+        self.check_interval = check_interval if shared_cache else 0
+        self.miss_reload_interval = miss_reload_interval
+        self._data = None
+        self._checked_at = 0
+        # (generation, monotonic time) of the last load caused by a missing id
+        self._miss_reload = None
+
+    def data(self):
+        data = self._data
+        now = time.monotonic()
+        if data is not None and now - self._checked_at < self.check_interval:
+            return data
+
+        generation = self.generation.current()
+        if data is None or data.generation != generation:
+            data = self._load(generation)
+        self._checked_at = now
+        return data
+
+    def get(self, model, pk):
+        """ The Bodypart or TreatmentType with this id, or None """
+        loaded = self._data
+        data = self.data()
+        row = data.get(model, pk)
+        if row is None and pk is not None:
+            now = time.monotonic()
+            last = self._miss_reload
+            if data is not loaded:
+                # just loaded, so loading again wouldn't find it either
+                self._miss_reload = (data.generation, now)
+            elif last is None or last[0] != data.generation or now - last[1] >= self.miss_reload_interval:
+                # rows inserted without a signal (e.g. by bulk_create) are picked up by loading again
+                data = self._load(self.generation.current())
+                self._miss_reload = (data.generation, now)
+                row = data.get(model, pk)
+        return row
+
+    def _load(self, generation):
+        # every request is served from what is loaded here until the next bump, so it can't lag behind on a replica
+        with reads_from_primary():
+            self._data = ReferenceData(generation, Bodypart.objects.order_by('id'), TreatmentType.objects.order_by('id'))
+        return self._data
+
+
+_reference_registry = None
+
+
+def get_reference_registry():
+    """ The process-wide ReferenceRegistry, built from settings.REFERENCE_DATA on first use """
+    global _reference_registry
+    if _reference_registry is None:
+        options = {**REFERENCE_DATA_DEFAULTS, **getattr(settings, 'REFERENCE_DATA', {})}
+        _reference_registry = ReferenceRegistry(options['SHARED_CACHE'], options['CHECK_INTERVAL'],
+                                                options['MISS_RELOAD_INTERVAL'])
+    return _reference_registry
+
+
+def reference_data_changed():
+    """ Make the registry load the lookup tables again, now and once the current transaction
+    commits, so a snapshot loaded from the data as it was before the commit isn't kept
+    """
+    generation = get_reference_registry().generation
+    generation.bump()
+    transaction.on_commit(generation.bump)
+
+
+class ReferenceField(Field):
+    """ A Bodypart or TreatmentType foreign key, nested the way a depth >= 1 serializer
+    nests it, but read from the reference registry by its id instead of joined in
+
+    e.g. bodypart = ReferenceField(Bodypart) reads bodypart_id
+    """
+
+    def __init__(self, model, **kwargs):
+        self.model = model
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def bind(self, field_name, parent):
+        if self.source is None:
+            self.source = f'{field_name}_id'
+        super().bind(field_name, parent)
+
+    def to_representation(self, value):
+        return self.represent(value, self.context)
+
+    def represent(self, value, context):
+        row = get_reference_registry().get(self.model, value)
+        if row is None:
+            return None
+        return compiled(REFERENCE_SERIALIZERS[self.model]).to_representation(row, context)
@@ -0,0 +1,41 @@
+def resolve_ids(model, ids):
+    """ Look up every id in a request's list of ids with one query
+
+    Returns the instances in the order the ids were given (duplicates dropped);
+    raises model.DoesNotExist if any id has no matching row
+    """
+    unique_ids = list(dict.fromkeys(int(pk) for pk in ids))
+    found = model.objects.in_bulk(unique_ids)
+    if len(found) != len(unique_ids):
+        raise model.DoesNotExist(f"{model.__name__} ids do not exist: {sorted(set(unique_ids) - set(found))}")
+    return [found[pk] for pk in unique_ids]
+
+
+def sync_links(bridge_model, owner_field, owner, target_field, targets, is_new=False):
+    """ Make the bridge table rows linking `owner` match `targets` exactly
+
+    e.g. sync_links(HurtTreatment, 'hurt', hurt, 'treatment', treatments)
+
+    Current links are read with one query and diffed against the targets in memory;
+    links that are no longer wanted are removed with one DELETE and missing ones are
+    added with one bulk INSERT. Pass is_new=True for an owner that was just created
+    to skip reading its (empty) current links. Call inside transaction.atomic().
+    """
+    target_key = f'{target_field}_id'
+    desired = {target.pk for target in targets}
+
+    if is_new:
+        current = set()
+    else:
+        current = set(bridge_model.objects.filter(
+            **{owner_field: owner}).values_list(target_key, flat=True))
+
+    stale = current - desired
+    if stale:
+        bridge_model.objects.filter(
+            **{owner_field: owner, f'{target_key}__in': stale}).delete()
+
+    missing = [pk for pk in (target.pk for target in targets) if pk not in current]
+    if missing:
+        bridge_model.objects.bulk_create(
+            [bridge_model(**{owner_field: owner, target_key: pk}) for pk in missing])
@@ -0,0 +1,177 @@
+import contextlib
+import contextvars
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# defaults for settings.READ_REPLICAS
+READ_REPLICAS_DEFAULTS = {
+    # aliases from settings.DATABASES that replicate the default database
+    'ALIASES': (),
+    # viewset actions whose GET requests may read from a replica
+    'ACTIONS': ('list', 'retrieve', 'snapshot'),
+    # seconds a user's reads stay on the primary after they write, so they read their own writes
+    'PIN_SECONDS': 10,
+    # optional alias from settings.CACHES pins are shared through, e.g. 'default'
+    'SHARED_CACHE': None,
+}
+
+
+def read_replica_options():
+    return {**READ_REPLICAS_DEFAULTS, **getattr(settings, 'READ_REPLICAS', {})}
+
+
+class ReplicaReads:
+    """ What the database router knows about the request being handled: whether its reads
+    may go to a replica, the replica it chose for them, and whether it has written """
+    __slots__ = ('allowed', 'replica', 'wrote')
+
+    def __init__(self):
+        self.allowed = False
+        self.replica = None
+        self.wrote = False
+
+
+_replica_reads = contextvars.ContextVar('replica_reads', default=None)
+
+
+def current_replica_reads():
+    """ The ReplicaReads of the request being handled, or None outside of one """
+    return _replica_reads.get()
+
+
+@contextlib.contextmanager
+def handling_request():
+    """ Track the reads and writes of the request handled inside the block, yielding its ReplicaReads """
+    reads = ReplicaReads()
+    token = _replica_reads.set(reads)
+    try:
+        yield reads
+    finally:
+        _replica_reads.reset(token)
+
+
+@contextlib.contextmanager
+def reads_from_primary():
+    """ Keep the reads inside the block on the primary, e.g. to build something cached past
+    the request from data no older than the writes that invalidated it """
+    reads = current_replica_reads()
+    allowed = reads is not None and reads.allowed
+    if allowed:
+        reads.allowed = False
+    try:
+        yield
+    finally:
+        if allowed:
+            reads.allowed = True
+
+
+def replica_action(method, view_func):
+    """ Whether a request with this method may read from a replica in the view it resolved to """
+    options = read_replica_options()
+    if not options['ALIASES'] or method != 'GET':
+        return False
+    # DRF viewsets map each method to the action it runs
+    action = getattr(view_func, 'actions', {}).get('get', None)
+    return action in options['ACTIONS']
+
+
+@contextlib.contextmanager
+def reads_from_replica(user_id):
+    """ Let the reads inside the block go to a replica, e.g. those of a batched GET, unless
+    the user (None if anonymous) is pinned to the primary or the request has written """
+    reads = current_replica_reads()
+    allowed = reads is not None and reads.allowed
+    if reads is not None and not reads.wrote and (user_id is None or not get_replica_pins().is_pinned(user_id)):
+        reads.allowed = True
+    try:
+        yield
+    finally:
+        if reads is not None:
+            reads.allowed = allowed
+
+
+class ReplicaPins:
+    """ Users whose reads are kept on the primary until a moment after their last write,
+    while the replicas catch up with it
+
+    Pins live in an in-process dict, ordered by when they expire; when a shared cache
+    alias is configured they are also written to that Django cache, so a write handled
+    by one worker pins the user's reads in every worker.
+    """
+
+    def __init__(self, shared_cache=None):
+        self.shared_cache = caches[shared_cache] if shared_cache else None
+        self._pins = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _shared_key(self, user_id):
+        return f"replica-pin:{user_id}"
+
+    def pin(self, user_id, seconds):
+        until = time.time() + seconds
+        with self._lock:
+            self._pins[user_id] = until
+            self._pins.move_to_end(user_id)
+            # pins last as long as each other, so the oldest ones expire first
+            while self._pins and next(iter(self._pins.values())) <= time.time():
+                self._pins.popitem(last=False)
+        if self.shared_cache is not None:
+            self.shared_cache.set(self._shared_key(user_id), until, seconds)
+
+    def is_pinned(self, user_id):
+        now = time.time()
+        with self._lock:
+            until = self._pins.get(user_id, None)
+            if until is not None and until <= now:
+                del self._pins[user_id]
+                until = None
+        if until is None and self.shared_cache is not None:
+            # another worker may have pinned the user since this one's pin expired
+            until = self.shared_cache.get(self._shared_key(user_id))
+        return until is not None and until > now
+
+    def clear(self):
+        with self._lock:
+            self._pins.clear()
+
+
+_replica_pins = None
+
+
+def get_replica_pins():
+    """ The process-wide ReplicaPins, built from settings.READ_REPLICAS on first use """
+    global _replica_pins
+    if _replica_pins is None:
+        options = read_replica_options()
+        _replica_pins = ReplicaPins(options['SHARED_CACHE'])
+    return _replica_pins
+
+
+def pin_to_primary(user_id):
+    """ Keep a user's reads on the primary for READ_REPLICAS['PIN_SECONDS'], e.g. after a
+    write they will want to see; requests that write pin their user on their own """
+    options = read_replica_options()
+    if options['ALIASES']:
+        get_replica_pins().pin(user_id, options['PIN_SECONDS'])
+
+
+def replicate_sqlite(aliases=None):
+    """ Copy the default SQLite database into each replica, standing in for replication
+    when developing with SQLite files; returns the aliases copied to """
+    aliases = list(read_replica_options()['ALIASES'] if aliases is None else aliases)
+    primary = connections[DEFAULT_DB_ALIAS]
+    for alias in [DEFAULT_DB_ALIAS, *aliases]:
+        if connections[alias].vendor != 'sqlite':
+            raise ImproperlyConfigured(f'{alias} is not a SQLite database, so it can not be copied')
+
+    primary.ensure_connection()
+    for alias in aliases:
+        replica = connections[alias]
+        replica.ensure_connection()
+        primary.connection.backup(replica.connection)
+    return aliases
@@ -0,0 +1,22 @@
+# attribute of the HttpRequest the cache is kept under
+REQUEST_CACHE_ATTRIBUTE = '_whereithurts_cache'
+
+
+def request_cache(request):
+    """ A dict that lives as long as the request, for values several steps of handling it
+    would otherwise each look up, e.g. data versions for ETags
+
+    Accepts a DRF Request or the HttpRequest it wraps. The sub-requests of a /batch
+    request share the batch's cache (see share_request_cache).
+    """
+    http_request = getattr(request, '_request', request)
+    cache = getattr(http_request, REQUEST_CACHE_ATTRIBUTE, None)
+    if cache is None:
+        cache = {}
+        setattr(http_request, REQUEST_CACHE_ATTRIBUTE, cache)
+    return cache
+
+
+def share_request_cache(request, sub_request):
+    """ Make sub_request use the same request cache as request """
+    setattr(getattr(sub_request, '_request', sub_request), REQUEST_CACHE_ATTRIBUTE, request_cache(request))
@@ -0,0 +1,39 @@
+from datetime import datetime, time, timedelta
+from django.db.models import Count, Sum
+from django.utils import timezone
+from whereithurtsapi.models import DailyRollup, Healing, HealingTreatment, HurtHealing
+
+
+def rollup_day(added_on):
+    """ The (local) day a healing added at this time is rolled up into """
+    return timezone.localtime(added_on).date()
+
+
+def refresh_daily_rollup(patient_id, day):
+    """ Recompute one patient's rollup for one day from that day's healings
+
+    Only the healings of that single day are read, so this stays cheap no matter
+    how long the patient's history is. Call inside the transaction that wrote the healing.
+    """
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    healings = Healing.objects.filter(
+        patient_id=patient_id, added_on__gte=start, added_on__lt=start + timedelta(days=1))
+
+    totals = healings.aggregate(healing_seconds=Sum('duration'), healing_count=Count('id'))
+    if not totals['healing_count']:
+        DailyRollup.objects.filter(patient_id=patient_id, day=day).delete()
+        return
+
+    DailyRollup.objects.update_or_create(patient_id=patient_id, day=day, defaults={
+        'healing_seconds': totals['healing_seconds'],
+        'healing_count': totals['healing_count'],
+        'treatment_ids': sorted(set(HealingTreatment.objects.filter(
+            healing__in=healings).values_list('treatment_id', flat=True))),
+        'hurt_ids': sorted(set(HurtHealing.objects.filter(
+            healing__in=healings).values_list('hurt_id', flat=True))),
+    })
+
+
+def refresh_healing_rollup(healing):
+    """ Recompute the rollup for the day a healing was added """
+    refresh_daily_rollup(healing.patient_id, rollup_day(healing.added_on))
@@ -0,0 +1,73 @@
+import operator
+import re
+from functools import reduce
+from django.db.models import IntegerField, OuterRef, Q, Subquery, Sum
+from whereithurtsapi.models import TreatmentSearchTerm
+
+# how much a word counts toward a treatment's rank, by the field it was found in
+SEARCH_WEIGHTS = {'name': 4, 'treatmenttype': 2, 'bodypart': 2, 'notes': 1}
+# longest word kept in the index; longer words are indexed by their first TERM_LENGTH characters
+TERM_LENGTH = 50
+# most words of a query that are matched
+MAX_QUERY_TERMS = 8
+
+
+def search_terms(text):
+    """ Split text into lowercase words the way both the index and queries do """
+    return [word[:TERM_LENGTH] for word in re.findall(r'\w+', text.lower())]
+
+
+def query_terms(query):
+    """ The words of a search query that are matched """
+    return search_terms(query)[:MAX_QUERY_TERMS]
+
+
+def index_treatment(treatment):
+    """ Replace a treatment's rows in the search index with the words of its name, notes,
+    bodypart name and treatment type name. Call inside the transaction that wrote the treatment.
+    """
+    weights = {}
+    fields = {
+        'name': treatment.name,
+        'notes': treatment.notes,
+        'bodypart': treatment.bodypart.name,
+        'treatmenttype': treatment.treatmenttype.name,
+    }
+    for field, text in fields.items():
+        for term in set(search_terms(text)):
+            weights[term] = weights.get(term, 0) + SEARCH_WEIGHTS[field]
+
+    TreatmentSearchTerm.objects.filter(treatment=treatment).delete()
+    TreatmentSearchTerm.objects.bulk_create([
+        TreatmentSearchTerm(treatment=treatment, term=term, weight=weight) for term, weight in weights.items()])
+
+
+def reindex_treatments(treatments):
+    """ Rebuild the search index rows of every treatment in a queryset """
+    for treatment in treatments.select_related('bodypart', 'treatmenttype').iterator():
+        index_treatment(treatment)
+
+
+def search_treatments(treatments, query):
+    """ Narrow a Treatment queryset to the treatments matching every word of a query, and
+    order them by relevance
+
+    Each word of the query matches indexed words it is a prefix of, so "ic pa" finds
+    "ice pack". A treatment's search_rank is the summed weight of the words it matched.
+    Prefixes are matched with a range on the term index instead of LIKE, which SQLite
+    can't answer from an index.
+    """
+    terms = query_terms(query)
+    if not terms:
+        return treatments
+
+    # each word narrows the treatments to those with a term it prefixes, found from the term index
+    prefixes = [Q(term__gte=term, term__lt=term + '\uffff') for term in terms]
+    for prefix in prefixes:
+        treatments = treatments.filter(id__in=TreatmentSearchTerm.objects.filter(prefix).values('treatment_id'))
+
+    # and the rank of the treatments left is the weight of every term the words matched
+    matched = TreatmentSearchTerm.objects.filter(treatment=OuterRef('pk')).filter(
+        reduce(operator.or_, prefixes)).order_by().values('treatment').annotate(rank=Sum('weight')).values('rank')
+    return treatments.annotate(search_rank=Subquery(matched, output_field=IntegerField())).order_by(
+        '-search_rank', '-added_on', '-id')
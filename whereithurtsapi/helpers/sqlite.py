@@ -0,0 +1,43 @@
+import re
+from django.conf import settings
+
+# defaults for settings.SQLITE_PRAGMAS, run in this order on every new SQLite connection;
+# a pragma set to None is left at SQLite's default
+SQLITE_PRAGMAS_DEFAULTS = {
+    # milliseconds a write waits for another connection's lock before failing with "database is locked";
+    # first, so switching the journal mode waits too
+    'busy_timeout': 5000,
+    # readers see the last commit instead of blocking writers, and writers don't block readers
+    'journal_mode': 'wal',
+    # with WAL, only sync at checkpoints; a power cut can lose the last commits but not corrupt the file
+    'synchronous': 'normal',
+    # negative is KiB of page cache per connection
+    'cache_size': -20000,
+    # bytes of the file read through memory mapping instead of read() calls
+    'mmap_size': 268435456,
+    # temporary tables and indices built for sorting and grouping stay in memory
+    'temp_store': 'memory',
+}
+
+_PRAGMA_NAME = re.compile(r'^[a-z_]+$')
+_PRAGMA_VALUE = re.compile(r'^-?\w+$')
+
+
+def sqlite_pragmas():
+    """ The pragmas to run on new SQLite connections, from settings.SQLITE_PRAGMAS over the defaults """
+    pragmas = {**SQLITE_PRAGMAS_DEFAULTS, **getattr(settings, 'SQLITE_PRAGMAS', {})}
+    return {name: value for name, value in pragmas.items() if value is not None}
+
+
+def tune_sqlite_connection(connection):
+    """ Run the configured pragmas on a Django connection that was just opened, if it is to SQLite
+
+    They're run on the driver's connection rather than through a cursor, so they don't show
+    up in query logs or pass through execute wrappers.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    for name, value in sqlite_pragmas().items():
+        if not _PRAGMA_NAME.match(name) or not _PRAGMA_VALUE.match(str(value)):
+            raise ValueError(f'invalid SQLite pragma {name} = {value}')
+        connection.connection.execute(f'PRAGMA {name} = {value}')
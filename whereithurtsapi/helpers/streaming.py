@@ -0,0 +1,46 @@
+import json
+from itertools import islice
+from django.db.models import prefetch_related_objects
+from django.http import StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+
+# rows fetched from the database, and prefetched for, at a time while streaming
+STREAM_CHUNK_SIZE = 200
+
+
+def wants_stream(request):
+    """ Whether a list request opted into a streamed response, e.g. /hurts?stream=1 """
+    return request.query_params.get('stream', None) in ('1', 'true')
+
+
+def iterate_in_chunks(queryset, chunk_size=STREAM_CHUNK_SIZE):
+    """ Iterate a queryset holding at most chunk_size rows in memory at a time
+
+    QuerySet.iterator() ignores prefetch_related, so the queryset's prefetch lookups
+    are run once per chunk instead; a streamed list then costs a fixed number of
+    queries per chunk rather than per row.
+    """
+    lookups = queryset._prefetch_related_lookups
+    rows = queryset.prefetch_related(None).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        if lookups:
+            prefetch_related_objects(chunk, *lookups)
+        yield from chunk
+
+
+def stream_json_array(items):
+    """ Yield a JSON array one element at a time, encoded the way DRF's JSONRenderer encodes a response """
+    yield '['
+    for index, item in enumerate(items):
+        yield (',' if index else '') + json.dumps(item, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':'))
+    yield ']'
+
+
+def streaming_list_response(queryset, serialize):
+    """ A StreamingHttpResponse of a queryset serialized row by row by serialize(row),
+    so memory stays bounded no matter how many rows the list has """
+    rows = iterate_in_chunks(queryset)
+    return StreamingHttpResponse(stream_json_array(serialize(row) for row in rows), content_type='application/json')
@@ -0,0 +1,82 @@
+import threading
+from collections import OrderedDict
+from django.conf import settings
+from django.db import transaction
+from .generation import Generation
+from .replicas import reads_from_primary
+
+# defaults for settings.PUBLIC_TREATMENT_CACHE
+PUBLIC_TREATMENT_CACHE_DEFAULTS = {
+    # most browsed filter combinations kept in each process's LRU
+    'MAX_ENTRIES': 128,
+    # optional alias from settings.CACHES the generation is shared through, e.g. 'default'
+    'SHARED_CACHE': None,
+}
+
+
+class PublicTreatmentCache:
+    """ Maps the normalized filters and ordering of a treatment list to its public
+    treatments, already serialized, so browsing users don't each rebuild the same list
+
+    Entries are stamped with the generation they were built in, and only served while
+    it is current; treatments_changed() moves the generation on after any write that
+    changes how a treatment serializes, and stale entries age out of the LRU. When a
+    shared cache alias is configured the generation is kept there, so a write in one
+    worker invalidates every worker's entries.
+    """
+
+    def __init__(self, max_entries, shared_cache=None):
+        self.max_entries = max_entries
+        self.generation = Generation('public-treatments', shared_cache)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key, build):
+        """ The cached value for key, or build() stored under the generation read before building it """
+        generation = self.generation.current()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == generation:
+                self._entries.move_to_end(key)
+                return entry[1]
+
+        # a list built from a replica that hasn't caught up with the write that moved the
+        # generation on would be served as current until the next one
+        with reads_from_primary():
+            value = build()
+        with self._lock:
+            self._entries[key] = (generation, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def bump(self):
+        self.generation.bump()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_public_treatment_cache = None
+
+
+def get_public_treatment_cache():
+    """ The process-wide PublicTreatmentCache, built from settings.PUBLIC_TREATMENT_CACHE on first use """
+    global _public_treatment_cache
+    if _public_treatment_cache is None:
+        options = {**PUBLIC_TREATMENT_CACHE_DEFAULTS, **getattr(settings, 'PUBLIC_TREATMENT_CACHE', {})}
+        _public_treatment_cache = PublicTreatmentCache(options['MAX_ENTRIES'], options['SHARED_CACHE'])
+    return _public_treatment_cache
+
+
+def treatments_changed():
+    """ Invalidate the cached public treatment lists. The generation moves on now, and again
+    once the current transaction commits, so a list built by another request from the data
+    as it was before the commit isn't served afterwards.
+    """
+    public_treatment_cache = get_public_treatment_cache()
+    public_treatment_cache.bump()
+    transaction.on_commit(public_treatment_cache.bump)
+
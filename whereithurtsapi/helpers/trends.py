@@ -0,0 +1,132 @@
+from datetime import timedelta
+from itertools import accumulate
+from django.utils import timezone
+from rest_framework.fields import DateTimeField
+
+# days of check-ins the rolling average and slope of each check-in look back over
+DEFAULT_TREND_WINDOW = 7
+MAX_TREND_WINDOW = 365
+# what the resampled series is bucketed by
+TREND_INTERVALS = ('day', 'week')
+# decimal places of averages and slopes
+TREND_PRECISION = 2
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+def trend_options(query_params):
+    """ (window, interval) from e.g. ?window=14&interval=week; raises ValueError if either is invalid """
+    try:
+        window = int(query_params.get('window', DEFAULT_TREND_WINDOW))
+    except ValueError:
+        window = 0
+    if not 0 < window <= MAX_TREND_WINDOW:
+        raise ValueError(f'window must be a whole number of days from 1 to {MAX_TREND_WINDOW}')
+
+    interval = query_params.get('interval', TREND_INTERVALS[0])
+    if interval not in TREND_INTERVALS:
+        raise ValueError(f'interval must be one of {", ".join(TREND_INTERVALS)}')
+    return window, interval
+
+
+def pain_trend(points, window=DEFAULT_TREND_WINDOW, interval='day'):
+    """ Pain over time for a list of (added_on, pain_level) check-ins sorted by added_on, as columns
+
+    {"updates": {"added_on": [...], "pain_level": [...], "delta": [...], "rolling_average": [...],
+                 "rolling_slope": [...]},
+     "series": {"start": [...], "average": [...], "min": [...], "max": [...], "count": [...]},
+     "summary": {"count": 12, "average": 4.5, "slope": -0.25}}
+
+    delta is the change from the check-in before; rolling_average and rolling_slope (pain
+    per day, by least squares) cover the check-ins in the window days up to each one.
+    series resamples the check-ins by local day or week (starting on Monday), leaving out
+    days without any. Running sums make every column one pass over the check-ins, however
+    wide the window.
+    """
+    levels = [pain_level for _, pain_level in points]
+    count = len(levels)
+    if count == 0:
+        return {'updates': _columns(('added_on', 'pain_level', 'delta', 'rolling_average', 'rolling_slope')),
+                'series': _columns(('start', 'average', 'min', 'max', 'count')),
+                'summary': {'count': 0, 'average': None, 'slope': None}}
+
+    # days since the first check-in, and running sums of x, y, x*x and x*y for the windows
+    first = points[0][0]
+    days = [(added_on - first).total_seconds() / SECONDS_PER_DAY for added_on, _ in points]
+    sum_x = [0, *accumulate(days)]
+    sum_y = [0, *accumulate(levels)]
+    sum_xx = [0, *accumulate(x * x for x in days)]
+    sum_xy = [0, *accumulate(x * y for x, y in zip(days, levels))]
+
+    rolling_average = []
+    rolling_slope = []
+    start = 0
+    for end, x in enumerate(days):
+        while days[start] < x - window:
+            start += 1
+        rolling_average.append(_round((sum_y[end + 1] - sum_y[start]) / (end + 1 - start)))
+        rolling_slope.append(_slope(end + 1 - start, sum_x[end + 1] - sum_x[start], sum_y[end + 1] - sum_y[start],
+                                    sum_xx[end + 1] - sum_xx[start], sum_xy[end + 1] - sum_xy[start]))
+
+    to_representation = DateTimeField().to_representation
+    return {
+        'updates': {
+            'added_on': [to_representation(added_on) for added_on, _ in points],
+            'pain_level': levels,
+            'delta': [None, *(later - earlier for earlier, later in zip(levels, levels[1:]))],
+            'rolling_average': rolling_average,
+            'rolling_slope': rolling_slope,
+        },
+        'series': _resample(points, interval),
+        'summary': {
+            'count': count,
+            'average': _round(sum_y[-1] / count),
+            'slope': _slope(count, sum_x[-1], sum_y[-1], sum_xx[-1], sum_xy[-1]),
+        },
+    }
+
+
+def _slope(count, sum_x, sum_y, sum_xx, sum_xy):
+    """ The least squares slope of count points from their sums; None for fewer than two
+    points or points all at the same time """
+    spread = count * sum_xx - sum_x * sum_x
+    if count < 2 or spread <= 1e-9 * max(1, count * sum_xx):
+        return None
+    return _round((count * sum_xy - sum_x * sum_y) / spread)
+
+
+def _resample(points, interval):
+    """ Average, min, max and count of the check-ins in each local day or week that has any """
+    series = _columns(('start', 'average', 'min', 'max', 'count'))
+    bucket = None
+    for added_on, pain_level in points:
+        day = timezone.localtime(added_on).date()
+        if interval == 'week':
+            day -= timedelta(days=day.weekday())
+        if day != bucket:
+            if bucket is not None:
+                _close_bucket(series, total)
+            bucket, total = day, 0
+            series['start'].append(day.isoformat())
+            series['min'].append(pain_level)
+            series['max'].append(pain_level)
+            series['count'].append(0)
+        total += pain_level
+        series['min'][-1] = min(series['min'][-1], pain_level)
+        series['max'][-1] = max(series['max'][-1], pain_level)
+        series['count'][-1] += 1
+    if bucket is not None:
+        _close_bucket(series, total)
+    return series
+
+
+def _close_bucket(series, total):
+    series['average'].append(_round(total / series['count'][-1]))
+
+
+def _columns(names):
+    return {name: [] for name in names}
+
+
+def _round(value):
+    return round(value, TREND_PRECISION)
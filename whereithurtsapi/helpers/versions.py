@@ -0,0 +1,106 @@
+import hashlib
+from django.db.models import Count, F, Sum
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+from whereithurtsapi.models import Healing, HealingTreatment, Hurt, HurtHealing, HurtTreatment, Patient, Treatment
+from .request_cache import request_cache
+
+
+def touch_patients(patient_ids):
+    """ Bump the data version of each patient, so ETags issued for their resources stop
+    matching. Call inside the transaction that made the write.
+    """
+    patient_ids = set(patient_ids)
+    if patient_ids:
+        Patient.objects.filter(id__in=patient_ids).update(data_version=F('data_version') + 1)
+
+
+def related_patients(hurts=(), healings=(), treatments=()):
+    """ The ids of every patient whose resources show any of these hurts, healings or treatments:
+    their owners, and the owners of the rows they are linked to through the bridge tables,
+    since those embed them too. Call before a delete, and before and after a write that
+    changes links, so patients on both sides of a removed link are included.
+    """
+    hurt_ids = [getattr(hurt, 'id', hurt) for hurt in hurts]
+    healing_ids = [getattr(healing, 'id', healing) for healing in healings]
+    treatment_ids = [getattr(treatment, 'id', treatment) for treatment in treatments]
+
+    lookups = []
+    if hurt_ids:
+        lookups += [
+            Hurt.objects.filter(id__in=hurt_ids).values_list('patient_id', flat=True),
+            HurtTreatment.objects.filter(hurt_id__in=hurt_ids).values_list('treatment__added_by_id', flat=True),
+            HurtHealing.objects.filter(hurt_id__in=hurt_ids).values_list('healing__patient_id', flat=True),
+        ]
+    if healing_ids:
+        lookups += [
+            Healing.objects.filter(id__in=healing_ids).values_list('patient_id', flat=True),
+            HealingTreatment.objects.filter(healing_id__in=healing_ids).values_list('treatment__added_by_id', flat=True),
+            HurtHealing.objects.filter(healing_id__in=healing_ids).values_list('hurt__patient_id', flat=True),
+        ]
+    if treatment_ids:
+        lookups += [
+            Treatment.objects.filter(id__in=treatment_ids).values_list('added_by_id', flat=True),
+            HurtTreatment.objects.filter(treatment_id__in=treatment_ids).values_list('hurt__patient_id', flat=True),
+            HealingTreatment.objects.filter(treatment_id__in=treatment_ids).values_list('healing__patient_id', flat=True),
+        ]
+
+    patient_ids = set()
+    for lookup in lookups:
+        patient_ids.update(lookup)
+    return patient_ids
+
+
+def data_version(patient_id=None):
+    """ A patient's data version, or with no patient_id a version covering every patient;
+    None if the patient doesn't exist """
+    if patient_id is not None:
+        return Patient.objects.filter(pk=patient_id).values_list('data_version', flat=True).first()
+
+    # versions only go up, so their sum (with the number of patients) changes on any write
+    totals = Patient.objects.aggregate(patients=Count('id'), versions=Sum('data_version'))
+    return f"{totals['patients']}.{totals['versions'] or 0}"
+
+
+def data_version_etag(request, patient_id=None, *variant):
+    """ An ETag for a read of one patient's resources (or every patient's, without patient_id)
+
+    It changes whenever the data version does, and differs between URLs, requesting
+    patients (responses carry their owner flags) and anything else passed in variant
+    that the response depends on. None if the patient doesn't exist.
+
+    Versions are read once per request cache, so the sub-requests of a batch polling
+    the same patient look its version up once.
+    """
+    versions = request_cache(request).setdefault('data_versions', {})
+    # ids come from URLs as strings and from rows as ints
+    key = None if patient_id is None else str(patient_id)
+    if key not in versions:
+        versions[key] = data_version(patient_id)
+    version = versions[key]
+    if version is None:
+        return None
+
+    requester = getattr(getattr(request, 'auth', None), 'user_id', None)
+    digest = hashlib.sha1(repr((request.get_full_path(), requester, variant)).encode()).hexdigest()[:16]
+    return f'"{version}-{digest}"'
+
+
+def not_modified(request, etag):
+    """ A 304 response if the request's If-None-Match matches etag, otherwise None """
+    if etag is None:
+        return None
+    etags = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    if etag in etags or '*' in etags:
+        return with_etag(Response(status=status.HTTP_304_NOT_MODIFIED), etag)
+    return None
+
+
+def with_etag(response, etag):
+    """ Tag a response, marking it as varying with the token it was requested with """
+    if etag is not None:
+        response['ETag'] = etag
+        patch_vary_headers(response, ('Authorization',))
+    return response
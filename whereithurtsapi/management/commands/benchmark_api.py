@@ -0,0 +1,52 @@
+""" Management command to benchmark every API route against a synthetic data set """
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from whereithurtsapi.authentication import get_token_cache
+from whereithurtsapi.helpers import get_public_treatment_cache, reference_data_changed
+from whereithurtsapi.benchmark import (PAGE_SIZE, benchmark_serializers, generate_data, report, run_benchmark,
+                                       serializer_report)
+
+
+class Command(BaseCommand):
+    help = ("Generate synthetic data, request every API route and report its query count, p50/p95 "
+            "latency and response size; exits with an error if a list route's query count grows with "
+            "its page size. The synthetic data is rolled back afterwards unless --keep is given")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=5)
+        parser.add_argument('--hurts-per-patient', type=int, default=4)
+        parser.add_argument('--updates-per-hurt', type=int, default=6)
+        parser.add_argument('--treatments-per-patient', type=int, default=4)
+        parser.add_argument('--healings-per-patient', type=int, default=8)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--repeat', type=int, default=5, help="timed requests per route")
+        parser.add_argument('--page-size', type=int, default=PAGE_SIZE,
+                            help="page size compared against a page of one on list routes")
+        parser.add_argument('--keep', action='store_true', help="keep the synthetic data in the database")
+        parser.add_argument('--serializers', action='store_true',
+                            help="also time the DRF serializers of the read endpoints against their compiled versions")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            data = generate_data(
+                patients=options['patients'],
+                hurts_per_patient=options['hurts_per_patient'],
+                updates_per_hurt=options['updates_per_hurt'],
+                treatments_per_patient=options['treatments_per_patient'],
+                healings_per_patient=options['healings_per_patient'],
+                seed=options['seed'])
+            results, failures = run_benchmark(data, options['repeat'], options['page_size'])
+            serializer_timings = benchmark_serializers() if options['serializers'] else None
+            if not options['keep']:
+                transaction.set_rollback(True)
+
+        # the rolled back tokens, treatment lists and lookup rows shouldn't outlive their rows in this process's caches
+        get_token_cache().clear()
+        get_public_treatment_cache().clear()
+        reference_data_changed()
+
+        self.stdout.write(report(results))
+        if serializer_timings is not None:
+            self.stdout.write(serializer_report(serializer_timings))
+        if failures:
+            raise CommandError("\n".join(failures))
@@ -0,0 +1,51 @@
+""" Management command to compare the async read endpoints with the viewsets they mirror under concurrent load """
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from whereithurtsapi.authentication import get_token_cache
+from whereithurtsapi.helpers import get_public_treatment_cache, reference_data_changed
+from whereithurtsapi.benchmark import CONCURRENCY, async_report, delete_data, generate_data, run_async_benchmark
+
+
+class Command(BaseCommand):
+    help = ("Generate synthetic data, then request /hurts/<id>, /patients/<id> and /profiles/<id>/snapshot "
+            "and their /async versions with many requests at once through the ASGI handler, and report "
+            "p50/p95 latency and total time of each. The views read from their own threads, so the "
+            "synthetic data is committed, and deleted afterwards unless --keep is given")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=5)
+        parser.add_argument('--hurts-per-patient', type=int, default=4)
+        parser.add_argument('--updates-per-hurt', type=int, default=6)
+        parser.add_argument('--treatments-per-patient', type=int, default=4)
+        parser.add_argument('--healings-per-patient', type=int, default=8)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--concurrency', type=int, default=CONCURRENCY, help="requests made at once")
+        parser.add_argument('--rounds', type=int, default=5, help="rounds of concurrent requests per url")
+        parser.add_argument('--query-latency', type=float, default=0,
+                            help="milliseconds added to every query, as if the database were across a network")
+        parser.add_argument('--keep', action='store_true', help="keep the synthetic data in the database")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            data = generate_data(
+                patients=options['patients'],
+                hurts_per_patient=options['hurts_per_patient'],
+                updates_per_hurt=options['updates_per_hurt'],
+                treatments_per_patient=options['treatments_per_patient'],
+                healings_per_patient=options['healings_per_patient'],
+                seed=options['seed'])
+
+        try:
+            results, failures = run_async_benchmark(data, options['concurrency'], options['rounds'],
+                                                    options['query_latency'] / 1000)
+        finally:
+            if not options['keep']:
+                delete_data(data)
+                # the deleted tokens, treatment lists and lookup rows shouldn't outlive their rows in this process's caches
+                get_token_cache().clear()
+                get_public_treatment_cache().clear()
+                reference_data_changed()
+
+        self.stdout.write(async_report(results))
+        if failures:
+            raise CommandError("\n".join(failures))
@@ -0,0 +1,20 @@
+""" Management command to measure concurrent write throughput on SQLite with and without SQLITE_PRAGMAS """
+import tempfile
+from django.core.management.base import BaseCommand
+from whereithurtsapi.benchmark import run_sqlite_stress, stress_report
+
+
+class Command(BaseCommand):
+    help = ("Have several threads write check-ins to a scratch SQLite file while others read them, first "
+            "without pragmas and a connection per write, then with SQLITE_PRAGMAS and CONN_MAX_AGE from "
+            "settings, and report the writes, 'database is locked' errors and reads of each")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8, help="threads writing at once")
+        parser.add_argument('--writes', type=int, default=50, help="check-ins each writer makes")
+        parser.add_argument('--readers', type=int, default=2, help="threads reading while they write")
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            results = run_sqlite_stress(directory, options['writers'], options['writes'], options['readers'])
+        self.stdout.write(stress_report(results))
@@ -0,0 +1,39 @@
+""" Management command to build the resized icon variants and their manifest """
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from whereithurtsapi.helpers import build_icon_variants, read_icon_manifest, write_icon_manifest
+from whereithurtsapi.helpers.icons import MANIFEST_NAME, VARIANT_DIRECTORY
+from whereithurtsapi.models import Bodypart, TreatmentType
+
+
+class Command(BaseCommand):
+    help = ("Resize every Bodypart and TreatmentType icon to small PNG and WebP variants with "
+            "content-hashed names, and write the manifest the serializers read their URLs from")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="rebuild variants of icons that haven't changed")
+
+    def handle(self, *args, **options):
+        names = set(Bodypart.objects.values_list('hurt_image', flat=True))
+        names |= set(Bodypart.objects.values_list('treatment_image', flat=True))
+        names |= set(TreatmentType.objects.values_list('image', flat=True))
+
+        previous = {} if options['force'] else read_icon_manifest()
+        manifest = {}
+        for name in sorted(name for name in names if name):
+            if not default_storage.exists(name):
+                self.stderr.write(f"skipping {name}: the file is missing")
+                continue
+            manifest[name] = build_icon_variants(name, previous.get(name))
+        write_icon_manifest(manifest)
+
+        # variants of icons that changed or are no longer used
+        kept = {MANIFEST_NAME} | {variant for entry in manifest.values()
+                                  for variants in entry['variants'].values() for variant in variants.values()}
+        removed = 0
+        for file_name in default_storage.listdir(VARIANT_DIRECTORY)[1]:
+            if f'{VARIANT_DIRECTORY}/{file_name}' not in kept:
+                default_storage.delete(f'{VARIANT_DIRECTORY}/{file_name}')
+                removed += 1
+
+        self.stdout.write(f"built variants of {len(manifest)} icons, removed {removed} stale files")
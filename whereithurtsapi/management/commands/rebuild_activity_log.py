@@ -0,0 +1,41 @@
+""" Management command to rebuild the patient Activity log from existing data """
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from whereithurtsapi.helpers import activity_for
+from whereithurtsapi.models import Activity, Hurt, Update, Healing, Treatment
+
+
+class Command(BaseCommand):
+    help = "Clear the Activity log and rebuild it from every Hurt, Update, Healing and Treatment"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help="number of log entries inserted per query")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        # a hurt's first update is logged as the hurt itself
+        sources = [
+            Hurt.objects.all(),
+            Update.objects.select_related('hurt').exclude(
+                id__in=Hurt.objects.filter(first_update__isnull=False).values('first_update_id')),
+            Healing.objects.all(),
+            Treatment.objects.all(),
+        ]
+
+        total = 0
+        with transaction.atomic():
+            Activity.objects.all().delete()
+            for source in sources:
+                batch = []
+                for instance in source.iterator():
+                    batch.append(activity_for(instance))
+                    if len(batch) >= batch_size:
+                        Activity.objects.bulk_create(batch)
+                        total += len(batch)
+                        batch = []
+                Activity.objects.bulk_create(batch)
+                total += len(batch)
+
+        self.stdout.write(f"rebuilt activity log with {total} entries")
@@ -0,0 +1,20 @@
+""" Management command to rebuild every patient's DailyRollup rows from their Healings """
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from whereithurtsapi.helpers import refresh_daily_rollup, rollup_day
+from whereithurtsapi.models import DailyRollup, Healing
+
+
+class Command(BaseCommand):
+    help = "Clear the daily healing rollups and recompute them from every Healing"
+
+    def handle(self, *args, **options):
+        patient_days = {(patient_id, rollup_day(added_on)) for patient_id, added_on
+                        in Healing.objects.values_list('patient_id', 'added_on').iterator()}
+
+        with transaction.atomic():
+            DailyRollup.objects.all().delete()
+            for patient_id, day in patient_days:
+                refresh_daily_rollup(patient_id, day)
+
+        self.stdout.write(f"rebuilt {len(patient_days)} daily rollups")
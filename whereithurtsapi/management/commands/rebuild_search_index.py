@@ -0,0 +1,16 @@
+""" Management command to rebuild the Treatment search index """
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from whereithurtsapi.helpers import reindex_treatments
+from whereithurtsapi.models import Treatment, TreatmentSearchTerm
+
+
+class Command(BaseCommand):
+    help = "Clear the Treatment search index and re-index every Treatment"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            TreatmentSearchTerm.objects.all().delete()
+            reindex_treatments(Treatment.objects.all())
+
+        self.stdout.write(f"indexed {Treatment.objects.count()} treatments")
@@ -0,0 +1,21 @@
+""" Management command standing in for replication between SQLite files """
+import time
+from django.core.management.base import BaseCommand
+from whereithurtsapi.helpers import replicate_sqlite
+
+
+class Command(BaseCommand):
+    help = ("Copy the default SQLite database into every replica in READ_REPLICAS['ALIASES'], once or "
+            "every --every seconds, standing in for a replicated database when developing with SQLite files")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--every', type=float, default=None,
+                            help="keep copying, waiting this many seconds in between")
+
+    def handle(self, *args, **options):
+        while True:
+            aliases = replicate_sqlite()
+            self.stdout.write(f"copied the default database to {', '.join(aliases) or 'no replicas'}")
+            if options['every'] is None:
+                return
+            time.sleep(options['every'])
@@ -0,0 +1,16 @@
+""" Management command to recompute the effectiveness score of every Treatment """
+from django.core.management.base import BaseCommand
+from whereithurtsapi.helpers import score_treatments
+from whereithurtsapi.helpers.effectiveness import EFFECTIVENESS_WINDOW_DAYS
+
+
+class Command(BaseCommand):
+    help = "Score every Treatment by the drop in pain level after the healings that used it"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--window-days', type=int, default=EFFECTIVENESS_WINDOW_DAYS,
+                            help="days after a healing its hurts' pain level is compared over")
+
+    def handle(self, *args, **options):
+        scored = score_treatments(options['window_days'])
+        self.stdout.write(f"scored {scored} treatments")
@@ -0,0 +1,36 @@
+""" Management command to backfill or verify the update summary stored on each Hurt """
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from whereithurtsapi.models import Hurt
+
+SUMMARY_FIELDS = ('first_update_id', 'latest_update_id', 'first_update_notes', 'first_pain_level',
+                  'last_pain_level', 'last_updated_on', 'update_count')
+
+
+class Command(BaseCommand):
+    help = "Recompute every Hurt's update summary, or with --verify report hurts whose summary is stale"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true',
+                            help="only check the stored summaries; exit with an error if any are stale")
+
+    def handle(self, *args, **options):
+        stale = []
+
+        for hurt in Hurt.objects.all().iterator():
+            stored = [getattr(hurt, field) for field in SUMMARY_FIELDS]
+
+            # recompute inside a transaction that is rolled back when only verifying
+            with transaction.atomic():
+                hurt.refresh_summary()
+                if [getattr(hurt, field) for field in SUMMARY_FIELDS] != stored:
+                    stale.append(hurt.id)
+                if options['verify']:
+                    transaction.set_rollback(True)
+
+        if options['verify']:
+            if stale:
+                raise CommandError(f"{len(stale)} hurt summaries are stale: {stale}")
+            self.stdout.write("all hurt summaries are up to date")
+        else:
+            self.stdout.write(f"refreshed {len(stale)} stale hurt summaries")
@@ -0,0 +1,79 @@
+""" Middleware for the whereithurts API """
+import asyncio
+from asgiref.sync import sync_to_async
+from rest_framework.authentication import get_authorization_header
+from rest_framework.exceptions import AuthenticationFailed
+from whereithurtsapi.authentication import PatientTokenAuthentication
+from whereithurtsapi.helpers.replicas import (current_replica_reads, get_replica_pins, handling_request, pin_to_primary,
+                                             replica_action)
+
+
+def token_user_id(request):
+    """ The id of the user whose token a request carries, or None without a valid one """
+    auth = get_authorization_header(request).split()
+    if len(auth) != 2 or auth[0].lower() != b'token':
+        return None
+    try:
+        user, _ = PatientTokenAuthentication().authenticate_credentials(auth[1].decode())
+    except (AuthenticationFailed, UnicodeError):
+        return None
+    return user.pk
+
+
+class ReadReplicaMiddleware:
+    """ Lets GET requests to the viewset actions in settings.READ_REPLICAS['ACTIONS'] read
+    from a replica (see ReadReplicaRouter), unless their user wrote in the last PIN_SECONDS
+
+    A request that writes pins its user to the primary for PIN_SECONDS once it is done, so
+    the next requests read what it wrote even while the replicas are behind. Users are told
+    apart by token before the view runs; looking the token up also caches it for the view's
+    authentication.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # as MiddlewareMixin does, so Django awaits this middleware under ASGI instead of
+            # giving every request a thread; views are checked without leaving the event loop too
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+            self.process_view = self.async_process_view
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        with handling_request() as reads:
+            response = self.get_response(request)
+            if reads.wrote:
+                self.pin_writer(request)
+        return response
+
+    async def __acall__(self, request):
+        with handling_request() as reads:
+            response = await self.get_response(request)
+            if reads.wrote:
+                await sync_to_async(self.pin_writer)(request)
+        return response
+
+    def pin_writer(self, request):
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            pin_to_primary(user.pk)
+
+    def allow_replica_reads(self, request):
+        user_id = token_user_id(request)
+        if user_id is None or not get_replica_pins().is_pinned(user_id):
+            current_replica_reads().allowed = True
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if replica_action(request.method, view_func):
+            self.allow_replica_reads(request)
+        return None
+
+    async def async_process_view(self, request, view_func, view_args, view_kwargs):
+        # looking the token up may query, so only requests to replica actions leave the event loop
+        if replica_action(request.method, view_func):
+            await sync_to_async(self.allow_replica_reads)(request)
+        return None
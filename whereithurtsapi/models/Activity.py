@@ -0,0 +1,29 @@
+""" Database module for the patient Activity log """
+from django.db import models
+
+
+class Activity(models.Model):
+    """ Append-only log of what a Patient has added, newest first, so their
+    recent activity is an indexed top-N read instead of a merge of every
+    Hurt, Update, Healing and Treatment they've ever created
+
+    Exactly one of hurt/update/healing/treatment is set, matching activity_type;
+    deleting that row deletes its log entry with it
+    """
+    patient = models.ForeignKey("Patient", on_delete=models.CASCADE)
+    activity_type = models.CharField(max_length=20)
+    added_on = models.DateTimeField()
+    hurt = models.ForeignKey("Hurt", null=True, related_name="+", on_delete=models.CASCADE)
+    update = models.ForeignKey("Update", null=True, related_name="+", on_delete=models.CASCADE)
+    healing = models.ForeignKey("Healing", null=True, related_name="+", on_delete=models.CASCADE)
+    treatment = models.ForeignKey("Treatment", null=True, related_name="+", on_delete=models.CASCADE)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['patient', 'added_on'], name='activity_patient_added_on'),
+        ]
+
+    @property
+    def subject(self):
+        """ The Hurt, Update, Healing or Treatment this entry is about """
+        return getattr(self, self.activity_type.lower())
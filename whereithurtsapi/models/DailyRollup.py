@@ -0,0 +1,22 @@
+""" Database module for per-patient daily Healing rollups """
+from django.db import models
+
+
+class DailyRollup(models.Model):
+    """ Totals of one Patient's Healings on one day, kept up to date on every Healing
+    write so a profile snapshot reads one row per day instead of every healing
+
+    treatment_ids and hurt_ids are the sorted ids of the treatments and hurts
+    the day's healings were tagged with
+    """
+    patient = models.ForeignKey("Patient", on_delete=models.CASCADE)
+    day = models.DateField()
+    healing_seconds = models.IntegerField(default=0)
+    healing_count = models.IntegerField(default=0)
+    treatment_ids = models.JSONField(default=list)
+    hurt_ids = models.JSONField(default=list)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['patient', 'day'], name='dailyrollup_patient_day'),
+        ]
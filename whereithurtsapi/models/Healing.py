@@ -4,11 +4,22 @@ from django.db import models
 class Healing(models.Model):
     """Database Healing model"""
 
-    patient = models.ForeignKey("Patient", on_delete=models.CASCADE)
+    # patient is indexed by healing_patient_added_on below
+    patient = models.ForeignKey("Patient", on_delete=models.CASCADE, db_index=False)
     notes = models.CharField(max_length=300)
     duration = models.IntegerField()
     added_on = models.DateTimeField()
     intensity = models.IntegerField(default=0)
+    # sent with (or generated for) healings created by /healings/bulk, so a replayed import is recognized
+    idempotency_key = models.CharField(max_length=64, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['patient', 'added_on'], name='healing_patient_added_on'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['patient', 'idempotency_key'], name='healing_patient_idempotency_key'),
+        ]
 
     @property
     def treatments(self):
@@ -2,5 +2,14 @@
 from django.db import models
 
 class HealingTreatment(models.Model):
-    healing = models.ForeignKey("Healing", related_name="healing_treatments", on_delete=models.CASCADE)
-    treatment = models.ForeignKey("Treatment", related_name="healing_treatments", on_delete=models.CASCADE)
\ No newline at end of file
+    # each direction is indexed by the constraint and index below instead of per column
+    healing = models.ForeignKey("Healing", related_name="healing_treatments", on_delete=models.CASCADE, db_index=False)
+    treatment = models.ForeignKey("Treatment", related_name="healing_treatments", on_delete=models.CASCADE, db_index=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['healing', 'treatment'], name='healingtreatment_healing_treatment'),
+        ]
+        indexes = [
+            models.Index(fields=['treatment', 'healing'], name='healingtreatment_treatment'),
+        ]
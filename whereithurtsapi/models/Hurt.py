@@ -4,24 +4,57 @@ from django.db import models
 class Hurt(models.Model):
     """Database Hurt model"""
 
-    patient = models.ForeignKey("Patient", on_delete=models.CASCADE)
+    # patient is indexed by hurt_patient_is_active below
+    patient = models.ForeignKey("Patient", on_delete=models.CASCADE, db_index=False)
     bodypart = models.ForeignKey("Bodypart", on_delete=models.DO_NOTHING)
     name = models.CharField(max_length=100)
     added_on = models.DateTimeField()
     is_active = models.BooleanField(default=True)
 
+    # Summary of this hurt's updates, kept in sync by refresh_summary() whenever
+    # an Update is written so serializing a hurt doesn't query its update_set
+    first_update = models.ForeignKey("Update", null=True, related_name="+", on_delete=models.SET_NULL)
+    latest_update = models.ForeignKey("Update", null=True, related_name="+", on_delete=models.SET_NULL)
+    first_update_notes = models.CharField(max_length=300, default="")
+    first_pain_level = models.IntegerField(null=True)
+    last_pain_level = models.IntegerField(null=True)
+    last_updated_on = models.DateTimeField(null=True)
+    update_count = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['patient', 'is_active'], name='hurt_patient_is_active'),
+        ]
+
+    def refresh_summary(self):
+        """ Recompute the update summary columns from this hurt's update_set and save them """
+        updates = self.update_set.order_by('added_on', 'id')
+        first_update = updates.first()
+        latest_update = updates.last()
+
+        self.first_update = first_update
+        self.latest_update = latest_update
+        self.first_update_notes = first_update.notes if first_update is not None else ""
+        self.first_pain_level = first_update.pain_level if first_update is not None else None
+        self.last_pain_level = latest_update.pain_level if latest_update is not None else None
+        self.last_updated_on = latest_update.added_on if latest_update is not None else None
+        self.update_count = updates.count()
+        self.save(update_fields=['first_update', 'latest_update', 'first_update_notes', 'first_pain_level',
+                                 'last_pain_level', 'last_updated_on', 'update_count'])
+
     @property
     def notes(self):
-        first_update = self.update_set.order_by('added_on')[0]
-        return f"{first_update.notes}"
+        return self.first_update_notes
 
     @property
     def pain_level(self):
-        first_update = self.update_set.order_by('added_on')[0]
-        return first_update.pain_level
+        return self.first_pain_level
 
     @property
     def healing_count(self):
+        # use the count annotated by a list query when it is present
+        if hasattr(self, '_healing_count'):
+            return self._healing_count
         return self.hurt_healings.all().count()
 
     @property
@@ -36,21 +69,18 @@ class Hurt(models.Model):
 
     @property 
     def latest_pain_level(self):
-        last_update = self.update_set.all().order_by('-added_on')[0]
-        return last_update.pain_level
+        return self.last_pain_level
     
     @property
     def updates(self):
+        # a list query prefetches the update_set already ordered by added_on
+        if 'update_set' in getattr(self, '_prefetched_objects_cache', {}):
+            return self.update_set.all()
         return self.update_set.all().order_by('added_on')
 
     @property
     def last_update(self):
-        last_update = self.update_set.all().order_by('-added_on')[0]
-        return last_update.added_on
-    
-    @property
-    def first_update_id(self):
-        return self.update_set.all().order_by('added_on')[0].id
+        return self.last_updated_on
 
     #this doesn't work, its based on a UTC timestamp
     @property
@@ -2,5 +2,14 @@
 from django.db import models
 
 class HurtHealing(models.Model):
-    hurt = models.ForeignKey("Hurt", related_name="hurt_healings", on_delete=models.CASCADE)
-    healing = models.ForeignKey("Healing", related_name="hurt_healings", on_delete=models.CASCADE)
\ No newline at end of file
+    # each direction is indexed by the constraint and index below instead of per column
+    hurt = models.ForeignKey("Hurt", related_name="hurt_healings", on_delete=models.CASCADE, db_index=False)
+    healing = models.ForeignKey("Healing", related_name="hurt_healings", on_delete=models.CASCADE, db_index=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['hurt', 'healing'], name='hurthealing_hurt_healing'),
+        ]
+        indexes = [
+            models.Index(fields=['healing', 'hurt'], name='hurthealing_healing_hurt'),
+        ]
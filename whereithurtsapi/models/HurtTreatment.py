@@ -2,5 +2,14 @@
 from django.db import models
 
 class HurtTreatment(models.Model):
-    hurt = models.ForeignKey("Hurt", related_name="hurt_treatments", on_delete=models.CASCADE)
-    treatment = models.ForeignKey("Treatment", related_name="hurt_treatments", on_delete=models.CASCADE)
\ No newline at end of file
+    # each direction is indexed by the constraint and index below instead of per column
+    hurt = models.ForeignKey("Hurt", related_name="hurt_treatments", on_delete=models.CASCADE, db_index=False)
+    treatment = models.ForeignKey("Treatment", related_name="hurt_treatments", on_delete=models.CASCADE, db_index=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['hurt', 'treatment'], name='hurttreatment_hurt_treatment'),
+        ]
+        indexes = [
+            models.Index(fields=['treatment', 'hurt'], name='hurttreatment_treatment_hurt'),
+        ]
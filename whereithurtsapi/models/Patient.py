@@ -1,10 +1,15 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.db.models import F
+from .Update import Update
 
 
 class Patient(models.Model):
     """ Model for Patients resource """
     user = models.OneToOneField(User, on_delete=models.DO_NOTHING)
+    # bumped by touch_patients() on every write to data shown in this patient's resources,
+    # so read endpoints can answer a matching If-None-Match without querying that data
+    data_version = models.IntegerField(default=0)
 
     @property
     def full_name(self):
@@ -38,24 +43,8 @@ class Patient(models.Model):
     def treatments(self):
         return self.treatment_set.all()
 
-    """ property to return all updates added by this user """
+    """ property to return all updates added by this user, apart from the first update
+    of each hurt (which is shown as the hurt itself) """
     @property
     def updates(self):
-        hurts = self.hurt_set.all()
-        #intialize empty lists for the udpate querysets for each hurt, and for the eventual
-        # final list of update instances
-        update_qsets = []
-        updates = []
-        ## add the update_sqset for each hurt to the update_qsets list
-        for hurt in hurts:
-            update_qsets.append(hurt.update_set.exclude(id=hurt.first_update_id))
-        ## for each update_qset, append each update entry in it to the final list
-        for update_qset in update_qsets:
-            for update in update_qset:
-                updates.append(update)
-        return updates
-
-
-
-
-
+        return Update.objects.filter(hurt__patient=self).exclude(id=F('hurt__first_update_id'))
@@ -5,16 +5,26 @@ from django.db.models.deletion import DO_NOTHING
 
 class Treatment(models.Model):
     # Bodypart and Treatment Type are developer-defined so should not be deleted, but ideally will be handled better if accidentally deleted (e.g. fallback category)
-    added_by = models.ForeignKey("Patient", on_delete=DO_NOTHING)
-    bodypart = models.ForeignKey("Bodypart", on_delete=DO_NOTHING)
+    # added_by and bodypart are indexed by the composite indexes below
+    added_by = models.ForeignKey("Patient", on_delete=DO_NOTHING, db_index=False)
+    bodypart = models.ForeignKey("Bodypart", on_delete=DO_NOTHING, db_index=False)
     treatmenttype = models.ForeignKey("TreatmentType", on_delete=DO_NOTHING)
     name = models.CharField(max_length=75)
     added_on = models.DateTimeField()
     notes = models.CharField(max_length=400)
     public = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['added_by', 'public'], name='treatment_added_by_public'),
+            models.Index(fields=['bodypart', 'treatmenttype'], name='treatment_bodypart_type'),
+        ]
+
     @property
     def healing_count(self):
+        # use the count annotated by the list query when it is present
+        if hasattr(self, 'healings'):
+            return self.healings
         return self.healing_treatments.all().count()
 
     @property
@@ -0,0 +1,16 @@
+""" Database module for precomputed Treatment effectiveness scores """
+from django.db import models
+
+
+class TreatmentScore(models.Model):
+    """ How much a Treatment has helped, computed by the score_treatments command from
+    every healing that used it, so lists can be ordered by it without computing it per request
+
+    effectiveness is the average drop in pain level on the healing's hurts in the days after
+    it, weighted by the healing's duration and intensity (see score_treatments); samples is
+    how many (healing, hurt) pairs it was computed from. Treatments without any have no row.
+    """
+    treatment = models.OneToOneField("Treatment", related_name="score", primary_key=True, on_delete=models.CASCADE)
+    effectiveness = models.FloatField()
+    samples = models.IntegerField()
+    scored_on = models.DateTimeField()
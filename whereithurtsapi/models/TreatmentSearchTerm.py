@@ -0,0 +1,23 @@
+""" Database module for the Treatment search index """
+from django.db import models
+
+
+class TreatmentSearchTerm(models.Model):
+    """ One word found in a Treatment's name, notes, bodypart name or treatment type name
+
+    Together these rows are an inverted index from words to treatments, rebuilt by
+    index_treatment() whenever a treatment is written. weight is the sum of the weights
+    of the fields the word appears in, so matches on a treatment's name rank higher
+    than matches in its notes.
+    """
+    treatment = models.ForeignKey("Treatment", related_name="search_terms", on_delete=models.CASCADE)
+    term = models.CharField(max_length=50)
+    weight = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['treatment', 'term'], name='treatmentsearchterm_treatment_term'),
+        ]
+        indexes = [
+            models.Index(fields=['term', 'treatment'], name='treatmentsearchterm_term'),
+        ]
@@ -3,10 +3,21 @@ from django.db import models
 
 class Update(models.Model):
     
-    hurt = models.ForeignKey("Hurt", on_delete=models.CASCADE)
+    # hurt is indexed by update_hurt_added_on below
+    hurt = models.ForeignKey("Hurt", on_delete=models.CASCADE, db_index=False)
     added_on = models.DateTimeField()
     pain_level = models.IntegerField()
     notes = models.CharField(max_length=300)
+    # sent with (or generated for) updates created by /updates/bulk, so a replayed import is recognized
+    idempotency_key = models.CharField(max_length=64, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['hurt', 'added_on'], name='update_hurt_added_on'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['hurt', 'idempotency_key'], name='update_hurt_idempotency_key'),
+        ]
 
     """ property to establish if this Update is the first one for a Hurt, 
         which dictates whether or not it is editable as a standalone Update
@@ -31,14 +42,20 @@ class Update(models.Model):
 
     @property
     def pain_level_difference(self):
-        try:
-            previous = self.get_previous_by_added_on(hurt=self.hurt)
-            if previous.pain_level > self.pain_level:
-                return f"Down {previous.pain_level - self.pain_level} from last update"
-            elif previous.pain_level < self.pain_level:
-                return f"Up {self.pain_level - previous.pain_level} from last update"
-            else:
-                return "No change from last update"
-        except:
-            pass
+        # use the previous update's pain level annotated by a list query when it is present
+        if hasattr(self, '_previous_pain_level'):
+            previous_pain_level = self._previous_pain_level
+        else:
+            try:
+                previous_pain_level = self.get_previous_by_added_on(hurt=self.hurt).pain_level
+            except Update.DoesNotExist:
+                previous_pain_level = None
 
+        if previous_pain_level is None:
+            return None
+        if previous_pain_level > self.pain_level:
+            return f"Down {previous_pain_level - self.pain_level} from last update"
+        elif previous_pain_level < self.pain_level:
+            return f"Up {self.pain_level - previous_pain_level} from last update"
+        else:
+            return "No change from last update"
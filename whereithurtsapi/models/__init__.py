@@ -9,3 +9,7 @@ from .TreatmentLink import TreatmentLink
 from .HurtTreatment import HurtTreatment
 from .HurtHealing import HurtHealing
 from .HealingTreatment import HealingTreatment
+from .Activity import Activity
+from .DailyRollup import DailyRollup
+from .TreatmentSearchTerm import TreatmentSearchTerm
+from .TreatmentScore import TreatmentScore
@@ -0,0 +1,48 @@
+""" Database router for the whereithurts API """
+import random
+from django.db import DEFAULT_DB_ALIAS, connections
+from whereithurtsapi.helpers.replicas import current_replica_reads, read_replica_options
+
+
+class ReadReplicaRouter:
+    """ Sends this app's reads to one of the replicas in settings.READ_REPLICAS['ALIASES'],
+    the same one for every read of a request, while ReadReplicaMiddleware allows it for
+    the request being handled, and everything else to the primary
+
+    Reads made outside of a request (commands, streamed response rows, which are read
+    after the middleware returns), reads of other apps' models (the users and tokens
+    authentication loads) and reads inside a transaction stay on the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        reads = current_replica_reads()
+        if reads is None or not reads.allowed or model._meta.app_label != 'whereithurtsapi':
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        aliases = read_replica_options()['ALIASES']
+        if not aliases:
+            return None
+        # one replica per request, so its reads don't see replicas at different points of replication
+        if reads.replica not in aliases:
+            reads.replica = random.choice(aliases)
+        return reads.replica
+
+    def db_for_write(self, model, **hints):
+        reads = current_replica_reads()
+        if reads is not None:
+            reads.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same rows as the primary
+        databases = {DEFAULT_DB_ALIAS, *read_replica_options()['ALIASES']}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas get their tables from the primary
+        if db in read_replica_options()['ALIASES']:
+            return False
+        return None
@@ -0,0 +1,103 @@
+""" Signal receivers that keep the API's caches and indexes consistent with the database """
+from django.contrib.auth.models import User
+from django.db.backends.signals import connection_created
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+from whereithurtsapi.authentication import get_token_cache, invalidate_user_tokens
+from whereithurtsapi.helpers import reference_data_changed, reindex_treatments, touch_patients, treatments_changed, tune_sqlite_connection
+from whereithurtsapi.models import (Bodypart, Healing, HealingTreatment, Hurt, HurtTreatment, Patient, Treatment,
+                                    TreatmentLink, TreatmentType)
+
+
+# every new SQLite connection gets the pragmas from settings.SQLITE_PRAGMAS before its first query
+@receiver(connection_created)
+def tune_new_connection(sender, connection, **kwargs):
+    tune_sqlite_connection(connection)
+
+
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(sender, instance, **kwargs):
+    get_token_cache().delete(instance.key)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_changed_user_tokens(sender, instance, **kwargs):
+    invalidate_user_tokens(instance.pk)
+
+
+@receiver(post_save, sender=User)
+def touch_changed_user_patient(sender, instance, created, update_fields=None, **kwargs):
+    # a patient's name and email are read from their user, so editing it changes /patients/<id>;
+    # logging in only saves last_login, which no response shows
+    if not created and update_fields != frozenset(['last_login']):
+        touch_patients(Patient.objects.filter(user=instance).values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Patient)
+@receiver(post_delete, sender=Patient)
+def forget_changed_patient_tokens(sender, instance, **kwargs):
+    invalidate_user_tokens(instance.user_id)
+
+
+# bodyparts and treatment types are only edited through the admin, so the registry
+# every process keeps of them is reloaded, and renaming one re-indexes the treatments
+# that carry its name, here rather than in a view
+@receiver(post_save, sender=Bodypart)
+@receiver(post_delete, sender=Bodypart)
+@receiver(post_save, sender=TreatmentType)
+@receiver(post_delete, sender=TreatmentType)
+def reload_reference_data(sender, instance, **kwargs):
+    reference_data_changed()
+
+
+@receiver(post_save, sender=Bodypart)
+def reindex_bodypart_treatments(sender, instance, created, **kwargs):
+    if not created:
+        reindex_treatments(Treatment.objects.filter(bodypart=instance))
+        touch_every_patient()
+
+
+@receiver(post_save, sender=TreatmentType)
+def reindex_treatmenttype_treatments(sender, instance, created, **kwargs):
+    if not created:
+        reindex_treatments(Treatment.objects.filter(treatmenttype=instance))
+        touch_every_patient()
+
+
+def touch_every_patient():
+    # the renamed row is embedded in hurts and treatments across patients, and admin edits
+    # are rare enough that bumping every data version is cheaper than finding the affected ones
+    Patient.objects.update(data_version=F('data_version') + 1)
+
+
+
+# the public treatment lists cache treatments serialized with their links, hurts, healing
+# count, author, bodypart and type, so a write to any of those invalidates them. Bridge rows
+# and links are bulk inserted and deleted alongside a save of the treatment, healing or hurt
+# they belong to, in the same transaction, so only their single-row inserts are received here;
+# a delete receiver would also stop Django from deleting them in bulk.
+@receiver(post_save, sender=Treatment)
+@receiver(post_delete, sender=Treatment)
+@receiver(post_save, sender=TreatmentLink)
+@receiver(post_save, sender=HurtTreatment)
+@receiver(post_save, sender=HealingTreatment)
+@receiver(post_save, sender=Healing)
+@receiver(post_delete, sender=Healing)
+@receiver(post_save, sender=Patient)
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Bodypart)
+@receiver(post_save, sender=TreatmentType)
+def invalidate_public_treatments(sender, instance, **kwargs):
+    treatments_changed()
+
+
+# a hurt's summary is embedded in the treatments it is tagged with, which most hurts aren't;
+# every update write ends with the hurt saving its refreshed summary
+@receiver(post_save, sender=Hurt)
+@receiver(pre_delete, sender=Hurt)
+def invalidate_public_treatments_of_hurt(sender, instance, **kwargs):
+    if HurtTreatment.objects.filter(hurt=instance).exists():
+        treatments_changed()
@@ -2,14 +2,19 @@ from rest_framework.serializers import ModelSerializer
 from rest_framework.viewsets import ViewSet
 from rest_framework.response import Response
 from rest_framework import status
+from django.utils.cache import patch_cache_control
 from whereithurtsapi.models import Bodypart
+from whereithurtsapi.helpers import REFERENCE_MAX_AGE, IconVariantsField, get_reference_registry, icon_manifest, not_modified, with_etag
 
 # Serializers
 class BodypartSerializer(ModelSerializer):
     """ JSON serializer for the Bodypart model  """
+    hurt_image_variants = IconVariantsField(source='hurt_image')
+    treatment_image_variants = IconVariantsField(source='treatment_image')
+
     class Meta:
         model = Bodypart
-        fields = ['id', 'name', 'hurt_image']
+        fields = ['id', 'name', 'hurt_image', 'hurt_image_variants', 'treatment_image_variants']
         depth = 1
 
     
@@ -17,9 +22,21 @@ class BodypartSerializer(ModelSerializer):
 class BodypartViewSet(ViewSet):
     """ ViewSet for the Bodypart model """
     def list(self, request):
+        """ The bodyparts, from the reference registry
+
+        They change only when an admin edits them, so clients and proxies may reuse
+        the list for a day and revalidate it with its ETag after that
+        """
         try:
-            bodyparts = Bodypart.objects.all()
-            serializer = BodypartSerializer(bodyparts, many=True, context={'request': request})
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            reference_data = get_reference_registry().data()
+            # the list carries icon variant urls, so a rebuilt manifest changes its tag too
+            etag = f'"{reference_data.digest}-{icon_manifest.version()}"'
+            response = not_modified(request, etag)
+            if response is None:
+                bodyparts = reference_data.all(Bodypart)
+                serializer = BodypartSerializer(bodyparts, many=True, context={'request': request})
+                response = with_etag(Response(serializer.data, status=status.HTTP_200_OK), etag)
+            patch_cache_control(response, public=True, max_age=REFERENCE_MAX_AGE)
+            return response
         except Exception as ex:
             return Response({'message': ex.args[0]}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
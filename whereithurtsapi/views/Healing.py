@@ -1,14 +1,19 @@
 from django.core.exceptions import ValidationError
 from rest_framework.serializers import ModelSerializer
 from rest_framework.viewsets import ViewSet
+from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework import status
-from whereithurtsapi.models import Healing, Patient, Treatment, HealingTreatment, HurtHealing, Hurt
+from whereithurtsapi.models import Healing, Treatment, HealingTreatment, HurtHealing, Hurt, Activity
 from whereithurtsapi.views.Treatment import TreatmentSerializer
-from whereithurtsapi.views.Hurt import HurtSerializer
-from whereithurtsapi.helpers import paginate
+from whereithurtsapi.views.Hurt import HurtSerializer, NestedPatientSerializer
+from whereithurtsapi.helpers import paginate_request, requesting_patient, resolve_ids, sync_links, record_activity, refresh_healing_rollup, compiled, data_version_etag, not_modified, related_patients, touch_patients, with_etag
+from whereithurtsapi.helpers import (BulkItemError, activity_for, bulk_items, bulk_results, idempotency_keys, insert_keyed,
+                                     item_added_on, item_ids, item_notes, item_value, plan_bulk_create, refresh_daily_rollup,
+                                     rollup_day, treatments_changed)
 from django.utils import timezone
-from django.db.models import Sum
+from django.db import IntegrityError, transaction
+from django.db.models import Q, Sum
 
 # Serializers
 
@@ -37,6 +42,7 @@ class HealingSerializer(ModelSerializer):
     """JSON serializer for the Healing model """
     treatments = TreatmentSerializer(many=True)
     hurts = HurtSerializer(many=True)
+    patient = NestedPatientSerializer()
 
     class Meta:
         model = Healing
@@ -57,7 +63,7 @@ class HealingViewSet(ViewSet):
             Response -- JSON Serialized Healing instance
         """
         # find patient making this POST request and assign them as the patient for a new healing
-        patient = Patient.objects.get(user=request.auth.user)
+        patient = requesting_patient(request)
         healing = Healing()
         healing.patient = patient
 
@@ -72,8 +78,7 @@ class HealingViewSet(ViewSet):
         treatment_ids = request.data["treatment_ids"]
 
         try:
-            treatments = [Treatment.objects.get(
-                pk=treatment_id) for treatment_id in treatment_ids]
+            treatments = resolve_ids(Treatment, treatment_ids)
         except Treatment.DoesNotExist:
             return Response({'message': 'request contains a treatment id for a non-existent treatment'}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
 
@@ -81,30 +86,104 @@ class HealingViewSet(ViewSet):
         hurt_ids = request.data["hurt_ids"]
 
         try:
-            hurts = [Hurt.objects.get(pk=hurt_id) for hurt_id in hurt_ids]
+            hurts = resolve_ids(Hurt, hurt_ids)
         except Hurt.DoesNotExist:
             return Response({'message': 'request contains a hurt id for a non-existent hurt'}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
 
-        # Try to save the new Healing to the database
+        # Try to save the new Healing and its bridge table relationships to the database together
         try:
-            healing.save()
+            with transaction.atomic():
+                healing.save()
+                record_activity(healing)
+                sync_links(HealingTreatment, 'healing', healing, 'treatment', treatments, is_new=True)
+                sync_links(HurtHealing, 'healing', healing, 'hurt', hurts, is_new=True)
+                refresh_healing_rollup(healing)
+                touch_patients(related_patients(healings=[healing]))
         except ValidationError as ex:
             return Response({"reason": ex.message}, status=status.HTTP_400_BAD_REQUEST)
 
-        # save bridge table relationships
-        for treatment in treatments:
-            healing_treatment = HealingTreatment(
-                healing=healing, treatment=treatment)
-            healing_treatment.save()
-
-        for hurt in hurts:
-            hurt_healing = HurtHealing(hurt=hurt, healing=healing)
-            hurt_healing.save()
-
         # serialize the new healing and send it back
         serialzier = HealingSerializer(healing, context={'request': request})
         return Response(serialzier.data, status=status.HTTP_201_CREATED)
 
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """ Create many healings in one transaction, e.g. sessions logged offline
+
+        POST /healings/bulk
+        {"healings": [{"notes": "stretched", "duration": 600, "intensity": 50, "treatment_ids": [1],
+                       "hurt_ids": [2], "added_on": "2021-01-05T08:00:00Z", "idempotency_key": "8c1e..."}, ...]}
+
+        added_on defaults to now and intensity to 0. The treatments and hurts of every item
+        are each looked up with one query; hurts must belong to the requesting patient, and
+        treatments must be theirs or public. Either every item is created or, if any is
+        invalid, none is; the response has a result per item, in order, with its status and
+        id. An item whose idempotency_key was imported before isn't created again; its
+        result has the existing id, so a client can safely replay a request it got no response for.
+        """
+        patient = requesting_patient(request)
+        try:
+            items = bulk_items(request.data, 'healings')
+        except ValueError as ex:
+            return Response({'message': ex.args[0]}, status=status.HTTP_400_BAD_REQUEST)
+
+        def referenced_ids(name):
+            return {pk for item in items if isinstance(item.get(name, None), list)
+                    for pk in item[name] if isinstance(pk, int)}
+
+        usable_treatment_ids = set(Treatment.objects.filter(
+            Q(added_by_id=patient.id) | Q(public=True), id__in=referenced_ids('treatment_ids')).values_list('id', flat=True))
+        owned_hurt_ids = set(Hurt.objects.filter(
+            patient_id=patient.id, id__in=referenced_ids('hurt_ids')).values_list('id', flat=True))
+        imported = dict(Healing.objects.filter(patient=patient, idempotency_key__in=idempotency_keys(items))
+                        .values_list('idempotency_key', 'id'))
+
+        def build(item):
+            treatment_ids = item_ids(item, 'treatment_ids')
+            hurt_ids = item_ids(item, 'hurt_ids')
+            if not usable_treatment_ids.issuperset(treatment_ids):
+                raise BulkItemError('request contains a treatment id for a non-existent or private treatment',
+                                    status.HTTP_422_UNPROCESSABLE_ENTITY)
+            if not owned_hurt_ids.issuperset(hurt_ids):
+                raise BulkItemError('request contains a hurt id for a non-existent hurt or another patient\'s hurt',
+                                    status.HTTP_422_UNPROCESSABLE_ENTITY)
+            healing = Healing(patient=patient, notes=item_notes(item, Healing._meta.get_field('notes').max_length),
+                              duration=item_value(item, 'duration', int), intensity=item_value(item, 'intensity', int, 0),
+                              added_on=item_added_on(item))
+            # linked once the healing has an id
+            healing._treatment_ids, healing._hurt_ids = treatment_ids, hurt_ids
+            return healing
+
+        healings, results = plan_bulk_create(items, imported, build)
+        if any(result['status'] >= status.HTTP_400_BAD_REQUEST for result in results):
+            return Response({'message': 'no healings were created', 'results': results},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        # the healings, their links and their activity are inserted in bulk, and each day's
+        # rollup is refreshed once however many of its healings were imported
+        if healings:
+            try:
+                with transaction.atomic():
+                    insert_keyed(Healing, healings, 'patient')
+                    HealingTreatment.objects.bulk_create([
+                        HealingTreatment(healing_id=healing.id, treatment_id=treatment_id)
+                        for healing in healings.values() for treatment_id in healing._treatment_ids])
+                    HurtHealing.objects.bulk_create([
+                        HurtHealing(healing_id=healing.id, hurt_id=hurt_id)
+                        for healing in healings.values() for hurt_id in healing._hurt_ids])
+                    Activity.objects.bulk_create([activity_for(healing) for healing in healings.values()])
+                    for day in {rollup_day(healing.added_on) for healing in healings.values()}:
+                        refresh_daily_rollup(patient.id, day)
+                    touch_patients(related_patients(healings=healings.values()))
+                    # bulk inserts send no post_save, which would invalidate the treatments' healing counts
+                    treatments_changed()
+            except IntegrityError:
+                return Response({'message': 'these healings are being imported by another request; retry to get their results'},
+                                status=status.HTTP_409_CONFLICT)
+
+        return Response({'results': bulk_results(healings, results)},
+                        status=status.HTTP_201_CREATED if healings else status.HTTP_200_OK)
+
     def update(self, request, pk=None):
         """ Handle an update request for a Healing
         'user', and 'added_on' attributes are not subject to update
@@ -124,8 +203,7 @@ class HealingViewSet(ViewSet):
         treatment_ids = request.data["treatment_ids"]
 
         try:
-            treatments = [Treatment.objects.get(
-                pk=treatment_id) for treatment_id in treatment_ids]
+            treatments = resolve_ids(Treatment, treatment_ids)
         except Treatment.DoesNotExist:
             return Response({'message': 'request contains a treatment id for a non-existent treatment'}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
 
@@ -133,56 +211,40 @@ class HealingViewSet(ViewSet):
         hurt_ids = request.data["hurt_ids"]
 
         try:
-            hurts = [Hurt.objects.get(pk=hurt_id) for hurt_id in hurt_ids]
-        except Treatment.DoesNotExist:
-            return Response({'message': 'request contains a treatment id for a non-existent treatment'}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+            hurts = resolve_ids(Hurt, hurt_ids)
+        except Hurt.DoesNotExist:
+            return Response({'message': 'request contains a hurt id for a non-existent hurt'}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
 
-        # Try to save the updated Healing to the database
+        # Try to save the updated Healing to the database, pruning treatments and hurts that are no longer
+        # in the arrays of treatment_ids or hurt_ids and adding the ones that are new, all in one transaction
         try:
-            healing.save()
+            with transaction.atomic():
+                patients = related_patients(healings=[healing])
+                healing.save()
+                sync_links(HealingTreatment, 'healing', healing, 'treatment', treatments)
+                sync_links(HurtHealing, 'healing', healing, 'hurt', hurts)
+                refresh_healing_rollup(healing)
+                touch_patients(patients | related_patients(healings=[healing]))
         except ValidationError as ex:
             return Response({"reason": ex.message}, status=status.HTTP_400_BAD_REQUEST)
 
-        # prune treatments and hurts that were previously associated with this healing if their id is no longer in the array of treatment_ids or hurt_ids
-        current_healing_treatments = HealingTreatment.objects.filter(
-            healing=healing)
-        current_healing_treatments.exclude(treatment__in=treatments).delete()
-
-        current_hurt_healings = HurtHealing.objects.filter(healing=healing)
-        current_hurt_healings.exclude(hurt__in=hurts).delete()
-
-        # for the treatments and hurts that were still in (or are now added to) those arrays of ids, see if the relationship exists already; if not, create it
-        for treatment in treatments:
-            try:
-                current_healing_treatments.get(treatment=treatment)
-            except HealingTreatment.DoesNotExist:
-                new_healing_treatment = HealingTreatment(
-                    healing=healing, treatment=treatment)
-                new_healing_treatment.save()
-
-        for hurt in hurts:
-            try:
-                current_hurt_healings.get(hurt=hurt)
-            except HurtHealing.DoesNotExist:
-                new_hurt_healing = HurtHealing(hurt=hurt, healing=healing)
-                new_hurt_healing.save()
-
         return Response({}, status=status.HTTP_204_NO_CONTENT)
 
     def list(self, request):
         """ Access a list of some/all Healings """
         requesting_user =  request.auth.user
-        requesting_patient = Patient.objects.get(user=requesting_user)
+        patient = requesting_patient(request)
 
         # order by date descending (newest first) by default
-        healings = Healing.objects.all().order_by('-added_on')
+        # the bridge rows and what they point to are loaded up front so a page of
+        # healings is serialized without a query per healing
+        healings = Healing.objects.prefetch_related(
+            'healing_treatments__treatment', 'hurt_healings__hurt').order_by('-added_on')
 
         order = self.request.query_params.get('order_by', None)
         direction = self.request.query_params.get('direction', None)
         hurt_id = self.request.query_params.get('hurt_id', None)
         patient_id = self.request.query_params.get('patient_id', None)
-        page = request.query_params.get('page', None)
-        page_size = request.query_params.get('page_size', 10)
 
         # e.g. /healings?hurt_id=1
         if hurt_id is not None:
@@ -206,42 +268,47 @@ class HealingViewSet(ViewSet):
     
         #otherwise (no patient id in querystring), only allow staff to access the list
         if patient_id is not None:
-                if int(patient_id) == requesting_patient.id or requesting_user.is_staff == True:
+                if int(patient_id) == patient.id or requesting_user.is_staff == True:
                         healings = healings.filter(patient_id=patient_id)
                 else:
                     return Response({'message': 'only staff or the patient with this id can access this list'}, status=status.HTTP_401_UNAUTHORIZED)
         elif requesting_user.is_staff == False:
             return Response({'message': 'only staff can access a list of healings not specified by patient id'}, status=status.HTTP_401_UNAUTHORIZED)
 
-        # establish total time and count of current list after all filters are applied
-        totalHealingTime = healings.aggregate(Sum('duration'))
+        # a poll whose If-None-Match still matches the version of the listed patient's data
+        # is answered before the total, count and page are queried
+        etag = data_version_etag(request, patient_id)
+        unchanged = not_modified(request, etag)
+        if unchanged is not None:
+            return unchanged
 
-        count = len(healings)
+        # establish total time and count of current list after all filters are applied,
+        # then page it, e.g. /healings?page=1 or /healings?cursor=&page_size=20
+        totalHealingTime = healings.aggregate(Sum('duration'))
 
-        if page is not None:
-            healings = paginate(healings, page, page_size)
+        try:
+            healings, page_info = paginate_request(healings, request)
+        except ValueError as ex:
+            return Response({'message': ex.args[0]}, status=status.HTTP_400_BAD_REQUEST)
 
         # serialize paginated healings
-        healinglist = SimpleHealingSerializer(
-            healings, many=True, context={'request': request})
+        healinglist = compiled(SimpleHealingSerializer).serialize(
+            healings, context={'request': request}, many=True)
 
         # create response object
         healingData = {}
-        healingData["healings"] = healinglist.data
-        healingData["count"] = count
+        healingData["healings"] = healinglist
+        healingData.update(page_info)
         healingData["total_healing_time"] = totalHealingTime["duration__sum"]
-        return Response(healingData)
+        return with_etag(Response(healingData), etag)
 
     def retrieve(self, request, pk=None):
         """ Access a single Healing """
         try:
             healing = Healing.objects.get(pk=pk)
-            healing.owner = False
-            if healing.patient == Patient.objects.get(user=request.auth.user):
-                healing.owner = True
-            serializer = HealingSerializer(
-                healing, context={'request': request})
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            healing.owner = healing.patient_id == requesting_patient(request).id
+            return Response(compiled(HealingSerializer).serialize(
+                healing, context={'request': request}), status=status.HTTP_200_OK)
         except Healing.DoesNotExist as ex:
             return Response({'message': ex.args[0]}, status=status.HTTP_404_NOT_FOUND)
 
@@ -251,5 +318,8 @@ class HealingViewSet(ViewSet):
             healing = Healing.objects.get(pk=pk)
         except Healing.DoesNotExist as ex:
             return Response({'message': ex.args[0]}, status=status.HTTP_404_NOT_FOUND)
-        healing.delete()
+        with transaction.atomic():
+            touch_patients(related_patients(healings=[healing]))
+            healing.delete()
+            refresh_healing_rollup(healing)
         return Response({}, status=status.HTTP_204_NO_CONTENT)
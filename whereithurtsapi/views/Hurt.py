@@ -1,15 +1,27 @@
 from django.core.exceptions import ValidationError
-from rest_framework.serializers import ModelSerializer, IntegerField
+from rest_framework.serializers import ModelSerializer, IntegerField, DateTimeField
+from rest_framework.decorators import action
 from rest_framework.viewsets import ViewSet
 from rest_framework.response import Response
 from rest_framework import status
-from whereithurtsapi.models import Hurt, Patient, Update, HurtTreatment, Treatment, TreatmentLink, Bodypart, Healing
+from whereithurtsapi.models import Hurt, Update, HurtTreatment, Treatment, TreatmentLink, Bodypart, Healing, TreatmentType, Patient
 from django.utils import timezone
-from django.db.models import Max
+from django.db import transaction
+from django.db.models import Case, CharField, Count, F, Prefetch, Subquery, Value, When
+from django.db.models import IntegerField as IntegerModelField
+from django.http import StreamingHttpResponse
+from whereithurtsapi.helpers import paginate_request, paginate_union_by_cursor, requesting_patient, with_owner, resolve_ids, sync_links, record_activity, stream_json_array, streaming_list_response, wants_stream, compiled, data_version_etag, not_modified, related_patients, touch_patients, with_etag, ReferenceField, pain_trend, trend_options
 
 # Serializers
 
 
+class NestedPatientSerializer(ModelSerializer):
+    """ A Patient nested in another resource, without data_version, which is internal """
+    class Meta:
+        model = Patient
+        fields = ('id', 'user')
+
+
 class UpdateSerializer(ModelSerializer):
     class Meta:
         model = Update
@@ -32,6 +44,9 @@ class HealingSerializer(ModelSerializer):
 class TreatmentSerializer(ModelSerializer):
     links = TreatmentLinkSerializer(many=True)
     """ JSON serializer for Treatments to embed on Hurts """
+    added_by = NestedPatientSerializer()
+    treatmenttype = ReferenceField(TreatmentType)
+    bodypart = ReferenceField(Bodypart)
     class Meta:
         model = Treatment
         fields = ('id', 'name', 'added_on', 'added_by', 'treatmenttype', 'bodypart',
@@ -44,6 +59,8 @@ class HurtSerializer(ModelSerializer):
     healings = HealingSerializer(many=True)
     treatments = TreatmentSerializer(many=True)
     updates = UpdateSerializer(many=True)
+    bodypart = ReferenceField(Bodypart)
+    patient = NestedPatientSerializer()
 
     class Meta:
         model = Hurt
@@ -51,66 +68,182 @@ class HurtSerializer(ModelSerializer):
                   'healing_count', 'treatments', 'updates', 'last_update', 'first_update_id', 'owner', 'latest_pain_level')
         depth = 1
 
+
+def hurt_queryset():
+    """ Hurts with every relation HurtSerializer touches loaded up front,
+    so serializing a page costs the same number of queries regardless of its size
+    (bodyparts and treatment types come from the reference registry)
+    """
+    return Hurt.objects.select_related('patient').prefetch_related(
+        'hurt_healings__healing',
+        Prefetch('hurt_treatments__treatment', queryset=Treatment.objects.select_related(
+            'added_by').prefetch_related('treatmentlink_set')),
+        Prefetch('update_set', queryset=Update.objects.order_by('added_on'))
+    ).annotate(_healing_count=Count('hurt_healings', distinct=True))
+
+# History
+
+HISTORY_FIELDS = ('history_added_on', 'history_type', 'history_id', 'history_notes', 'history_pain_level')
+
+
+def history_querysets(hurt_id, first_update_id):
+    """ The Healings and Updates that make up a Hurt's history, annotated with the same
+    columns so they can be merged into one ordered stream by a UNION in the database
+
+    first_update_id may be an expression (see first_update_of), so the history can be
+    read without loading the hurt first
+    """
+    healings = Healing.objects.filter(hurt_healings__hurt_id=hurt_id).annotate(
+        history_added_on=F('added_on'),
+        history_type=Value('Healing', output_field=CharField()),
+        history_id=F('id'),
+        history_notes=Value(None, output_field=CharField()),
+        history_pain_level=Value(None, output_field=IntegerModelField()))
+
+    # an update is labeled "Created on" if it was the first one for this hurt
+    updates = Update.objects.filter(hurt_id=hurt_id).annotate(
+        history_added_on=F('added_on'),
+        history_type=Case(When(id=first_update_id, then=Value('Created on')),
+                          default=Value('Update'), output_field=CharField()),
+        history_id=F('id'),
+        history_notes=F('notes'),
+        history_pain_level=F('pain_level'))
+
+    return [healings, updates]
+
+
+def first_update_of(hurt_id):
+    """ A hurt's first_update_id, as a subquery """
+    return Subquery(Hurt.objects.filter(pk=hurt_id).values('first_update_id')[:1])
+
+
+def history_ordering(order):
+    """ Newest first by default, or oldest first when order_history=oldest """
+    if order == "oldest":
+        return ('history_added_on', 'history_type', 'history_id')
+    return ('-history_added_on', '-history_type', '-history_id')
+
+
+def history_entry(row):
+    """ Shape a merged history row like the serialized Healing or Update it came from """
+    added_on = DateTimeField().to_representation(row['history_added_on'])
+    date_added = row['history_added_on'].strftime('%-m/%d/%Y')
+
+    if row['history_type'] == 'Healing':
+        return {'id': row['history_id'], 'date_added': date_added, 'added_on': added_on,
+                'history_type': row['history_type']}
+
+    return {'id': row['history_id'], 'added_on': added_on, 'notes': row['history_notes'],
+            'pain_level': row['history_pain_level'], 'is_first_update': row['history_type'] == 'Created on',
+            'date_added': date_added, 'history_type': row['history_type']}
+
+
+def stream_history(rows):
+    """ Yield a JSON array of history entries one entry at a time """
+    return stream_json_array(history_entry(row) for row in rows)
+
+
+def read_hurt(request, pk):
+    """ A serialized Hurt with the requesting patient's owner flag, or None if it doesn't exist """
+    try:
+        hurt = hurt_queryset().get(pk=pk)
+    except Hurt.DoesNotExist:
+        return None
+
+    hurt.owner = hurt.patient_id == requesting_patient(request).id
+    return compiled(HurtSerializer).serialize(hurt, context={'request': request})
+
+
+def read_history(hurt_id, first_update_id, order):
+    """ A Hurt's whole history as a list of entries, merged from its healings and updates
+    in the database; newest first by default, or oldest first when order is "oldest"
+    """
+    rows, _ = paginate_union_by_cursor(
+        history_querysets(hurt_id, first_update_id), HISTORY_FIELDS, history_ordering(order))
+    return [history_entry(row) for row in rows]
+
+
 # Viewset
 
 
 class HurtViewSet(ViewSet):
     def retrieve(self, request, pk=None):
         """ Access a single Hurt """
-        try:
-            hurt = Hurt.objects.get(pk=pk)
-        except Hurt.DoesNotExist:
+        hurt_data = read_hurt(request, pk)
+        if hurt_data is None:
             return Response({'message': 'hurt does not exist'}, status=status.HTTP_404_NOT_FOUND)
 
-        hurt.owner = False
+        # merge this hurt's healings and updates into one history list in the database; it
+        # is returned with newest first by default, or oldest first with ?order_history=oldest
+        order = self.request.query_params.get("order_history", None)
 
-        if hurt.patient == Patient.objects.get(user=request.auth.user):
-            hurt.owner = True
+        # add the history list as a k/v pair to the serialzied Hurt dict
+        hurt_data["history"] = read_history(hurt_data["id"], hurt_data["first_update_id"], order)
 
-        serializer = HurtSerializer(hurt, context={'request': request})
-        hurt_data = serializer.data
+        return Response(hurt_data, status=status.HTTP_200_OK)
 
-        # serialize matching Healings for this Hurt into list of dicts, then add type
+    @action(detail=True)
+    def history(self, request, pk=None):
+        """ Access a Hurt's healings and updates as one timeline
 
-        healings = Healing.objects.filter(hurt_healings__hurt=hurt)
-        healings_list = HealingSerializer(healings, many=True).data
-        for healing in healings_list:
-            healing.update({"history_type": "Healing"})
+        e.g. /hurts/1/history?order_history=oldest&cursor=&page_size=20 returns a page of
+        entries and the next_cursor; without a cursor the whole timeline is streamed
+        """
+        try:
+            hurt = Hurt.objects.get(pk=pk)
+        except Hurt.DoesNotExist:
+            return Response({'message': 'hurt does not exist'}, status=status.HTTP_404_NOT_FOUND)
 
-        # serialize matching updates. Add a type, and also a Created if it was the first update
-        updates = hurt.update_set.all()
-        updates_list = UpdateSerializer(updates, many=True).data
-        for update in updates_list:
-            if update["is_first_update"]:
-                update.update({"history_type": "Created on"})
-            else:
-                update.update({"history_type": "Update"})
+        order = self.request.query_params.get("order_history", None)
+        cursor = self.request.query_params.get("cursor", None)
 
-        # combine the two lists into one called history
-        history = healings_list + updates_list
+        if cursor is None:
+            rows, _ = paginate_union_by_cursor(
+                history_querysets(hurt.id, hurt.first_update_id), HISTORY_FIELDS, history_ordering(order))
+            return StreamingHttpResponse(stream_history(rows), content_type='application/json')
 
-        # history is returned with newest first by default; check for q string to see if this is flipped with "oldest"
-        order = self.request.query_params.get("order_history", None)
+        try:
+            rows, next_cursor = paginate_union_by_cursor(
+                history_querysets(hurt.id, hurt.first_update_id), HISTORY_FIELDS, history_ordering(order),
+                cursor, self.request.query_params.get('page_size', 10))
+        except ValueError as ex:
+            return Response({'message': ex.args[0]}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({"history": [history_entry(row) for row in rows], "next_cursor": next_cursor})
 
-        reverse = True
-        if order is not None:
-            if order == "oldest":
-                reverse = False
+    @action(detail=True)
+    def trend(self, request, pk=None):
+        """ A hurt's pain over time, as columns for charting
 
-        # sorting function to compare by datetime value of "added_on"
-        def by_date(row): return row["added_on"]
+        e.g. /hurts/1/trend?window=14&interval=week has each check-in's change, its rolling
+        average and slope over the 14 days up to it, and weekly averages (see pain_trend).
+        Only the patient the hurt belongs to, or staff, can see it.
+        """
+        hurt = Hurt.objects.filter(pk=pk).values('id', 'patient_id').first()
+        if hurt is None:
+            return Response({'message': 'hurt does not exist'}, status=status.HTTP_404_NOT_FOUND)
+        if hurt['patient_id'] != requesting_patient(request).id and not request.auth.user.is_staff:
+            return Response({'message': 'not authorized'}, status=status.HTTP_401_UNAUTHORIZED)
 
-        history = sorted(history, key=by_date, reverse=reverse)
+        try:
+            window, interval = trend_options(self.request.query_params)
+        except ValueError as ex:
+            return Response({'message': ex.args[0]}, status=status.HTTP_400_BAD_REQUEST)
 
-        # add the history list as a k/v pair to the serialzied Hurt dict
-        hurt_data["history"] = history
+        etag = data_version_etag(request, hurt['patient_id'])
+        unchanged = not_modified(request, etag)
+        if unchanged is not None:
+            return unchanged
 
-        return Response(hurt_data, status=status.HTTP_200_OK)
+        points = list(Update.objects.filter(hurt_id=hurt['id']).order_by('added_on', 'id').values_list(
+            'added_on', 'pain_level'))
+        return with_etag(Response({'hurt_id': hurt['id'], 'window': window, 'interval': interval,
+                                   **pain_trend(points, window, interval)}), etag)
 
     def list(self, request):
         """Access a list of some/all Hurts"""
 
-        hurts = Hurt.objects.all()
+        hurts = with_owner(hurt_queryset(), request)
 
         # e.g. /hurts?patient_id=1
         patient_id = self.request.query_params.get('patient_id', None)
@@ -131,25 +264,39 @@ class HurtViewSet(ViewSet):
             # e.g. order_by=added_on-asc ; 'added_on' will be order, 'asc' will be direction
             order = order_by.split('-')[0]
             direction = order_by.split('-')[1]
-            # if order is by 'recently updated', annotate the hurts with a value of their most recent update and order by that value
+            # if order is by 'recently updated', order by the time of each hurt's most recent update
             if order == 'recently_updated':
-                hurts = hurts.annotate(
-                    most_recent_update=Max('update__added_on'))
-                order = 'most_recent_update'
+                order = 'last_updated_on'
             if direction == "desc":
                 hurts = hurts.order_by(f"-{order}")
             if direction == "asc":
                 hurts = hurts.order_by(f"{order}")
 
-        for hurt in hurts:
-            hurt.owner = False
+        # a poll whose If-None-Match still matches the version of the patient's data
+        # (or everyone's, without patient_id) is answered without running the list query
+        etag = data_version_etag(request, patient_id)
+        unchanged = not_modified(request, etag)
+        if unchanged is not None:
+            return unchanged
 
-            if hurt.patient == Patient.objects.get(user=request.auth.user):
-                hurt.owner = True
+        # e.g. /hurts?stream=1 streams every hurt as a JSON array instead of building the whole list in memory
+        if wants_stream(request):
+            return with_etag(streaming_list_response(hurts, compiled(HurtSerializer).bind({'request': request})), etag)
 
-        serializedHurts = HurtSerializer(
-            hurts, many=True, context={'request': request}).data
-        return Response(serializedHurts)
+        # e.g. /hurts?cursor=&page_size=20 returns a page of hurts with a count and next_cursor
+        page_info = None
+        if self.request.query_params.get('cursor', None) is not None:
+            try:
+                hurts, page_info = paginate_request(hurts, request)
+            except ValueError as ex:
+                return Response({'message': ex.args[0]}, status=status.HTTP_400_BAD_REQUEST)
+
+        serializedHurts = compiled(HurtSerializer).serialize(
+            hurts, context={'request': request}, many=True)
+
+        if page_info is not None:
+            return with_etag(Response({"hurts": serializedHurts, **page_info}), etag)
+        return with_etag(Response(serializedHurts), etag)
 
     def create(self, request):
         """ Handle POST operations to /hurts
@@ -160,8 +307,7 @@ class HurtViewSet(ViewSet):
         Return:
             Response -- JSON Serialized Hurt instance
         """
-        #
-        patient = Patient.objects.get(user=request.auth.user)
+        patient = requesting_patient(request)
 
         hurt = Hurt()
         hurt.patient = patient
@@ -171,33 +317,32 @@ class HurtViewSet(ViewSet):
 
         hurt.bodypart = Bodypart.objects.get(pk=request.data["bodypart_id"])
 
-        try:
-            hurt.save()
-        except ValidationError as ex:
-            return Response({"reason": ex.message})
-
         # extract treatment ids from request and try to convert that collection to a queryset of Treatment instances
         treatment_ids = request.data["treatment_ids"]
 
         try:
-            treatments = [Treatment.objects.get(
-                pk=treatment_id) for treatment_id in treatment_ids]
+            treatments = resolve_ids(Treatment, treatment_ids)
         except Treatment.DoesNotExist:
             return Response({'message': 'request contains a treatment id for a non-existent treatment'}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
 
-        # save bridge table relationships
-        for treatment in treatments:
-            hurt_treatment = HurtTreatment(
-                hurt=hurt, treatment=treatment)
-            hurt_treatment.save()
-
         # create an update for this Hurt
         update = Update()
-        update.hurt = hurt
         update.added_on = timezone.now()
         update.pain_level = request.data["pain_level"]
         update.notes = request.data["notes"]
-        update.save()
+
+        # save the hurt, its bridge table relationships and its first update together
+        try:
+            with transaction.atomic():
+                hurt.save()
+                record_activity(hurt)
+                sync_links(HurtTreatment, 'hurt', hurt, 'treatment', treatments, is_new=True)
+                update.hurt = hurt
+                update.save()
+                hurt.refresh_summary()
+                touch_patients(related_patients(hurts=[hurt]))
+        except ValidationError as ex:
+            return Response({"reason": ex.message})
 
         serializer = HurtSerializer(hurt, context={'request': request})
         return Response(serializer.data)
@@ -218,34 +363,14 @@ class HurtViewSet(ViewSet):
         # extract and save Bodypart by id from request body
         hurt.bodypart = Bodypart.objects.get(pk=request.data["bodypart_id"])
 
-        # try to save the updated hurt
-        try:
-            hurt.save()
-        except ValidationError as ex:
-            return Response({"reason": ex.message}, status=status.HTTP_400_BAD_REQUEST)
-
         # extract treatment ids from request and try to convert that collection to a queryset of Treatment instances
         treatment_ids = request.data["treatment_ids"]
 
         try:
-            treatments = [Treatment.objects.get(
-                pk=treatment_id) for treatment_id in treatment_ids]
+            treatments = resolve_ids(Treatment, treatment_ids)
         except Treatment.DoesNotExist:
             return Response({'message': 'request contains a treatment id for a non-existent treatment'}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
 
-        # prune treatments that were previously associated if their id is no longer in the treatment_ids
-        current_hurt_treatments = HurtTreatment.objects.filter(hurt=hurt)
-        current_hurt_treatments.exclude(treatment__in=treatments).delete()
-
-        # for the treatments that were still in (or are now added to) that array of ids, see if the relationship exists already; if not, create it
-        for treatment in treatments:
-            try:
-                current_hurt_treatments.get(treatment=treatment)
-            except HurtTreatment.DoesNotExist:
-                new_hurt_treatment = HurtTreatment(
-                    hurt=hurt, treatment=treatment)
-                new_hurt_treatment.save()
-
         # find and update the first associated Update for this Hurt
         try:
             first_update = Update.objects.get(
@@ -255,22 +380,36 @@ class HurtViewSet(ViewSet):
 
         first_update.notes = request.data["notes"]
         first_update.pain_level = request.data["pain_level"]
-        first_update.save()
+
+        # save the updated hurt, prune treatments that are no longer in the treatment_ids and add new ones,
+        # and save its first update, all in one transaction
+        try:
+            with transaction.atomic():
+                patients = related_patients(hurts=[hurt])
+                hurt.save()
+                sync_links(HurtTreatment, 'hurt', hurt, 'treatment', treatments)
+                first_update.save()
+                first_update.hurt.refresh_summary()
+                touch_patients(patients | related_patients(hurts=[hurt]))
+        except ValidationError as ex:
+            return Response({"reason": ex.message}, status=status.HTTP_400_BAD_REQUEST)
 
         return Response({}, status=status.HTTP_204_NO_CONTENT)
 
     def destroy(self, request, pk=None):
 
-        req_patient = Patient.objects.get(user=request.auth.user)
+        req_patient = requesting_patient(request)
 
         try:
             hurt = Hurt.objects.get(pk=pk)
         except Hurt.DoesNotExist:
             return Response({'message': 'Hurt does not exist'}, status=status.HTTP_404_NOT_FOUND)
 
-        if not req_patient.id == hurt.patient.id:
+        if not req_patient.id == hurt.patient_id:
             return Response({'message': 'not authorized'}, status=status.HTTP_401_UNAUTHORIZED)
 
-        hurt.delete()
+        with transaction.atomic():
+            touch_patients(related_patients(hurts=[hurt]))
+            hurt.delete()
 
         return Response({}, status=status.HTTP_204_NO_CONTENT)
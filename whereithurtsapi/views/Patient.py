@@ -1,14 +1,18 @@
-from whereithurtsapi.models import Healing, Hurt, Treatment
+from whereithurtsapi.models import Bodypart, Healing, Hurt, Treatment, TreatmentType
 from whereithurtsapi.views.Hurt import HurtSerializer, UpdateSerializer
 from rest_framework.serializers import ModelSerializer
 from rest_framework.viewsets import ViewSet
 from rest_framework.response import Response
 from rest_framework import status
-from whereithurtsapi.models import Patient
+from whereithurtsapi.models import Patient, Activity
+from whereithurtsapi.helpers import paginate_by_cursor, data_version_etag, not_modified, with_etag, ReferenceField
 
 
 class TreatmentSerializer(ModelSerializer):
     """JSON serializer for Treatments attached to Patient retrieve """
+    bodypart = ReferenceField(Bodypart)
+    treatmenttype = ReferenceField(TreatmentType)
+
     class Meta:
         model = Treatment
         fields = ('id', 'added_on', 'date_added',
@@ -37,43 +41,73 @@ class PatientSerializer(ModelSerializer):
         fields = ('id', 'full_name', 'first_name',
                   'last_name', 'username', 'email')
 
-# Viewset
+ACTIVITY_SERIALIZERS = {
+    'Update': UpdateSerializer,
+    'Healing': HealingSerializer,
+    'Hurt': HurtSerializer,
+    'Treatment': TreatmentSerializer,
+}
 
 
-class PatientViewSet(ViewSet):
-    """ViewSet for the Patient model """
+def activity_entry(activity):
+    """ Serialize the subject of an activity log entry, tagged with its activity_type """
+    entry = ACTIVITY_SERIALIZERS[activity.activity_type](activity.subject).data
+    entry.update({"activity_type": activity.activity_type})
+    return entry
 
-    def retrieve(self, request, pk=None):
-        try:
-            patient = Patient.objects.get(pk=pk)
-            patient_data = PatientSerializer(
-                patient, context={'request': request}).data
 
-            updates = UpdateSerializer(patient.updates, many=True).data
-            for update in updates:
-                update.update({"activity_type": "Update"})
+def read_patient(request, pk):
+    """ A serialized Patient, or None if they don't exist """
+    patient = Patient.objects.select_related('user').filter(pk=pk).first()
+    if patient is None:
+        return None
+    return PatientSerializer(patient, context={'request': request}).data
 
-            healings = HealingSerializer(patient.healings, many=True).data
-            for healing in healings:
-                healing.update({"activity_type": "Healing"})
 
-            hurts = HurtSerializer(patient.hurts, many=True).data
-            for hurt in hurts:
-                hurt.update({"activity_type": "Hurt"})
+def read_activity(patient_id, cursor, limit):
+    """ A page of a patient's activity log, newest first, and the cursor for the next one
 
-            treatments = TreatmentSerializer(
-                patient.treatments, many=True).data
-            for treatment in treatments:
-                treatment.update({"activity_type": "Treatment"})
+    Whatever each entry is about is loaded in the same query. Raises ValueError for a malformed cursor.
+    """
+    activities = Activity.objects.filter(patient_id=patient_id).select_related(
+        'hurt', 'update__hurt', 'healing', 'treatment'
+    ).order_by('-added_on', '-id')
 
-            recent_activity = updates + hurts + healings + treatments
+    activities, next_cursor = paginate_by_cursor(activities, cursor, limit)
+    return [activity_entry(activity) for activity in activities], next_cursor
+
+# Viewset
 
-            def by_date(row): return row["added_on"]
 
-            recent_activity = sorted(
-                recent_activity, key=by_date, reverse=True)[:5]
+class PatientViewSet(ViewSet):
+    """ViewSet for the Patient model """
 
-            patient_data["recent_activity"] = recent_activity
-            return Response(patient_data)
-        except Patient.DoesNotExist as ex:
-            return Response({'message': ex.args[0]}, status=status.HTTP_404_NOT_FOUND)
+    def retrieve(self, request, pk=None):
+        """ Access a single Patient along with their most recent activity
+
+        e.g. /patients/1?limit=10 for more than the default 5 entries, or
+        /patients/1?cursor=&limit=10 to page through the activity log with next_cursor
+        """
+        # a poll whose If-None-Match still matches the patient's data version is answered
+        # before the patient and their activity are loaded; a missing patient falls through to the 404
+        etag = data_version_etag(request, pk)
+        unchanged = not_modified(request, etag)
+        if unchanged is not None:
+            return unchanged
+
+        patient_data = read_patient(request, pk)
+        if patient_data is None:
+            return Response({'message': 'Patient matching query does not exist.'}, status=status.HTTP_404_NOT_FOUND)
+
+        # newest entries from the activity log
+        limit = self.request.query_params.get('limit', 5)
+        cursor = self.request.query_params.get('cursor', None)
+        try:
+            recent_activity, next_cursor = read_activity(patient_data["id"], cursor, limit)
+        except ValueError as ex:
+            return Response({'message': ex.args[0]}, status=status.HTTP_400_BAD_REQUEST)
+
+        patient_data["recent_activity"] = recent_activity
+        if cursor is not None:
+            patient_data["next_cursor"] = next_cursor
+        return with_etag(Response(patient_data), etag)
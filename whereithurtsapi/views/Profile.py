@@ -1,12 +1,16 @@
-from django.db.models.aggregates import Sum
 from rest_framework.response import Response
 from rest_framework.serializers import ModelSerializer
 from rest_framework.viewsets import ViewSet
 from rest_framework.decorators import action
-from whereithurtsapi.models import Patient, Healing, Treatment, Hurt
+from whereithurtsapi.models import Patient, Healing, Treatment, Hurt, DailyRollup, Bodypart, Update
+from whereithurtsapi.helpers import requesting_patient, rollup_day, data_version_etag, not_modified, with_etag, ReferenceField, pain_trend, trend_options
 from rest_framework import status
 from django.utils import timezone
-from datetime import timedelta
+from datetime import datetime, time, timedelta
+from itertools import groupby
+
+DEFAULT_SNAPSHOT_DAYS = 7
+
 
 class ProfileHealingSerializer(ModelSerializer):
     class Meta: 
@@ -14,6 +18,8 @@ class ProfileHealingSerializer(ModelSerializer):
         fields = ('id', 'duration', 'date_added', 'notes')
 
 class ProfileTreatmentSerializer(ModelSerializer):
+    bodypart = ReferenceField(Bodypart)
+
     class Meta:
         model = Treatment
         fields = ('id', 'name', 'notes', 'bodypart')
@@ -25,13 +31,72 @@ class ProfileHurtSerializer(ModelSerializer):
         fields = ('id', 'name', 'date_added', 'pain_level', 'latest_pain_level')
 
 
+def snapshot_days(query_params):
+    """ The number of days a snapshot covers, e.g. ?days=30; raises ValueError unless it is a positive whole number """
+    try:
+        days = int(query_params.get('days', DEFAULT_SNAPSHOT_DAYS))
+    except ValueError:
+        days = 0
+    if days < 1:
+        raise ValueError('days must be a positive whole number')
+    return days
+
+
+def snapshot_window(days):
+    """ The first day of a snapshot's window, and the moment it starts; the window covers
+    whole days, starting on the day `days` days ago """
+    first_day = rollup_day(timezone.now() - timedelta(days=days))
+    return first_day, timezone.make_aware(datetime.combine(first_day, time.min))
+
+
+def read_rollups(patient_id, first_day):
+    return list(DailyRollup.objects.filter(patient_id=patient_id, day__gte=first_day))
+
+
+def read_recent_healings(request, patient_id, window_start):
+    """ The patient's healings in the window, serialized """
+    recent_healings = Healing.objects.filter(patient_id=patient_id, added_on__gte=window_start)
+    return ProfileHealingSerializer(recent_healings, many=True, context={'request': request}).data
+
+
+def read_recent_treatments(request, rollups):
+    """ The treatments used on the days of the rollups, serialized """
+    treatment_ids = {treatment_id for rollup in rollups for treatment_id in rollup.treatment_ids}
+    recent_treatments = Treatment.objects.filter(id__in=treatment_ids)
+    return ProfileTreatmentSerializer(recent_treatments, many=True, context={'request': request}).data
+
+
+def read_recent_hurts(request, rollups):
+    """ The hurts healed on the days of the rollups, serialized """
+    hurt_ids = {hurt_id for rollup in rollups for hurt_id in rollup.hurt_ids}
+    recent_hurts = Hurt.objects.filter(id__in=hurt_ids)
+    return ProfileHurtSerializer(recent_hurts, many=True, context={'request': request}).data
+
+
+def rollup_totals(rollups):
+    """ The healing time and count of the rollups' days """
+    # only try to format healing time if there are any recent healings
+    healing_seconds = sum(rollup.healing_seconds for rollup in rollups)
+    if rollups:
+        formatted_healing_time = timedelta(seconds=healing_seconds)
+    else:
+        formatted_healing_time = 0
+
+    return {"recent_healing_time": str(formatted_healing_time),
+            "recent_healing_count": sum(rollup.healing_count for rollup in rollups)}
+
+
 class ProfileViewSet(ViewSet):
 
     """ Method to access specific details of a Patient's use
     of the app based on timeframe. Patient id lookup is the PK
     of a /profiles route decorated by <patientId>/snapshot
 
-    By default, will look up information for the past 7 days.
+    By default, will look up information for the past 7 days;
+    e.g. /profiles/1/snapshot?days=30 for a longer window.
+
+    Totals, treatments and hurts come from the patient's DailyRollup rows,
+    one per day with healings in the window.
     """
     @action(detail=True)
     def snapshot(self, request, pk=None):
@@ -40,31 +105,62 @@ class ProfileViewSet(ViewSet):
         except Patient.DoesNotExist:
             return Response({'message': 'patient does not exist'}, status=status.HTTP_404_NOT_FOUND)
 
-        snapshot = {}
-
-        #retrieve qset of this patient's healings for the past week
-        recent_healings =  patient.healing_set.filter(added_on__gte=timezone.now() - timedelta(days=7))
-
-        # only try to format healing time if there are any recent healings
-        if len(recent_healings) > 0:
-            recent_healing_duration = recent_healings.aggregate(Sum('duration'))
-            formatted_healing_time = timedelta(seconds=recent_healing_duration["duration__sum"])
-        else:
-            formatted_healing_time = 0
-        recent_treatments = Treatment.objects.filter(healing_treatments__healing__in=recent_healings).distinct()
-        recent_hurts = Hurt.objects.filter(hurt_healings__healing__in=recent_healings).distinct()
-
-        snapshot["recent_healings"] = ProfileHealingSerializer(recent_healings, many=True, context={'requet': request}).data
-        snapshot["recent_treatments"] = ProfileTreatmentSerializer(recent_treatments, many=True, context={'request': request}).data
-        snapshot["recent_hurts"] = ProfileHurtSerializer(recent_hurts, many=True, context={'request': request}).data
-        snapshot["recent_healing_time"] = str(formatted_healing_time)
+        try:
+            days = snapshot_days(self.request.query_params)
+        except ValueError as ex:
+            return Response({'message': ex.args[0]}, status=status.HTTP_400_BAD_REQUEST)
 
+        # the window is relative to today, so the ETag changes at midnight as well as on writes
+        etag = data_version_etag(request, patient.id, rollup_day(timezone.now()))
+        unchanged = not_modified(request, etag)
+        if unchanged is not None:
+            return unchanged
 
-        return Response(snapshot)
+        first_day, window_start = snapshot_window(days)
+        rollups = read_rollups(patient.id, first_day)
 
+        snapshot = {}
+        snapshot["recent_healings"] = read_recent_healings(request, patient.id, window_start)
+        snapshot["recent_treatments"] = read_recent_treatments(request, rollups)
+        snapshot["recent_hurts"] = read_recent_hurts(request, rollups)
+        snapshot.update(rollup_totals(rollups))
 
+        return with_etag(Response(snapshot), etag)
 
+    @action(detail=True)
+    def trend(self, request, pk=None):
+        """ The pain over time of each of a patient's hurts, as columns for charting
+
+        e.g. /profiles/1/trend?window=14&interval=week; each hurt's trend is shaped like
+        /hurts/<id>/trend. Every hurt's check-ins are read with one query. Only the
+        patient, or staff, can see it.
+        """
+        patient = requesting_patient(request)
+        try:
+            patient_id = int(pk)
+        except ValueError:
+            return Response({'message': 'patient does not exist'}, status=status.HTTP_404_NOT_FOUND)
+        if patient_id != patient.id and not request.auth.user.is_staff:
+            return Response({'message': 'not authorized'}, status=status.HTTP_401_UNAUTHORIZED)
 
+        try:
+            window, interval = trend_options(self.request.query_params)
+        except ValueError as ex:
+            return Response({'message': ex.args[0]}, status=status.HTTP_400_BAD_REQUEST)
 
-        
-        
\ No newline at end of file
+        etag = data_version_etag(request, patient_id)
+        if etag is None:
+            return Response({'message': 'patient does not exist'}, status=status.HTTP_404_NOT_FOUND)
+        unchanged = not_modified(request, etag)
+        if unchanged is not None:
+            return unchanged
+
+        rows = Update.objects.filter(hurt__patient_id=patient_id).order_by('hurt_id', 'added_on', 'id').values_list(
+            'hurt_id', 'hurt__name', 'added_on', 'pain_level')
+        hurts = []
+        for (hurt_id, name), hurt_rows in groupby(rows, key=lambda row: row[:2]):
+            points = [(added_on, pain_level) for _, _, added_on, pain_level in hurt_rows]
+            hurts.append({'hurt_id': hurt_id, 'name': name, **pain_trend(points, window, interval)})
+
+        return with_etag(Response({'patient_id': patient_id, 'window': window, 'interval': interval,
+                                   'hurts': hurts}), etag)
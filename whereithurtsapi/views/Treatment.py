@@ -1,13 +1,16 @@
 from django.db.models.aggregates import Count
-from whereithurtsapi.helpers.paginate import paginate
+from django.db.models import BooleanField, F, Prefetch, Value
+from whereithurtsapi.helpers import paginate_request, requesting_patient, with_owner, resolve_ids, sync_links, record_activity, index_treatment, search_treatments, compiled, related_patients, touch_patients, cursor_ordering, ordering_annotations, annotated_ordering_values, paginate_merged_request, SortedEntries, get_public_treatment_cache, query_terms, treatments_changed, ReferenceField
+from whereithurtsapi.views.Hurt import NestedPatientSerializer
 from whereithurtsapi.views.Patient import PatientSerializer
 from django.core.exceptions import ValidationError
-from rest_framework.serializers import ModelSerializer
+from rest_framework.serializers import FloatField, ModelSerializer
 from rest_framework.viewsets import ViewSet
 from rest_framework.response import Response
 from rest_framework import status
-from whereithurtsapi.models import Treatment, TreatmentType, Bodypart, TreatmentLink, Patient, Hurt, HurtTreatment
+from whereithurtsapi.models import Treatment, TreatmentType, Bodypart, TreatmentLink, Hurt, HurtTreatment
 from django.utils import timezone
+from django.db import IntegrityError, transaction
 from django.db.models import Q
 from rest_framework.decorators import action
 
@@ -23,6 +26,9 @@ class TreatmentLinkSerializer(ModelSerializer):
 
 class SimpleHurtSerializer(ModelSerializer):
     """ Simplified serializer for embedding Hurts on Treatment list """
+    bodypart = ReferenceField(Bodypart)
+    patient = NestedPatientSerializer()
+
     class Meta:
         model = Hurt
         fields = ('id', 'bodypart', 'date_added', 'healing_count', 'patient',
@@ -37,14 +43,161 @@ class TreatmentSerializer(ModelSerializer):
     added_by = PatientSerializer(many=False)
     hurts = SimpleHurtSerializer(many=True)
     links = TreatmentLinkSerializer(many=True)
+    bodypart = ReferenceField(Bodypart)
+    treatmenttype = ReferenceField(TreatmentType)
+    # the precomputed TreatmentScore annotated by treatment_queryset; null until score_treatments scores it
+    effectiveness = FloatField(read_only=True, allow_null=True)
 
     class Meta:
         model = Treatment
         fields = ('id', 'name', 'bodypart', 'treatmenttype',
-                  'added_by', 'notes', 'public', 'links', 'hurts', 'owner', 'healing_count', 'added_on')
+                  'added_by', 'notes', 'public', 'links', 'hurts', 'owner', 'healing_count', 'added_on',
+                  'effectiveness')
         depth = 2
 
 
+# Query plan
+
+def embedded_hurts():
+    """ Hurts to embed on a Treatment, with the healing count SimpleHurtSerializer
+    needs annotated onto each row instead of being queried one hurt at a time
+    (the update summary values are stored on Hurt itself, and bodyparts come from the reference registry)
+    """
+    return Hurt.objects.select_related('patient').annotate(
+        _healing_count=Count('hurt_healings', distinct=True))
+
+
+def treatment_queryset():
+    """ Treatments with every relation TreatmentSerializer touches loaded up front,
+    so serializing a page costs the same number of queries regardless of its size
+    (bodyparts and treatment types come from the reference registry), and with its
+    effectiveness score joined in to serialize and order by
+    """
+    return Treatment.objects.select_related('added_by__user').prefetch_related(
+        'treatmentlink_set',
+        'hurt_treatments',
+        Prefetch('hurt_treatments__hurt', queryset=embedded_hurts())
+    ).annotate(healings=Count('healing_treatments', distinct=True), effectiveness=F('score__effectiveness'))
+
+
+def browse_filters(treatments, params):
+    """ Apply the filters anyone browsing treatments can ask for """
+
+    # e.g. /treatments?bodypart_id=1
+    bodypart_id = params.get('bodypart_id', None)
+    if bodypart_id is not None:
+        treatments = treatments.filter(bodypart_id=bodypart_id)
+
+    # e.g. /treatments?treatmenttype_id=1
+    treatmenttype_id = params.get('treatmenttype_id', None)
+    if treatmenttype_id is not None:
+        treatments = treatments.filter(treatmenttype_id=treatmenttype_id)
+
+    # e.g. /treatments?q=foot ice finds treatments with words starting with "foot" and "ice"
+    # in their name, notes, bodypart or treatment type, most relevant first
+    search_query = params.get('q', None)
+    if search_query is not None:
+        treatments = search_treatments(treatments, search_query)
+
+    return treatments
+
+
+def browse_ordering(treatments, params):
+    """ Apply the ordering anyone browsing treatments can ask for """
+
+    # e.g. /treatments?order_by=name&direction=desc; effectiveness is most effective first
+    # unless direction=asc, with treatments that haven't been scored last
+    order_by = params.get('order_by', None)
+    direction = params.get('direction', None)
+    if order_by is not None:
+        order_filter = order_by
+        if direction is not None:
+            if direction == "desc":
+                order_filter = f'-{order_by}'
+        if order_by == 'effectiveness' and direction != "asc":
+            order_filter = '-effectiveness'
+
+        treatments = treatments.order_by(order_filter)
+
+    return treatments
+
+
+# filters that narrow the list to one patient's or one hurt's treatments; a list without
+# them is a browse of the public treatments, which is served from the public treatment cache
+PERSONAL_FILTERS = ('patient_id', 'owner', 'hurt_id')
+
+
+def browse_queryset(treatments, ordering, owner):
+    """ The treatments in order, flagged as the requester's or not, and annotated with the
+    values they are ordered by, so reading those doesn't load the rows an ordering across
+    a relation goes through """
+    return treatments.annotate(owner=Value(owner, output_field=BooleanField()),
+                               **ordering_annotations(ordering)).order_by(*ordering)
+
+
+def browse_entries(treatments, ordering, request):
+    """ (ordering values, serialized treatment) pairs for browse_queryset's treatments, in order """
+    treatments = list(treatments)
+    serialized = compiled(TreatmentSerializer).serialize(
+        treatments, context={'request': request}, many=True)
+    return [(annotated_ordering_values(treatment, ordering), data) for treatment, data in zip(treatments, serialized)]
+
+
+def browse_treatments(request, patient):
+    """ The requested page of public treatments merged with the requesting patient's private ones
+
+    The public treatments for a combination of filters and ordering are serialized once
+    and cached; per request only the patient's private treatments that can land on the
+    page are queried, and the patient's own public treatments on it are flagged as theirs.
+    Pages and cursors work the same as on the database path.
+
+    Raises ValueError for a bad cursor.
+    """
+    params = request.query_params
+    treatments = browse_ordering(browse_filters(treatment_queryset(), params), params)
+
+    # cursor pages default to newest first; other lists to the order the rows were added
+    if 'cursor' in params:
+        ordering = cursor_ordering(treatments)
+    else:
+        ordering = cursor_ordering(treatments, default=('id',))
+
+    search_query = params.get('q', None)
+    key = (
+        params.get('bodypart_id', None),
+        params.get('treatmenttype_id', None),
+        tuple(query_terms(search_query)) if search_query is not None else (),
+        tuple(ordering),
+        # embedded images are serialized as absolute urls
+        request.build_absolute_uri('/'),
+    )
+    public_entries = get_public_treatment_cache().get_or_build(key, lambda: SortedEntries(ordering, browse_entries(
+        browse_queryset(treatments.filter(public=True), ordering, False), ordering, request)))
+
+    if patient is not None:
+        private_treatments = browse_queryset(treatments.filter(added_by_id=patient.id, public=False), ordering, True)
+        # counted without the relations and scores serializing them needs
+        private_count = browse_filters(Treatment.objects.filter(added_by_id=patient.id, public=False), params)
+    else:
+        private_treatments = private_count = treatments.none()
+    rows, page_info = paginate_merged_request(
+        public_entries, private_treatments, lambda page: browse_entries(page, ordering, request), request,
+        private_count)
+
+    if patient is not None:
+        rows = [{**data, 'owner': True} if data['added_by']['id'] == patient.id else data for data in rows]
+    return rows, page_info
+
+
+def save_links(treatment, treatment_links):
+    """ Insert a treatment's links from the request's list of link objects in one query """
+    TreatmentLink.objects.bulk_create([TreatmentLink(
+        treatment=treatment,
+        linktext=treatment_link["linktext"],
+        linkurl=treatment_link["linkurl"]
+    ) for treatment_link in treatment_links])
+
+
 # Viewset
 
 
@@ -58,7 +211,7 @@ class TreatmentViewSet(ViewSet):
             Response --JSON Serialized Treatment instance
         """
         # find patient making this POST request and assign them as the patient for a new healing
-        patient = Patient.objects.get(user=request.auth.user)
+        patient = requesting_patient(request)
 
         treatment = Treatment()
         treatment.added_by = patient
@@ -77,32 +230,22 @@ class TreatmentViewSet(ViewSet):
         hurt_ids = request.data["hurt_ids"]
 
         try:
-            hurts = [Hurt.objects.get(pk=hurt_id) for hurt_id in hurt_ids]
+            hurts = resolve_ids(Hurt, hurt_ids)
         except Hurt.DoesNotExist:
             return Response({'message': 'request contains a hurt id for a non-existent hurt'}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
 
-        # Try to save the new Treatment to the database
+        # Try to save the new Treatment, its bridge table relationships and its links to the database together
         try:
-            treatment.save()
+            with transaction.atomic():
+                treatment.save()
+                record_activity(treatment)
+                index_treatment(treatment)
+                sync_links(HurtTreatment, 'treatment', treatment, 'hurt', hurts, is_new=True)
+                save_links(treatment, request.data["treatment_links"])
+                touch_patients(related_patients(treatments=[treatment]))
         except ValidationError as ex:
             return Response({"reason": ex.message}, status=status.HTTP_400_BAD_REQUEST)
 
-        # save bridge table relationships)
-
-        for hurt in hurts:
-            hurt_treatment = HurtTreatment(hurt=hurt, treatment=treatment)
-            hurt_treatment.save()
-
-        # save links, maybe?
-        treatment_links = request.data["treatment_links"]
-
-        for treatment_link in treatment_links:
-            new_treatment_link = TreatmentLink()
-            new_treatment_link.linktext = treatment_link["linktext"]
-            new_treatment_link.linkurl = treatment_link["linkurl"]
-            new_treatment_link.treatment = treatment
-            new_treatment_link.save()
-
         serializer = TreatmentSerializer(
             treatment, context={'request': request})
         return Response(serializer.data)
@@ -133,135 +276,95 @@ class TreatmentViewSet(ViewSet):
         hurt_ids = request.data["hurt_ids"]
 
         try:
-            hurts = [Hurt.objects.get(pk=hurt_id) for hurt_id in hurt_ids]
+            hurts = resolve_ids(Hurt, hurt_ids)
         except Hurt.DoesNotExist:
             return Response({'message': 'request contains a hurt id for a non-existent hurt'}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
 
-        # Try to save the updated Treatment to the database
+        # Try to save the updated Treatment, prune hurts that are no longer in the hurt_ids and add new ones,
+        # and delete pre-existing links then re-save them according to the request's "treatment_links" list,
+        # all in one transaction
         try:
-            treatment.save()
+            with transaction.atomic():
+                patients = related_patients(treatments=[treatment])
+                treatment.save()
+                index_treatment(treatment)
+                sync_links(HurtTreatment, 'treatment', treatment, 'hurt', hurts)
+                treatment.treatmentlink_set.all().delete()
+                save_links(treatment, request.data["treatment_links"])
+                touch_patients(patients | related_patients(treatments=[treatment]))
         except ValidationError as ex:
             return Response({"reason": ex.message}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Prune hurts that were previously associated if their id is no longer in the hurt_id array
-        current_hurt_treatments = HurtTreatment.objects.filter(
-            treatment=treatment)
-        current_hurt_treatments.exclude(hurt__in=hurts).delete()
-
-        # for the hurts that were still in (or are now added to) that array of ids, see if the relationship exists already; if not, create it
-        for hurt in hurts:
-            try:
-                current_hurt_treatments.get(hurt=hurt)
-            except HurtTreatment.DoesNotExist:
-                new_hurt_treatment = HurtTreatment(
-                    hurt=hurt, treatment=treatment)
-                new_hurt_treatment.save()
-
-        # delete pre-existing links, then save / re-save links according to request "treatment_link" list
-        current_treatment_links = treatment.treatmentlink_set.all()
-        current_treatment_links.delete()
-
-        treatment_links = request.data["treatment_links"]
-
-        for treatment_link in treatment_links:
-            new_treatment_link = TreatmentLink()
-            new_treatment_link.linktext = treatment_link["linktext"]
-            new_treatment_link.linkurl = treatment_link["linkurl"]
-            new_treatment_link.treatment = treatment
-            new_treatment_link.save()
-
         serializer = TreatmentSerializer(
             treatment, context={'request': request})
         return Response(serializer.data)
 
     def list(self, request):
         """ Access a list of some/all Treatments """
-        treatments = Treatment.objects.all().annotate(
-            healings=Count('healing_treatments'))
+        patient = requesting_patient(request)
+
+        # e.g. /treatments?bodypart_id=1&q=ice is answered from the public treatment cache
+        if not any(name in self.request.query_params for name in PERSONAL_FILTERS):
+            try:
+                treatmentList, page_info = browse_treatments(request, patient)
+            except ValueError as ex:
+                return Response({'message': ex.args[0]}, status=status.HTTP_400_BAD_REQUEST)
+
+            response = {}
+            response["treatments"] = treatmentList
+            response.update(page_info)
+            return Response(response)
+
+        # the dynamic owner prop is used by the client to determine whether a treatment's edit/delete controls should be visible
+        treatments = with_owner(treatment_queryset(), request, 'added_by')
 
         # e.g. /treatments?patient_id=1
         patient_id = self.request.query_params.get('patient_id', None)
         if patient_id is not None:
             treatments = treatments.filter(added_by_id=patient_id)
 
-        # e.g. /treatments?bodypart_id=1
-        bodypart_id = self.request.query_params.get('bodypart_id', None)
-        if bodypart_id is not None:
-            treatments = treatments.filter(bodypart_id=bodypart_id)
-
-        # e.g. /treatments?treatmenttype_id=1
-        treatmenttype_id = self.request.query_params.get(
-            'treatmenttype_id', None)
-        if treatmenttype_id is not None:
-            treatments = treatments.filter(treatmenttype_id=treatmenttype_id)
-
         # e.g. /treatments?owner=1
         owner = self.request.query_params.get('owner', None)
         if owner is not None:
             treatments = treatments.filter(
-                added_by_id=request.auth.user.patient.id)
+                added_by_id=patient.id)
 
         # e.g. /treatments?hurt_id=1
         hurt_id = self.request.query_params.get('hurt_id', None)
         if hurt_id is not None:
             treatments = treatments.filter(hurt_treatments__hurt_id=hurt_id)
 
-        # e.g. /treatments?q=foot
-        search_terms = self.request.query_params.get('q', None)
-        if search_terms is not None:
-            treatments = treatments.filter(Q(name__contains=search_terms) | Q(notes__contains=search_terms) | Q(
-                bodypart__name__contains=search_terms) | Q(treatmenttype__name__contains=search_terms))
-
-        order_by = self.request.query_params.get('order_by', None)
-        direction = self.request.query_params.get('direction', None)
-        if order_by is not None:
-            order_filter = order_by
-            if direction is not None:
-                if direction == "desc":
-                    order_filter = f'-{order_by}'
-
-            treatments = treatments.order_by(order_filter)
+        # e.g. /treatments?hurt_id=1&bodypart_id=1&q=ice&order_by=name
+        treatments = browse_ordering(browse_filters(treatments, self.request.query_params), self.request.query_params)
 
         # e.g. make sure only results after any filtering are either belonging to current user OR public
         treatments = treatments.filter(
-            Q(added_by_id=request.auth.user.patient.id) | Q(public=True))
+            Q(added_by_id=patient.id) | Q(public=True))
 
-        # e.g. /treatments?page=1
-        page = request.query_params.get('page', None)
-        page_size = request.query_params.get('page_size', 10)
-
-        # add dynamic prop for client to use in determining whether a treatment's edit/delete controls should be visible
-        for treatment in treatments:
-            treatment.owner = False
-            if treatment.added_by == Patient.objects.get(user=request.auth.user):
-                treatment.owner = True
-
-        # establish count of current list after all filtering
-        count = len(treatments)
-
-        if page is not None:
-            treatments = paginate(treatments, page, page_size)
+        # e.g. /treatments?page=1 or /treatments?cursor=&page_size=20
+        # establish count of current list after all filtering, then page it
+        try:
+            treatments, page_info = paginate_request(treatments, request)
+        except ValueError as ex:
+            return Response({'message': ex.args[0]}, status=status.HTTP_400_BAD_REQUEST)
 
         # serialized paginated treatments
 
-        treatmentList = TreatmentSerializer(
-            treatments, many=True, context={'request': request})
+        treatmentList = compiled(TreatmentSerializer).serialize(
+            treatments, context={'request': request}, many=True)
 
         response = {}
-        response["treatments"] = treatmentList.data
-        response["count"] = count
+        response["treatments"] = treatmentList
+        response.update(page_info)
         return Response(response)
 
     def retrieve(self, request, pk=None):
         """ Access a single Treatment """
         try:
-            treatment = Treatment.objects.get(pk=pk)
-            treatment.owner = False
-            if treatment.added_by == Patient.objects.get(user=request.auth.user):
-                treatment.owner = True
-            serializer = TreatmentSerializer(
-                treatment, context={'request': request})
-            return Response(serializer.data)
+            treatment = treatment_queryset().get(pk=pk)
+            treatment.owner = treatment.added_by_id == requesting_patient(request).id
+            return Response(compiled(TreatmentSerializer).serialize(
+                treatment, context={'request': request}))
         except Treatment.DoesNotExist as ex:
             return Response({'message': ex.args[0]}, status=status.HTTP_404_NOT_FOUND)
 
@@ -271,7 +374,9 @@ class TreatmentViewSet(ViewSet):
             treatment = Treatment.objects.get(pk=pk)
         except Treatment.DoesNotExist as ex:
             return Response({'message': ex.args[0]}, status=status.HTTP_404_NOT_FOUND)
-        treatment.delete()
+        with transaction.atomic():
+            touch_patients(related_patients(treatments=[treatment]))
+            treatment.delete()
         return Response({}, status=status.HTTP_204_NO_CONTENT)
 
     @action(detail=True, methods=['post', 'delete'])
@@ -288,22 +393,23 @@ class TreatmentViewSet(ViewSet):
 
         #
         if request.method == "POST":
+            # the unique hurt/treatment constraint rejects a second tag, so there's no need to look for one first
             try:
-                hurt_treatment = HurtTreatment.objects.get(
-                    hurt=hurt, treatment=treatment)
+                with transaction.atomic():
+                    HurtTreatment.objects.create(hurt=hurt, treatment=treatment)
+                    touch_patients([hurt.patient_id, treatment.added_by_id])
+            except IntegrityError:
                 return Response({'message': 'this treatment has already been tagged with this hurt'}, status=status.HTTP_400_BAD_REQUEST)
-            except HurtTreatment.DoesNotExist:
-                hurt_treatment = HurtTreatment()
-                hurt_treatment.hurt = hurt
-                hurt_treatment.treatment = treatment
-                hurt_treatment.save()
-                return Response({}, status.HTTP_201_CREATED)
+            return Response({}, status.HTTP_201_CREATED)
 
         elif request.method == "DELETE":
             try:
                 hurt_treatment = HurtTreatment.objects.get(
                     hurt=hurt, treatment=treatment)
-                hurt_treatment.delete()
+                with transaction.atomic():
+                    hurt_treatment.delete()
+                    touch_patients([hurt.patient_id, treatment.added_by_id])
+                    treatments_changed()
                 return Response({}, status=status.HTTP_204_NO_CONTENT)
             except HurtTreatment.DoesNotExist:
                 return Response({'message': 'hurt has not been tagged on this treatment'}, status=status.HTTP_404_NOT_FOUND)
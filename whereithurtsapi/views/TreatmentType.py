@@ -2,14 +2,18 @@ from rest_framework.serializers import ModelSerializer
 from rest_framework.viewsets import ViewSet
 from rest_framework.response import Response
 from rest_framework import status
+from django.utils.cache import patch_cache_control
 from whereithurtsapi.models import TreatmentType
+from whereithurtsapi.helpers import REFERENCE_MAX_AGE, IconVariantsField, get_reference_registry, icon_manifest, not_modified, with_etag
 
 # Serializers
 class TreatmentTypeSerializer(ModelSerializer):
     """ JSON serializer for the TreatmentType model  """
+    image_variants = IconVariantsField(source='image')
+
     class Meta:
         model = TreatmentType
-        fields = ['id', 'name', 'image']
+        fields = ['id', 'name', 'image', 'image_variants']
         depth = 1
 
     
@@ -17,9 +21,21 @@ class TreatmentTypeSerializer(ModelSerializer):
 class TreatmentTypeViewSet(ViewSet):
     """ ViewSet for the TreatmentType model """
     def list(self, request):
+        """ The treatment types, from the reference registry
+
+        They change only when an admin edits them, so clients and proxies may reuse
+        the list for a day and revalidate it with its ETag after that
+        """
         try:
-            treatment_types = TreatmentType.objects.all()
-            serializer = TreatmentTypeSerializer(treatment_types, many=True, context={'request': request})
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            reference_data = get_reference_registry().data()
+            # the list carries icon variant urls, so a rebuilt manifest changes its tag too
+            etag = f'"{reference_data.digest}-{icon_manifest.version()}"'
+            response = not_modified(request, etag)
+            if response is None:
+                treatment_types = reference_data.all(TreatmentType)
+                serializer = TreatmentTypeSerializer(treatment_types, many=True, context={'request': request})
+                response = with_etag(Response(serializer.data, status=status.HTTP_200_OK), etag)
+            patch_cache_control(response, public=True, max_age=REFERENCE_MAX_AGE)
+            return response
         except Exception as ex:
             return Response({'message': ex.args[0]}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
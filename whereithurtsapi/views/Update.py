@@ -1,23 +1,48 @@
 from rest_framework import response
-from whereithurtsapi.models.Patient import Patient
 from django.core.exceptions import ValidationError
 from rest_framework.serializers import ModelSerializer
 from rest_framework.viewsets import ViewSet
+from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework import status
-from whereithurtsapi.models import Update, Hurt
+from whereithurtsapi.models import Update, Hurt, Activity
 from django.utils import timezone
+from django.db import IntegrityError, transaction
+from django.db.models import OuterRef, Q, Subquery
+from whereithurtsapi.helpers import paginate_request, requesting_patient, with_owner, record_activity, streaming_list_response, wants_stream, compiled, related_patients, touch_patients
+from whereithurtsapi.helpers import (BulkItemError, activity_for, bulk_items, bulk_results, idempotency_keys, insert_keyed,
+                                     item_added_on, item_notes, item_value, plan_bulk_create)
 
 # Serializers
 
 
+class UpdateHurtSerializer(ModelSerializer):
+    """ The Hurt nested in an Update, without the summary columns Hurt keeps of its updates """
+    class Meta:
+        model = Hurt
+        fields = ('id', 'patient', 'bodypart', 'name', 'added_on', 'is_active')
+
+
 class UpdateSerializer(ModelSerializer):
+    hurt = UpdateHurtSerializer()
+
     class Meta:
         model = Update
         fields = ('id', 'added_on', 'notes', 'pain_level', 'hurt',
                   'is_first_update', 'date_added', 'pain_level_difference', 'owner')
         depth = 1
 
+
+def previous_pain_level():
+    """ The pain level of the update before each one on the same hurt, matching
+    get_previous_by_added_on, as a subquery to annotate a list of updates with
+    """
+    previous = Update.objects.filter(
+        Q(added_on__lt=OuterRef('added_on')) | Q(added_on=OuterRef('added_on'), id__lt=OuterRef('id')),
+        hurt_id=OuterRef('hurt_id')
+    ).order_by('-added_on', '-id')
+    return Subquery(previous.values('pain_level')[:1])
+
 # Viewset
 
 
@@ -30,22 +55,18 @@ class UpdateViewSet(ViewSet):
         except Update.DoesNotExist:
             return Response({'message': 'Update does not exist'}, status=status.HTTP_404_NOT_FOUND)
 
-        update.owner = False
-        if update.hurt.patient == Patient.objects.get(user=request.auth.user):
-            update.owner = True
+        update.owner = update.hurt.patient_id == requesting_patient(request).id
 
-        serializer = UpdateSerializer(update, context={'request': request})
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return Response(compiled(UpdateSerializer).serialize(update, context={'request': request}), status=status.HTTP_200_OK)
 
     def list(self, request):
-        updates = Update.objects.all()
+        updates = with_owner(Update.objects.select_related('hurt').annotate(
+            _previous_pain_level=previous_pain_level()), request, 'hurt__patient')
 
         patient_id = self.request.query_params.get('patient_id', None)
         if patient_id is not None:
             # prevent patients from accessing another patient's updates via q.string param
-            requesting_patient = Patient.objects.get(user=request.auth.user)
-            requested_patient = Patient.objects.get(pk=patient_id)
-            if not requesting_patient == requested_patient:
+            if not int(patient_id) == requesting_patient(request).id:
                 return Response({'message': 'not authorized'}, status=status.HTTP_401_UNAUTHORIZED)
             updates = updates.filter(hurt__patient_id=patient_id)
 
@@ -63,14 +84,24 @@ class UpdateViewSet(ViewSet):
             if direction == "asc":
                 updates = updates.order_by(f"{order}")
 
-        for update in updates:
-            update.owner = False
-            if update.hurt.patient == Patient.objects.get(user=request.auth.user):
-                update.owner = True
+        # e.g. /updates?stream=1 streams every update as a JSON array instead of building the whole list in memory
+        if wants_stream(request):
+            return streaming_list_response(updates, compiled(UpdateSerializer).bind({'request': request}))
 
-        serializer = UpdateSerializer(
-            updates, many=True, context={'request': request})
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        # e.g. /updates?cursor=&page_size=20 returns a page of updates with a count and next_cursor
+        page_info = None
+        if self.request.query_params.get('cursor', None) is not None:
+            try:
+                updates, page_info = paginate_request(updates, request)
+            except ValueError as ex:
+                return Response({'message': ex.args[0]}, status=status.HTTP_400_BAD_REQUEST)
+
+        serialized_updates = compiled(UpdateSerializer).serialize(
+            updates, context={'request': request}, many=True)
+
+        if page_info is not None:
+            return Response({"updates": serialized_updates, **page_info}, status=status.HTTP_200_OK)
+        return Response(serialized_updates, status=status.HTTP_200_OK)
 
     def create(self, request):
         """ create a single update """
@@ -79,53 +110,141 @@ class UpdateViewSet(ViewSet):
 
         update.hurt = Hurt.objects.get(pk=request.data["hurt_id"])
 
-        if not update.hurt.patient.user == request.auth.user:
+        if not update.hurt.patient_id == requesting_patient(request).id:
             return Response({'message': 'only owners of a Hurt can add an Update to it'}, status=status.HTTP_400_BAD_REQUEST)
 
         update.notes = request.data["notes"]
         update.pain_level = request.data["pain_level"]
         update.added_on = timezone.now()
 
+        # save the update and roll it into its hurt's summary together
         try:
-            update.save()
+            with transaction.atomic():
+                update.save()
+                update.hurt.refresh_summary()
+                record_activity(update)
+                touch_patients(related_patients(hurts=[update.hurt]))
         except ValidationError as ex:
             return Response({'message': ex.message}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
         serializer = UpdateSerializer(update, context={'request': request})
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """ Create many updates in one transaction, e.g. a day of check-ins logged offline
+
+        POST /updates/bulk
+        {"updates": [{"hurt_id": 1, "pain_level": 4, "notes": "stiff", "added_on": "2021-01-05T08:00:00Z",
+                      "idempotency_key": "8c1e..."}, ...]}
+
+        added_on defaults to now, and can't be before the hurt's first update. Every hurt is
+        looked up with one query and must belong to the requesting patient. Either every item
+        is created or, if any is invalid, none is;
+        the response has a result per item, in order, with its status and id. An item whose
+        idempotency_key was imported before isn't created again; its result has the
+        existing id, so a client can safely replay a request it got no response for; a key
+        already used for another hurt fails its item with a 422.
+        """
+        patient = requesting_patient(request)
+        try:
+            items = bulk_items(request.data, 'updates')
+        except ValueError as ex:
+            return Response({'message': ex.args[0]}, status=status.HTTP_400_BAD_REQUEST)
+
+        hurts = Hurt.objects.select_related('first_update').in_bulk(
+            {item['hurt_id'] for item in items if isinstance(item.get('hurt_id', None), int)})
+        # keys are unique per hurt, but looked up across the patient's hurts so one reused for another hurt is rejected
+        imported = {(key, hurt_id): pk for key, hurt_id, pk in Update.objects
+                    .filter(hurt__patient=patient, idempotency_key__in=idempotency_keys(items))
+                    .values_list('idempotency_key', 'hurt_id', 'id')}
+
+        def build(item):
+            hurt = hurts.get(item_value(item, 'hurt_id', int), None)
+            if hurt is None:
+                raise BulkItemError('hurt does not exist', status.HTTP_422_UNPROCESSABLE_ENTITY)
+            if hurt.patient_id != patient.id:
+                raise BulkItemError('only owners of a Hurt can add an Update to it')
+            added_on = item_added_on(item)
+            # the earliest update is the hurt's first, whose notes and pain level describe the hurt
+            started_on = hurt.first_update.added_on if hurt.first_update is not None else hurt.added_on
+            if added_on < started_on:
+                raise BulkItemError("added_on can not be before the hurt's first update",
+                                    status.HTTP_422_UNPROCESSABLE_ENTITY)
+            return Update(hurt=hurt, pain_level=item_value(item, 'pain_level', int),
+                          notes=item_notes(item, Update._meta.get_field('notes').max_length),
+                          added_on=added_on)
+
+        def hurt_of(item):
+            hurt_id = item.get('hurt_id', None)
+            return hurt_id if isinstance(hurt_id, int) else None
+
+        updates, results = plan_bulk_create(items, imported, build, hurt_of)
+        if any(result['status'] >= status.HTTP_400_BAD_REQUEST for result in results):
+            return Response({'message': 'no updates were created', 'results': results},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        # the updates and their activity are inserted in bulk, and each hurt's summary
+        # is refreshed once however many of its updates were imported
+        if updates:
+            updated_hurts = list({update.hurt_id: update.hurt for update in updates.values()}.values())
+            try:
+                with transaction.atomic():
+                    insert_keyed(Update, updates, 'hurt')
+                    Activity.objects.bulk_create([activity_for(update) for update in updates.values()])
+                    for hurt in updated_hurts:
+                        hurt.refresh_summary()
+                    touch_patients(related_patients(hurts=updated_hurts))
+            except IntegrityError:
+                return Response({'message': 'these updates are being imported by another request; retry to get their results'},
+                                status=status.HTTP_409_CONFLICT)
+
+        return Response({'results': bulk_results(updates, results)},
+                        status=status.HTTP_201_CREATED if updates else status.HTTP_200_OK)
+
     def update(self, request, pk=None):
 
-        req_patient = Patient.objects.get(user=request.auth.user)
+        req_patient = requesting_patient(request)
 
         try:
             update = Update.objects.get(pk=pk)
         except Update.DoesNotExist:
             return Response({'message': 'Update does not exist'}, status=status.HTTP_404_NOT_FOUND)
 
-        if not req_patient.id == update.hurt.patient.id:
+        if not req_patient.id == update.hurt.patient_id:
             return Response({'message': 'not authorized'}, status=status.HTTP_401_UNAUTHORIZED)
 
+        previous_hurt = update.hurt
         update.hurt = Hurt.objects.get(pk=request.data["hurt_id"])
         update.notes = request.data["notes"]
         update.pain_level = request.data["pain_level"]
 
-        update.save()
+        # an update can be moved to another hurt, so both hurts' summaries are refreshed
+        with transaction.atomic():
+            update.save()
+            update.hurt.refresh_summary()
+            if previous_hurt.id != update.hurt.id:
+                previous_hurt.refresh_summary()
+                Activity.objects.filter(update=update).update(patient_id=update.hurt.patient_id)
+            touch_patients(related_patients(hurts=[previous_hurt, update.hurt]))
 
         return Response({}, status=status.HTTP_204_NO_CONTENT)
 
     def destroy(self, request, pk=None):
 
-        req_patient = Patient.objects.get(user=request.auth.user)
+        req_patient = requesting_patient(request)
 
         try:
             update = Update.objects.get(pk=pk)
         except Update.DoesNotExist:
             return Response({'message': 'Update does not exist'}, status=status.HTTP_404_NOT_FOUND)
 
-        if not req_patient.id == update.hurt.patient.id:
+        if not req_patient.id == update.hurt.patient_id:
             return Response({'message': 'not authorized'}, status=status.HTTP_401_UNAUTHORIZED)
 
-        update.delete()
+        with transaction.atomic():
+            update.delete()
+            update.hurt.refresh_summary()
+            touch_patients(related_patients(hurts=[update.hurt]))
 
         return Response({}, status=status.HTTP_204_NO_CONTENT)
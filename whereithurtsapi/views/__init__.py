@@ -6,4 +6,7 @@ from .Healing import HealingViewSet
 from .TreatmentType import TreatmentTypeViewSet
 from .Bodypart import BodypartViewSet
 from .Update import UpdateViewSet
-from .Profile import ProfileViewSet
\ No newline at end of file
+from .Profile import ProfileViewSet
+from .batch import BatchViewSet
+from .icons import icon_variant
+from .async_reads import hurt_detail, patient_detail, profile_snapshot
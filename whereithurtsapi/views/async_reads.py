@@ -0,0 +1,145 @@
+""" Async versions of the heaviest read endpoints, for serving under ASGI
+
+Each one answers like the viewset action it mirrors, but runs the reads that don't
+depend on each other at the same time in the bounded read pool (see helpers.read),
+instead of one after another. DRF views can't be async, so these are plain Django
+views that authenticate and render the way the viewsets do.
+"""
+import asyncio
+import functools
+from django.http import HttpResponse, HttpResponseNotAllowed, HttpResponseNotModified
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed, NotAuthenticated
+from rest_framework.renderers import JSONRenderer
+from whereithurtsapi.authentication import PatientTokenAuthentication
+from whereithurtsapi.helpers import data_version_etag, not_modified, read, rollup_day, with_etag
+from whereithurtsapi.views.Hurt import first_update_of, read_history, read_hurt
+from whereithurtsapi.views.Patient import read_activity, read_patient
+from whereithurtsapi.views.Profile import (read_recent_healings, read_recent_hurts, read_recent_treatments,
+                                           read_rollups, rollup_totals, snapshot_days, snapshot_window)
+
+
+def json_response(data, status_code=status.HTTP_200_OK, etag=None):
+    return with_etag(HttpResponse(JSONRenderer().render(data), content_type='application/json',
+                                  status=status_code), etag)
+
+
+async def authenticate(request):
+    """ Authenticate a request by its token as PatientTokenAuthentication does for the
+    viewsets; returns the 401 response if that fails, otherwise None """
+    try:
+        credentials = await read(PatientTokenAuthentication().authenticate, request)
+    except AuthenticationFailed as ex:
+        credentials, detail = None, ex.detail
+    else:
+        detail = NotAuthenticated.default_detail
+
+    if credentials is None:
+        response = json_response({'detail': detail}, status.HTTP_401_UNAUTHORIZED)
+        response['WWW-Authenticate'] = 'Token'
+        return response
+
+    request.user, request.auth = credentials
+    return None
+
+
+def async_read_view(view):
+    """ Only let GET requests from authenticated patients through to an async view """
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method != 'GET':
+            return HttpResponseNotAllowed(['GET'])
+        unauthenticated = await authenticate(request)
+        if unauthenticated is not None:
+            return unauthenticated
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+def not_modified_response(request, etag):
+    """ A 304 if the request's If-None-Match matches etag, otherwise None """
+    if not_modified(request, etag) is None:
+        return None
+    return with_etag(HttpResponseNotModified(), etag)
+
+
+@async_read_view
+async def hurt_detail(request, pk):
+    """ /async/hurts/<pk>, as /hurts/<pk>; the hurt and its history are read at the same time """
+    order = request.GET.get("order_history", None)
+    hurt_data, history = await asyncio.gather(
+        read(read_hurt, request, pk),
+        read(read_history, pk, first_update_of(pk), order))
+    if hurt_data is None:
+        return json_response({'message': 'hurt does not exist'}, status.HTTP_404_NOT_FOUND)
+
+    hurt_data["history"] = history
+    return json_response(hurt_data)
+
+
+@async_read_view
+async def patient_detail(request, pk):
+    """ /async/patients/<pk>, as /patients/<pk>; the patient and their activity are read at the same time """
+    etag = await read(data_version_etag, request, pk)
+    unchanged = not_modified_response(request, etag)
+    if unchanged is not None:
+        return unchanged
+
+    limit = request.GET.get('limit', 5)
+    cursor = request.GET.get('cursor', None)
+    patient_data, activity = await asyncio.gather(
+        read(read_patient, request, pk),
+        read(read_activity, pk, cursor, limit),
+        return_exceptions=True)
+    for result in (patient_data, activity):
+        if isinstance(result, BaseException) and not isinstance(result, ValueError):
+            raise result
+
+    if patient_data is None:
+        return json_response({'message': 'Patient matching query does not exist.'}, status.HTTP_404_NOT_FOUND)
+    if isinstance(activity, ValueError):
+        return json_response({'message': activity.args[0]}, status.HTTP_400_BAD_REQUEST)
+
+    recent_activity, next_cursor = activity
+    patient_data["recent_activity"] = recent_activity
+    if cursor is not None:
+        patient_data["next_cursor"] = next_cursor
+    return json_response(patient_data, etag=etag)
+
+
+@async_read_view
+async def profile_snapshot(request, pk):
+    """ /async/profiles/<pk>/snapshot, as /profiles/<pk>/snapshot; the healings in the
+    window are read while the rollups are, and the treatments and hurts the rollups
+    name are read at the same time """
+    # the ETag doubles as the check that the patient exists
+    etag = await read(data_version_etag, request, pk, rollup_day(timezone.now()))
+    if etag is None:
+        return json_response({'message': 'patient does not exist'}, status.HTTP_404_NOT_FOUND)
+
+    try:
+        days = snapshot_days(request.GET)
+    except ValueError as ex:
+        return json_response({'message': ex.args[0]}, status.HTTP_400_BAD_REQUEST)
+
+    unchanged = not_modified_response(request, etag)
+    if unchanged is not None:
+        return unchanged
+
+    first_day, window_start = snapshot_window(days)
+
+    async def rollup_reads():
+        rollups = await read(read_rollups, pk, first_day)
+        treatments, hurts = await asyncio.gather(
+            read(read_recent_treatments, request, rollups),
+            read(read_recent_hurts, request, rollups))
+        return rollups, treatments, hurts
+
+    (rollups, recent_treatments, recent_hurts), recent_healings = await asyncio.gather(
+        rollup_reads(),
+        read(read_recent_healings, request, pk, window_start))
+
+    snapshot = {"recent_healings": recent_healings, "recent_treatments": recent_treatments,
+                "recent_hurts": recent_hurts, **rollup_totals(rollups)}
+    return json_response(snapshot, etag=etag)
@@ -6,6 +6,8 @@ from django.contrib.auth.models import User
 from rest_framework.authtoken.models import Token
 from django.views.decorators.csrf import csrf_exempt
 from whereithurtsapi.models import Patient
+from whereithurtsapi.authentication import warm_token_cache
+from whereithurtsapi.helpers import pin_to_primary
 from rest_framework import status
 
 
@@ -30,8 +32,10 @@ def login_user(request):
         authenticated_user = authenticate(username=username, password=password)
 
         if authenticated_user is not None:
-            token = Token.objects.get(user=authenticated_user)
-            patient = Patient.objects.get(user=authenticated_user)
+            # load the token with its user and patient, and cache it for the client's next requests
+            token = Token.objects.select_related('user__patient').get(user=authenticated_user)
+            patient = token.user.patient
+            warm_token_cache(token)
             data = json.dumps(
                 {"valid": True, "token": token.key, "patient_id": patient.id})
             return HttpResponse(data, content_type='application/json')
@@ -76,6 +80,9 @@ def register_user(request):
 
         # Generate a new token for the new user using REST framework's token generator
         token = Token.objects.create(user=new_user)
+        warm_token_cache(token)
+        # the client's next requests are made with the new token, by a user replicas may not have yet
+        pin_to_primary(new_user.id)
 
         # Return the token to the client
         data = json.dumps(
@@ -0,0 +1,147 @@
+import json
+from io import BytesIO
+from urllib.parse import unquote, unquote_to_bytes, urlsplit
+from django.core.handlers.asgi import ASGIRequest
+from django.core.handlers.wsgi import WSGIRequest
+from django.urls import Resolver404, resolve
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.viewsets import ViewSet
+from whereithurtsapi.helpers import reads_from_replica, replica_action, share_request_cache
+
+# most sub-requests one /batch request may carry
+MAX_BATCH_REQUESTS = 20
+# response headers copied into each sub-response
+BATCH_RESPONSE_HEADERS = ('ETag', 'Cache-Control')
+# request headers a sub-request can't set, since it runs as the batch's requester
+BATCH_FORBIDDEN_HEADERS = ('HTTP_AUTHORIZATION', 'HTTP_COOKIE', 'HTTP_HOST')
+
+
+class BatchViewSet(ViewSet):
+
+    """ Runs several GET requests against the API's routes in one round trip, e.g.
+
+    POST /batch
+    {"requests": [{"path": "/patients/1"}, {"path": "/hurts?patient_id=1",
+                  "headers": {"If-None-Match": "\\"3-1f0c...\\""}}, {"path": "/bodyparts"}]}
+
+    and responds with one entry per sub-request, in the same order:
+
+    {"responses": [{"path": "/patients/1", "status": 200, "headers": {"ETag": ...}, "body": {...}}, ...]}
+
+    Sub-requests run in this process one after another, authenticated as the batch's
+    requester without looking the token up again (see BatchRequestAuthentication), and
+    share one request cache, so the requesting patient and data versions are resolved
+    once for the whole batch. Sub-requests skip middleware, so each one to a replica
+    action reads from a replica here, as ReadReplicaMiddleware would let it.
+    Only GET requests to the router's routes can be batched; a failed sub-request is
+    reported in its own entry without failing the others.
+    """
+
+    def create(self, request):
+        sub_requests = request.data.get('requests', None) if isinstance(request.data, dict) else None
+        if not isinstance(sub_requests, list) or not all(isinstance(item, dict) for item in sub_requests):
+            return Response({'message': 'requests must be a list of objects with a path'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(sub_requests) > MAX_BATCH_REQUESTS:
+            return Response({'message': f'a batch can have at most {MAX_BATCH_REQUESTS} requests'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({'responses': [self._run(request, item) for item in sub_requests]})
+
+    def _run(self, request, item):
+        path = item.get('path', None)
+        method = str(item.get('method', 'GET')).upper()
+        headers = item.get('headers', None) or {}
+        if not isinstance(path, str) or not path.startswith('/') or not isinstance(headers, dict):
+            return _sub_response(path, status.HTTP_400_BAD_REQUEST,
+                                 {'message': 'path must start with / and headers must be an object'})
+        if method != 'GET':
+            return _sub_response(path, status.HTTP_405_METHOD_NOT_ALLOWED,
+                                 {'message': 'only GET requests can be batched'})
+
+        sub_request = _sub_request(request, path, headers)
+        try:
+            match = resolve(sub_request.path_info)
+        except Resolver404:
+            match = None
+        actions = getattr(match.func, 'actions', None) if match is not None else None
+        # only the router's viewset routes, and not /batch itself
+        if not actions or match.func.cls is BatchViewSet:
+            return _sub_response(path, status.HTTP_404_NOT_FOUND, {'message': 'route can not be batched'})
+        if 'get' not in actions:
+            return _sub_response(path, status.HTTP_405_METHOD_NOT_ALLOWED,
+                                 {'message': 'route does not support GET'})
+
+        try:
+            if replica_action(sub_request.method, match.func):
+                with reads_from_replica(request.user.pk):
+                    response = match.func(sub_request, *match.args, **match.kwargs)
+            else:
+                response = match.func(sub_request, *match.args, **match.kwargs)
+        except Exception as ex:
+            return _sub_response(path, status.HTTP_500_INTERNAL_SERVER_ERROR, {'message': str(ex)})
+
+        return _sub_response(path, response.status_code, _body(response), {
+            header: response[header] for header in BATCH_RESPONSE_HEADERS if response.has_header(header)})
+
+
+def _sub_request(request, path, headers):
+    """ A GET HttpRequest for path, of the same class as request's and made like it was,
+    authenticated as its requester """
+    parts = urlsplit(path)
+    headers = {'HTTP_' + str(name).upper().replace('-', '_'): str(value) for name, value in headers.items()}
+    headers = {key: value for key, value in headers.items() if key not in BATCH_FORBIDDEN_HEADERS}
+    if isinstance(request._request, ASGIRequest):
+        sub_request = _asgi_sub_request(request._request, parts, headers)
+    else:
+        sub_request = _wsgi_sub_request(request, parts, headers)
+
+    sub_request.batch_requester = (request.user, request.auth)
+    share_request_cache(request, sub_request)
+    return sub_request
+
+
+def _wsgi_sub_request(request, parts, headers):
+    # without the batch's token, so it is authenticated by its batch_requester
+    environ = {key: value for key, value in request.META.items() if not key.startswith('HTTP_IF_')
+               and key not in ('CONTENT_TYPE', 'CONTENT_LENGTH', 'HTTP_AUTHORIZATION')}
+    environ.update(headers)
+    environ.update({
+        'REQUEST_METHOD': 'GET',
+        # WSGI passes the path as the latin-1 decoding of its bytes
+        'PATH_INFO': unquote_to_bytes(parts.path).decode('iso-8859-1'),
+        'QUERY_STRING': parts.query,
+        'CONTENT_LENGTH': '0',
+        'wsgi.input': BytesIO(),
+    })
+    return WSGIRequest(environ)
+
+
+def _asgi_sub_request(request, parts, headers):
+    # an ASGIRequest builds its META, scheme included, from its scope, so the scope is what's
+    # copied, without the batch's token so it is authenticated by its batch_requester
+    names = {key[len('HTTP_'):].lower().replace('_', '-').encode('latin1', 'replace'): value
+             for key, value in headers.items()}
+    scope_headers = [(name, value) for name, value in request.scope.get('headers', [])
+                     if not name.startswith(b'if-') and name not in names
+                     and name not in (b'content-type', b'content-length', b'authorization')]
+    scope_headers += [(name, value.encode('latin1', 'replace')) for name, value in names.items()]
+    scope = {**request.scope, 'method': 'GET', 'headers': scope_headers,
+             'path': request.script_name.rstrip('/') + unquote(parts.path),
+             'query_string': parts.query.encode('latin1', 'replace')}
+    return ASGIRequest(scope, BytesIO())
+
+
+def _body(response):
+    """ A sub-response's body as data to nest in the batch response """
+    if response.status_code == status.HTTP_304_NOT_MODIFIED:
+        return None
+    if isinstance(response, Response):
+        return response.data
+    content = b''.join(response.streaming_content) if response.streaming else response.content
+    return json.loads(content) if content else None
+
+
+def _sub_response(path, status_code, body, headers=None):
+    return {'path': path, 'status': status_code, 'headers': headers or {}, 'body': body}
@@ -0,0 +1,20 @@
+import os
+from django.conf import settings
+from django.utils.cache import patch_cache_control
+from django.views.static import serve
+from whereithurtsapi.helpers.icons import ICON_MAX_AGE, VARIANT_DIRECTORY
+
+
+def icon_variant(request, path):
+    """ Serve a built icon variant
+
+    A variant's name carries the hash of its content, so a changed icon gets a new
+    URL and clients and proxies can keep this one forever
+
+    Arguments:
+    request -- the full HTTP request object
+    path -- the variant's file name under MEDIA_ROOT/icons/variants """
+
+    response = serve(request, path, document_root=os.path.join(settings.MEDIA_ROOT, VARIANT_DIRECTORY))
+    patch_cache_control(response, public=True, max_age=ICON_MAX_AGE, immutable=True)
+    return response